@@ -23,6 +23,8 @@ import numpy as np
 from deepface import DeepFace
 
 from risk_score import RiskScorer
+# Mapa de calor compartilhado com o nexshop_sdk (dependência em requirements.txt)
+from nexshop_sdk.data_collection.heatmap import ClickHeatmap, HeatmapGrid
 
 # Configuração básica de logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -74,6 +76,13 @@ class RealTimeMonitor:
             # Fallback para resolução padrão em caso de erro
             self.screen_width, self.screen_height = 1920, 1080
 
+        # Mapa de calor dos cliques: grade 10x10 da tela e regiões de 100 px (hotspots)
+        self.click_heatmap = ClickHeatmap({
+            "screen": HeatmapGrid(extent=(self.screen_width, self.screen_height), shape=(10, 10)),
+            "hotspots": HeatmapGrid(cell=(100, 100)),
+        })
+        self._heatmap_seen = 0  # eventos já somados ao mapa
+
         # Detecção de múltiplos monitores
         self.monitors = []
         try:
@@ -89,8 +98,8 @@ class RealTimeMonitor:
             # Fallback para monitor único em caso de erro
             self.monitors = [{"width": self.screen_width, "height": self.screen_height, "name": "unknown"}]
 
-        logger.info(f"Tela detectada: {self.screen_width}x{self.screen_height}")
-        logger.info(f"Monitores detectados: {len(self.monitors)}")
+        logger.info("Tela detectada: %sx%s", self.screen_width, self.screen_height)
+        logger.info("Monitores detectados: %s", len(self.monitors))
 
         # Inicialização segura do pygame para visualização
         try:
@@ -167,7 +176,7 @@ class RealTimeMonitor:
         )
         self.events.append(event_obj)
         self.click_count += 1
-        logger.info(f"Clique capturado: {button_name} em ({x}, {y}) - Total: {self.click_count}")
+        logger.info("Clique capturado: %s em (%s, %s) - Total: %s", button_name, x, y, self.click_count)
 
     def _on_mouse_scroll(self, x, y, dx, dy):
         """Callback para scroll do mouse"""
@@ -184,7 +193,7 @@ class RealTimeMonitor:
             metadata={"screen_size": {"width": self.screen_width, "height": self.screen_height}, "monitors": self.monitors}
         )
         self.events.append(event_obj)
-        logger.info(f"Scroll capturado: {'up' if dy > 0 else 'down'} em ({x}, {y})")
+        logger.info("Scroll capturado: %s em (%s, %s)", "up" if dy > 0 else "down", x, y)
 
     def _on_key_press(self, key):
         """Callback para pressionamento de tecla"""
@@ -205,7 +214,7 @@ class RealTimeMonitor:
         )
         self.events.append(event_obj)
         self.keypress_count += 1
-        logger.info(f"Tecla pressionada: {key_name} - Total: {self.keypress_count}")
+        logger.info("Tecla pressionada: %s - Total: %s", key_name, self.keypress_count)
 
     def _record_mouse_move(self, position):
         """Registra um evento de movimento do mouse"""
@@ -282,16 +291,12 @@ class RealTimeMonitor:
         for event_type, count in event_counts.items():
             events_per_minute[event_type] = (count / duration * 60) if duration > 0 else 0
             
-        # Identifica hotspots de cliques
-        click_positions = [event.position for event in self.events if event.event_type == EventType.MOUSE_CLICK and event.position]
-        hotspots = []
-        if click_positions:
-            region_clicks = defaultdict(int)
-            for pos in click_positions:
-                region_x = (pos["x"] // 100) * 100
-                region_y = (pos["y"] // 100) * 100
-                region_clicks[f"{region_x},{region_y}"] += 1
-            hotspots = sorted([{"region": region, "clicks": count} for region, count in region_clicks.items()], key=lambda x: x["clicks"], reverse=True)[:5]
+        # Identifica hotspots de cliques (regiões de 100 px)
+        heatmap = self._update_click_heatmap()
+        if heatmap.integral:
+            hotspots = [{"region": f"{cx * 100},{cy * 100}", "clicks": count} for cx, cy, count in heatmap.top("hotspots", 5)]
+        else:
+            hotspots = self._click_hotspots_by_position()
             
         return {
             "session_start": self.start_time.isoformat(), 
@@ -324,31 +329,38 @@ class RealTimeMonitor:
         else:
             return "Nenhuma"
 
-    def get_click_heatmap(self) -> Dict[str, Any]:
-        """Gera mapa de calor dos cliques em toda a tela"""
-        clicks = [
-            event for event in self.events
+    def _update_click_heatmap(self) -> ClickHeatmap:
+        """Soma ao mapa de calor só os cliques registrados desde a última chamada"""
+        end = len(self.events)
+        positions = [
+            event.position for event in self.events[self._heatmap_seen:end]
             if event.event_type == EventType.MOUSE_CLICK and event.position
         ]
+        if positions:
+            self.click_heatmap.add([pos["x"] for pos in positions], [pos["y"] for pos in positions])
+        self._heatmap_seen = end
+        return self.click_heatmap
+
+    def _click_hotspots_by_position(self) -> List[Dict[str, Any]]:
+        """Hotspots recontados a partir dos eventos: coordenadas não inteiras entram na chave da região como vieram"""
+        region_clicks = defaultdict(int)
+        for event in self.events:
+            if event.event_type == EventType.MOUSE_CLICK and event.position:
+                region_x = (event.position["x"] // 100) * 100
+                region_y = (event.position["y"] // 100) * 100
+                region_clicks[f"{region_x},{region_y}"] += 1
+        return sorted([{"region": region, "clicks": count} for region, count in region_clicks.items()], key=lambda x: x["clicks"], reverse=True)[:5]
 
-        if not clicks:
-            return {"heatmap": [], "total_clicks": 0}
-
-        # Criar grid 10x10 para heatmap baseado na tela inteira
-        grid = [[0 for _ in range(10)] for _ in range(10)]
-
-        for click in clicks:
-            x_percent = click.position["x"] / self.screen_width
-            y_percent = click.position["y"] / self.screen_height
-
-            grid_x = min(9, int(x_percent * 10))
-            grid_y = min(9, int(y_percent * 10))
+    def get_click_heatmap(self) -> Dict[str, Any]:
+        """Gera mapa de calor dos cliques em toda a tela (grade 10x10)"""
+        heatmap = self._update_click_heatmap()
 
-            grid[grid_y][grid_x] += 1
+        if not heatmap.total:
+            return {"heatmap": [], "total_clicks": 0}
 
         return {
-            "heatmap": grid,
-            "total_clicks": len(clicks),
+            "heatmap": heatmap.dense("screen").tolist(),
+            "total_clicks": heatmap.total,
             "screen_dimensions": {"width": self.screen_width, "height": self.screen_height}
         }
 
@@ -394,7 +406,7 @@ class RealTimeMonitor:
                     except Exception:
                         response_ip = {"ip_report": response_ip}
             except Exception as e:
-                logger.error(f"Erro ao gerar relatório IP: {e}")
+                logger.error("Erro ao gerar relatório IP: %s", e)
                 response_ip = {}
 
             # === definir filename com pasta registros ===
@@ -477,7 +489,7 @@ class RealTimeMonitor:
                         response_ip["security_analysis"]["recommendations"] = merged_recs
 
                 except Exception as e:
-                    logger.error(f"Erro durante cálculo de risco: {e}")
+                    logger.error("Erro durante cálculo de risco: %s", e)
 
             # === juntar tudo e escrever ===
             try:
@@ -487,12 +499,12 @@ class RealTimeMonitor:
                 exported = {"device": data_device, "data": data, "ip_report": response_ip}
                 with open(filepath, 'w', encoding='utf-8') as f:
                     json.dump(exported, f, indent=2, ensure_ascii=False)
-                logger.info(f"Dados exportados para {filepath}")
+                logger.info("Dados exportados para %s", filepath)
                 return filepath
 
             with open(filepath, 'w', encoding='utf-8') as f:
                 json.dump(data_device, f, indent=2, ensure_ascii=False)
-            logger.info(f"Dados exportados para {filepath}")
+            logger.info("Dados exportados para %s", filepath)
             return filepath
 
 
@@ -520,9 +532,9 @@ class FaceVerifier:
                     name = os.path.splitext(filename)[0].rsplit('_', 1)[0]
                     image_path = os.path.join(self.faces_directory, filename)
                     self._add_face_to_memory(name, image_path)
-            logger.info(f"Total de {len(self.known_faces)} faces conhecidas carregadas.")
+            logger.info("Total de %s faces conhecidas carregadas.", len(self.known_faces))
         except Exception as e:
-            logger.error(f"Erro ao carregar faces conhecidas: {e}")
+            logger.error("Erro ao carregar faces conhecidas: %s", e)
 
     def _add_face_to_memory(self, name, image_path):
         """Adiciona uma face à memória para reconhecimento futuro"""
@@ -535,13 +547,13 @@ class FaceVerifier:
             if embedding_objs:
                 embedding = embedding_objs[0]["embedding"]
                 self.known_faces[name] = {'embedding': embedding}
-                logger.info(f"Face de '{name}' adicionada com sucesso à memória.")
+                logger.info("Face de '%s' adicionada com sucesso à memória.", name)
                 return True
             else:
-                logger.warning(f"Nenhuma face detectada em {image_path} para {name}. Não adicionada.")
+                logger.warning("Nenhuma face detectada em %s para %s. Não adicionada.", image_path, name)
                 return False
         except Exception as e:
-            logger.error(f"Erro ao extrair embedding para {name} de {image_path}: {e}")
+            logger.error("Erro ao extrair embedding para %s de %s: %s", name, image_path, e)
             return False
 
     def register_face(self, name):
@@ -571,7 +583,7 @@ class FaceVerifier:
                 filename = f"{name}_{int(time.time())}.jpg"
                 filepath = os.path.join(self.faces_directory, filename)
                 cv2.imwrite(filepath, frame)
-                logger.info(f"Imagem salva em: {filepath}")
+                logger.info("Imagem salva em: %s", filepath)
                 self._add_face_to_memory(name, filepath)
                 break
             elif key == ord('q'):
@@ -604,7 +616,7 @@ class FaceVerifier:
             for result in results:
                 if result['name'] != 'Unknown':
                     verified_name = result['name']
-                    logger.info(f"Verificação bem-sucedida! Bem-vindo, {verified_name}!")
+                    logger.info("Verificação bem-sucedida! Bem-vindo, %s!", verified_name)
                     verified = True
                     break
 
@@ -658,7 +670,7 @@ class FaceVerifier:
                         if min_distance < self.recognition_threshold:
                             recognized_name = temp_recognized_name
                 except Exception as e:
-                    logger.error(f"Erro durante o reconhecimento: {e}")
+                    logger.error("Erro durante o reconhecimento: %s", e)
 
             color = (0, 255, 0) if recognized_name != "Unknown" else (0, 0, 255)
             cv2.rectangle(processed_frame, (x, y), (x + w, y + h), color, 2)
@@ -827,7 +839,7 @@ if __name__ == "__main__":
             "timestamp": datetime.now().isoformat()
         }
         filename = monitor.export_session_data(face_verification_result=face_verification_result)
-        logger.info(f"Dados de falha de verificação exportados para: {filename}")
+        logger.info("Dados de falha de verificação exportados para: %s", filename)
         exit(1)
     else:
         logger.info("Tentando verificar a face existente...")
@@ -844,11 +856,11 @@ if __name__ == "__main__":
             "timestamp": datetime.now().isoformat()
         }
         filename = monitor.export_session_data(face_verification_result=face_verification_result)
-        logger.info(f"Dados de falha de verificação exportados para: {filename}")
+        logger.info("Dados de falha de verificação exportados para: %s", filename)
         exit(1)
 
     # Se chegou aqui, face_verified == True - verificação bem-sucedida
-    logger.info(f"Verificação facial bem-sucedida para {verified_username}. Iniciando o monitoramento de comportamento.")
+    logger.info("Verificação facial bem-sucedida para %s. Iniciando o monitoramento de comportamento.", verified_username)
     monitor.start_monitoring()
 
     scorer = RiskScorer()
@@ -897,7 +909,7 @@ if __name__ == "__main__":
                     filename = monitor.export_session_data(calculate_risk=True, auth_override=auth, face_verification_result=face_verification_result)
                     print(f"\n💾 Dados exportados para: {filename}")
                 except Exception as e:
-                    logger.error(f"Erro ao exportar dados após detecção de risco: {e}")
+                    logger.error("Erro ao exportar dados após detecção de risco: %s", e)
                 monitor.stop_monitoring()
                 exit(1)
 
@@ -1,12 +1,48 @@
 # nexshop_sdk/api/fastapi_adapter.py
 
-from fastapi import FastAPI, APIRouter
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, APIRouter, Body, Request
+from fastapi.responses import JSONResponse
+
+from nexshop_sdk.data_collection.rate_limiter import RateLimiter, retry_after_header
+from nexshop_sdk.risk_engine.batching import MicroBatchScorer
 
 # Função para criar a aplicação FastAPI
-def create_fastapi_app():
-    app = FastAPI(title="Nexshop API - FastAPI Adapter")
+def create_fastapi_app(max_batch_size: int = 256, max_wait_ms: float = 2.0,
+                       rate_limiter: Optional[RateLimiter] = None):
+    # Chamadas concorrentes de /score são agrupadas em lotes vetorizados
+    scorer = MicroBatchScorer(max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await scorer.start()
+        try:
+            yield
+        finally:
+            await scorer.stop()
+
+    app = FastAPI(title="Nexshop API - FastAPI Adapter", lifespan=lifespan)
+    app.state.scorer = scorer
     router = APIRouter()
 
+    if rate_limiter is not None:
+        @app.middleware("http")
+        async def limit_requests(request: Request, call_next):
+            # Chave: IP da conexão. Cabeçalhos como x-session-id vêm do
+            # cliente e bastaria trocá-los a cada requisição para fugir do limite.
+            key = request.client.host if request.client else "unknown"
+            decision = rate_limiter.check(key)
+            if not decision.allowed:
+                return JSONResponse(
+                    {"detail": "Limite de requisições excedido"},
+                    status_code=429,
+                    headers={"Retry-After": retry_after_header(decision)},
+                )
+            return await call_next(request)
+
     @router.get("/healthcheck")
     async def healthcheck():
         """
@@ -14,6 +50,14 @@ def create_fastapi_app():
         """
         return {"status": "ok", "framework": "FastAPI"}
 
+    @router.post("/score")
+    async def score(payload: Dict[str, Any] = Body(...)):
+        """
+        Calcula o score de risco do payload (device, behavior, geo, biometrics).
+        """
+        result = await scorer.score(payload)
+        return asdict(result)
+
     # Incluímos o roteador
     app.include_router(router)
     return app
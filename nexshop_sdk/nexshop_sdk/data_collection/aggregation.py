@@ -0,0 +1,202 @@
+"""
+Agregação entre processos - métricas de endpoint de todos os workers
+
+Com gunicorn/uvicorn em vários workers cada processo tem seu próprio
+EndpointMonitor. Este módulo junta os monitores numa visão única:
+
+- SnapshotPublisher: thread em cada worker que envia EndpointMonitor.snapshot()
+  ao agregador a cada `interval_s` (o caminho da requisição não muda)
+- SnapshotAggregator: servidor em socket Unix que guarda a última foto de
+  cada worker e monta o monitor combinado
+- get_endpoint_performance_report(socket_path): relatório global lido do agregador
+
+Protocolo: uma linha JSON por conexão, respondida com uma linha JSON.
+    {"op": "publish", "worker": "...", "snapshot": {...}}  -> {"ok": true}
+    {"op": "report"}                                       -> relatório
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .session_behavior import EndpointMonitor, MergedEndpointMetrics, endpoint_performance_report
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+
+def _request(socket_path: str, message: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+        with sock.makefile("rb") as reader:
+            line = reader.readline(MAX_MESSAGE_BYTES)
+    if not line:
+        raise ConnectionError(f"Agregador em {socket_path} fechou a conexão sem responder")
+    return json.loads(line)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        aggregator: "SnapshotAggregator" = self.server.aggregator
+        try:
+            message = json.loads(self.rfile.readline(MAX_MESSAGE_BYTES))
+            op = message.get("op")
+            if op == "publish":
+                aggregator.ingest(str(message["worker"]), message["snapshot"])
+                reply: Dict[str, Any] = {"ok": True}
+            elif op == "report":
+                reply = aggregator.get_endpoint_performance_report()
+            else:
+                logger.warning("Operação desconhecida no agregador: %r", op)
+                reply = {"ok": False, "error": f"operação desconhecida: {op!r}"}
+        except Exception as e:
+            logger.warning("Erro ao processar mensagem no agregador: %s", e)
+            reply = {"ok": False, "error": str(e)}
+        try:
+            self.wfile.write(json.dumps(reply, separators=(",", ":")).encode() + b"\n")
+        except OSError as e:
+            logger.warning("Falha ao responder cliente do agregador: %s", e)
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class SnapshotAggregator:
+    """
+    Guarda a última foto de cada worker (as fotos são cumulativas, então a
+    nova substitui a anterior) e soma todas na leitura. Workers sem foto há
+    mais de `stale_after_s` (reiniciados ou mortos) saem da soma.
+
+    Roda em um processo só por máquina: no master do gunicorn (hook
+    `on_starting`) ou num processo à parte.
+    """
+
+    def __init__(self, socket_path: str, stale_after_s: float = 30.0):
+        self.socket_path = socket_path
+        self.stale_after_s = stale_after_s
+        self._snapshots: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[_Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SnapshotAggregator":
+        """Escuta no socket numa thread daemon"""
+        self._remove_stale_socket()
+        self._server = _Server(self.socket_path, _Handler)
+        self._server.aggregator = self
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="snapshot-aggregator", daemon=True)
+        self._thread.start()
+        logger.info("Agregador de métricas escutando em %s", self.socket_path)
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+
+    def ingest(self, worker: str, snapshot: Dict[str, Any]):
+        with self._lock:
+            self._snapshots[worker] = (time.monotonic(), snapshot)
+
+    def live_snapshots(self) -> Dict[str, Dict[str, Any]]:
+        """Fotos dos workers ativos (descarta as vencidas)"""
+        cutoff = time.monotonic() - self.stale_after_s
+        with self._lock:
+            for worker in [w for w, (received, _) in self._snapshots.items() if received < cutoff]:
+                del self._snapshots[worker]
+            return {worker: snapshot for worker, (_, snapshot) in self._snapshots.items()}
+
+    def merged_metrics(self) -> MergedEndpointMetrics:
+        return MergedEndpointMetrics.from_snapshots(list(self.live_snapshots().values()))
+
+    def get_endpoint_performance_report(self) -> Dict[str, Any]:
+        """Relatório de performance somando todos os workers"""
+        snapshots = self.live_snapshots()
+        report = endpoint_performance_report(MergedEndpointMetrics.from_snapshots(list(snapshots.values())))
+        report["workers"] = sorted(snapshots)
+        return report
+
+    def _remove_stale_socket(self):
+        # Arquivo de socket deixado por um agregador que morreu
+        if not os.path.exists(self.socket_path):
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(self.socket_path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.socket_path)
+                return
+        raise RuntimeError(f"Já existe um agregador escutando em {self.socket_path}")
+
+
+class SnapshotPublisher:
+    """
+    Envia a foto do monitor deste worker ao agregador a cada `interval_s`,
+    numa thread daemon. Criar depois do fork (ex.: hook `post_fork` ou
+    startup da aplicação). Falhas de envio só são logadas.
+    """
+
+    def __init__(self, monitor: EndpointMonitor, socket_path: str, interval_s: float = 5.0,
+                 worker_id: Optional[str] = None, timeout: float = 2.0):
+        self.monitor = monitor
+        self.socket_path = socket_path
+        self.interval_s = interval_s
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.timeout = timeout
+        self.published = 0
+        self.failed = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SnapshotPublisher":
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="snapshot-publisher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, publish: bool = True):
+        """Para a thread; com `publish`, envia uma última foto"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.timeout + self.interval_s)
+            self._thread = None
+        if publish:
+            self.publish_now()
+
+    def publish_now(self) -> bool:
+        try:
+            _request(self.socket_path, {
+                "op": "publish",
+                "worker": self.worker_id,
+                "snapshot": self.monitor.snapshot()
+            }, self.timeout)
+        except Exception as e:
+            self.failed += 1
+            logger.warning("Falha ao publicar métricas em %s: %s", self.socket_path, e)
+            return False
+        self.published += 1
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            self.publish_now()
+
+
+def get_endpoint_performance_report(socket_path: str, timeout: float = 2.0) -> Dict[str, Any]:
+    """Relatório global (todos os workers) pedido ao agregador local"""
+    return _request(socket_path, {"op": "report"}, timeout)
@@ -0,0 +1,152 @@
+"""
+Expiry Wheel - Expiração de chaves ociosas (sessões) em segundo plano
+
+Funcionalidades:
+- Roda de tempo com slots esparsos, agendada pelo último uso de cada chave
+- touch(chave) em O(1); reagendamento preguiçoso, O(1) amortizado por uso
+- Callback de expiração chamado fora do lock (chave tocada no meio volta à roda)
+- Thread daemon que avança a roda sozinha (opcionalmente só a partir do
+  primeiro touch)
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiryWheel:
+    """
+    Expira chaves sem touch() há `ttl_s` segundos.
+
+    Cada chave fica em um único slot (largura `resolution_s`), o do seu prazo.
+    touch() só grava o último uso; quando o slot vence, a chave expira se
+    continuou ociosa, ou é reagendada para último uso + ttl. Uma chave é
+    reagendada no máximo uma vez por `ttl_s` de atividade, então o custo por
+    touch é O(1) amortizado. A expiração acontece até `resolution_s` depois
+    do prazo.
+
+    on_expire roda fora do lock, depois de a chave sair da roda. Um touch que
+    chegue nesse meio tempo reagenda a chave, então `chave in roda` dentro
+    do callback indica que ela voltou a ser usada e não deve ser descartada
+    (o dono serializa touch e descarte da mesma chave com o seu lock).
+    """
+
+    def __init__(
+        self,
+        ttl_s: float,
+        on_expire: Callable[[Hashable], None],
+        resolution_s: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        autostart: bool = False,
+    ):
+        if ttl_s <= 0:
+            raise ValueError("ttl_s deve ser > 0")
+        self.ttl_s = ttl_s
+        self.resolution_s = resolution_s if resolution_s is not None else min(ttl_s / 100.0, 60.0)
+        self.on_expire = on_expire
+        self._clock = clock
+        self._last_seen: Dict[Hashable, float] = {}
+        self._tick_of: Dict[Hashable, int] = {}
+        self._slots: Dict[int, Set[Hashable]] = {}  # tick -> chaves com prazo nele
+        self._cursor = self._tick(clock())          # próximo tick a processar
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Com autostart a thread sobe no primeiro touch: quem nunca usa a roda
+        # não paga uma thread parada
+        self._autostart = autostart
+        self.expired = 0
+
+    def _tick(self, t: float) -> int:
+        return int(t // self.resolution_s)
+
+    def _schedule(self, key: Hashable, deadline: float):
+        # Tick seguinte ao do prazo: quando ele vence, o prazo já passou
+        tick = self._tick(deadline) + 1
+        self._tick_of[key] = tick
+        slot = self._slots.get(tick)
+        if slot is None:
+            slot = self._slots[tick] = set()
+        slot.add(key)
+
+    def touch(self, key: Hashable):
+        """Registra uso da chave (agenda se for nova)"""
+        now = self._clock()
+        with self._lock:
+            if key not in self._last_seen:
+                self._schedule(key, now + self.ttl_s)
+                if self._autostart and self._thread is None:
+                    self._start_thread(self.resolution_s)
+            self._last_seen[key] = now
+
+    def discard(self, key: Hashable):
+        """Tira a chave da roda sem chamar on_expire"""
+        with self._lock:
+            if self._last_seen.pop(key, None) is not None:
+                slot = self._slots.get(self._tick_of.pop(key))
+                if slot is not None:
+                    slot.discard(key)
+
+    def advance(self) -> int:
+        """Processa os slots vencidos; retorna quantas chaves expiraram"""
+        now = self._clock()
+        expired: List[Hashable] = []
+        with self._lock:
+            now_tick = self._tick(now)
+            if now_tick - self._cursor <= len(self._slots):
+                ticks = range(self._cursor, now_tick + 1)
+            else:  # roda parada por muito tempo: só os slots existentes
+                ticks = sorted(t for t in self._slots if t <= now_tick)
+            for tick in ticks:
+                for key in self._slots.pop(tick, ()):
+                    deadline = self._last_seen[key] + self.ttl_s
+                    if deadline <= now:
+                        del self._last_seen[key]
+                        del self._tick_of[key]
+                        expired.append(key)
+                    else:
+                        self._schedule(key, deadline)
+            self._cursor = max(self._cursor, now_tick + 1)
+            self.expired += len(expired)
+        for key in expired:
+            try:
+                self.on_expire(key)
+            except Exception as e:
+                logger.error("Erro ao expirar %r: %s", key, e)
+        return len(expired)
+
+    def start(self, interval_s: Optional[float] = None) -> "ExpiryWheel":
+        """Avança a roda a cada `interval_s` (padrão: resolution_s) numa thread daemon"""
+        with self._lock:
+            if self._thread is None:
+                self._start_thread(interval_s if interval_s is not None else self.resolution_s)
+        return self
+
+    def _start_thread(self, interval: float):
+        # Chamado com o lock
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,),
+                                        name="expiry-wheel", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Para a thread (e o autostart: a roda só volta a andar com start())"""
+        with self._lock:
+            self._autostart = False
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            self.advance()
+
+    def __len__(self) -> int:
+        return len(self._last_seen)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._last_seen
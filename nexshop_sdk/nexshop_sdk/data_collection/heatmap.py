@@ -0,0 +1,125 @@
+"""
+Heatmap - Mapa de calor de cliques, incremental e em várias resoluções
+
+Funcionalidades:
+- Grades abertas (células de N px) e fechadas (área dividida em colunas x linhas)
+- Atualização em lote: cada lote é binado com numpy e somado às contagens
+- Top-k células (empates pela ordem do primeiro clique)
+- Grade densa via bincount para as grades fechadas
+
+Usado também pelo eyeoftoga (storage_adapter), que importa daqui.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+_KEY_OFFSET = 1 << 31
+
+
+@dataclass(frozen=True)
+class HeatmapGrid:
+    """
+    Resolução de um mapa de calor.
+
+    Aberta (padrão): células de `cell` px, índice = floor(coordenada / lado).
+    Fechada (`extent` definido): a área `extent` (largura, altura) dividida em
+    `shape` (colunas, linhas), índice = floor(coordenada / extensão * células),
+    preso às bordas (cliques fora da área contam na borda mais próxima).
+    """
+    cell: Tuple[float, float] = (50, 50)
+    extent: Optional[Tuple[float, float]] = None
+    shape: Tuple[int, int] = (10, 10)
+
+    def cells(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self.extent is None:
+            cx = np.floor_divide(x, self.cell[0])
+            cy = np.floor_divide(y, self.cell[1])
+        else:
+            cols, rows = self.shape
+            cx = np.clip(np.floor(x / self.extent[0] * cols), 0, cols - 1)
+            cy = np.clip(np.floor(y / self.extent[1] * rows), 0, rows - 1)
+        return cx.astype(np.int64), cy.astype(np.int64)
+
+
+class _Cells:
+    """Contagens esparsas de uma grade, ordenadas pela chave da célula"""
+    __slots__ = ("keys", "cx", "cy", "counts", "first")
+
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.int64)
+        self.cx = np.empty(0, dtype=np.int64)
+        self.cy = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.first = np.empty(0, dtype=np.int64)  # ordem do primeiro clique na célula
+
+    def add(self, cx: np.ndarray, cy: np.ndarray, offset: int):
+        keys, first, counts = np.unique((cx << 32) + (cy + _KEY_OFFSET), return_index=True, return_counts=True)
+        at = np.searchsorted(self.keys, keys)
+        found = at < len(self.keys)
+        found[found] = self.keys[at[found]] == keys[found]
+        self.counts[at[found]] += counts[found]
+        new = ~found
+        if new.any():
+            at, first = at[new], first[new]
+            self.keys = np.insert(self.keys, at, keys[new])
+            self.cx = np.insert(self.cx, at, cx[first])
+            self.cy = np.insert(self.cy, at, cy[first])
+            self.counts = np.insert(self.counts, at, counts[new])
+            self.first = np.insert(self.first, at, first + offset)
+
+
+class ClickHeatmap:
+    """
+    Contagem de cliques por célula em uma ou mais grades nomeadas, mantida
+    de forma incremental: add() recebe um lote de coordenadas, bina o lote
+    uma vez por grade e soma às contagens, sem revisitar cliques antigos.
+    """
+
+    def __init__(self, grids: Optional[Dict[str, HeatmapGrid]] = None):
+        self.grids = dict(grids) if grids else {"default": HeatmapGrid()}
+        self._cells = {name: _Cells() for name in self.grids}
+        self.total = 0
+        self.integral = True  # só coordenadas inteiras até agora
+
+    def add(self, x, y):
+        """Acrescenta um lote de cliques (sequências ou escalares, na ordem em que ocorreram)"""
+        x = np.atleast_1d(np.asarray(x))
+        y = np.atleast_1d(np.asarray(y))
+        if not x.size:
+            return
+        if x.dtype.kind not in "iu" or y.dtype.kind not in "iu":
+            self.integral = False
+        for name, grid in self.grids.items():
+            cx, cy = grid.cells(x, y)
+            self._cells[name].add(cx, cy, self.total)
+        self.total += int(x.size)
+
+    def cells(self, grid: str = "default") -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """(coluna, linha, contagem, ordem do primeiro clique) de cada célula com clique"""
+        cells = self._cells[grid]
+        return cells.cx, cells.cy, cells.counts, cells.first
+
+    def top(self, grid: str = "default", k: int = 10) -> List[Tuple[int, int, int]]:
+        """As k células com mais cliques como (coluna, linha, contagem); empates pelo primeiro clique"""
+        cells = self._cells[grid]
+        candidates = np.arange(len(cells.counts))
+        if k < len(candidates):
+            # Só células com contagem >= k-ésima maior podem entrar
+            threshold = np.partition(cells.counts, len(candidates) - k)[len(candidates) - k]
+            candidates = np.flatnonzero(cells.counts >= threshold)
+        order = candidates[np.lexsort((cells.first[candidates], -cells.counts[candidates]))][:k]
+        return list(zip(cells.cx[order].tolist(), cells.cy[order].tolist(), cells.counts[order].tolist()))
+
+    def dense(self, grid: str) -> np.ndarray:
+        """Matriz linhas x colunas de contagens de uma grade fechada"""
+        cols, rows = self.grids[grid].shape
+        if self.grids[grid].extent is None:
+            raise ValueError(f"Grade {grid!r} é aberta; use cells() ou top()")
+        cells = self._cells[grid]
+        flat = np.bincount(cells.cy * cols + cells.cx, weights=cells.counts, minlength=rows * cols)
+        return flat.astype(np.int64).reshape(rows, cols)
+
+    def __len__(self) -> int:
+        return self.total
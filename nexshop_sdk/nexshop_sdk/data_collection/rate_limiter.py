@@ -0,0 +1,193 @@
+"""
+Rate Limiter - Limitação de requisições por chave (sessão, IP, usuário)
+
+Funcionalidades:
+- Token bucket (taxa média com rajadas até `burst`)
+- Sliding window counter (duas janelas fixas ponderadas)
+- Espaço fixo por chave e expulsão de chaves ociosas
+- API allow(chave) para uso direto em middlewares
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class RateLimitAlgorithm(Enum):
+    """Algoritmos de limitação suportados"""
+    TOKEN_BUCKET = "token_bucket"
+    SLIDING_WINDOW = "sliding_window"
+
+
+@dataclass(frozen=True)
+class RateLimitDecision:
+    """Resultado de uma checagem de limite"""
+    allowed: bool
+    remaining: int
+    retry_after_s: float  # 0.0 quando permitido
+
+
+class _Bucket:
+    __slots__ = ("last_seen", "tokens")
+
+    def __init__(self, now: float, tokens: float):
+        self.last_seen = now
+        self.tokens = tokens
+
+
+class _Window:
+    __slots__ = ("last_seen", "index", "current", "previous")
+
+    def __init__(self, now: float, index: int):
+        self.last_seen = now
+        self.index = index
+        self.current = 0
+        self.previous = 0
+
+
+class RateLimiter:
+    """
+    Limita eventos por chave a `limit` a cada `window_seconds`.
+
+    TOKEN_BUCKET: o balde enche a limit/window_seconds fichas por segundo até
+    `burst` (padrão: `limit`); cada evento consome `cost` fichas.
+    SLIDING_WINDOW: estima a contagem na janela deslizante como
+    anterior * (fração restante) + atual, com duas janelas fixas.
+
+    O estado por chave tem tamanho fixo. As chaves ficam em ordem de último
+    uso, então as ociosas (sem uso há `idle_ttl_seconds`) e o excesso acima de
+    `max_keys` saem pela frente em O(1) amortizado a cada chamada.
+    """
+
+    def __init__(
+        self,
+        algorithm: RateLimitAlgorithm = RateLimitAlgorithm.SLIDING_WINDOW,
+        limit: int = 60,
+        window_seconds: float = 60.0,
+        burst: Optional[int] = None,
+        idle_ttl_seconds: float = 600.0,
+        max_keys: int = 100_000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if limit < 1 or window_seconds <= 0:
+            raise ValueError("limit deve ser >= 1 e window_seconds > 0")
+        self.algorithm = algorithm
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.burst = burst if burst is not None else limit
+        self.idle_ttl_seconds = max(idle_ttl_seconds, window_seconds)
+        self.max_keys = max_keys
+        self._clock = clock
+        self._rate = limit / window_seconds  # fichas por segundo
+        self._keys: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    def allow(self, key: Hashable, cost: int = 1) -> bool:
+        """True se o evento cabe no limite da chave (e o contabiliza)"""
+        return self.check(key, cost).allowed
+
+    def check(self, key: Hashable, cost: int = 1) -> RateLimitDecision:
+        now = self._clock()
+        with self._lock:
+            state = self._keys.get(key)
+            if state is None:
+                state = self._new_state(now)
+                self._keys[key] = state
+            else:
+                self._keys.move_to_end(key)
+            if self.algorithm == RateLimitAlgorithm.TOKEN_BUCKET:
+                decision = self._take_tokens(state, now, cost)
+            else:
+                decision = self._count_window(state, now, cost)
+            state.last_seen = now
+            if decision.allowed:
+                self.allowed += 1
+            else:
+                self.rejected += 1
+            self._evict(now)
+        return decision
+
+    def reset(self, key: Hashable) -> None:
+        with self._lock:
+            self._keys.pop(key, None)
+
+    def evict_idle(self) -> int:
+        """Remove chaves ociosas; retorna quantas saíram"""
+        with self._lock:
+            before = self.evicted
+            self._evict(self._clock())
+            return self.evicted - before
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "algorithm": self.algorithm.value,
+            "keys": len(self._keys),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+        }
+
+    # ---------------- interno ----------------
+
+    def _new_state(self, now: float):
+        if self.algorithm == RateLimitAlgorithm.TOKEN_BUCKET:
+            return _Bucket(now, float(self.burst))
+        return _Window(now, int(now // self.window_seconds))
+
+    def _take_tokens(self, bucket: _Bucket, now: float, cost: int) -> RateLimitDecision:
+        tokens = min(float(self.burst), bucket.tokens + (now - bucket.last_seen) * self._rate)
+        if tokens >= cost:
+            bucket.tokens = tokens - cost
+            return RateLimitDecision(True, int(bucket.tokens), 0.0)
+        bucket.tokens = tokens
+        return RateLimitDecision(False, int(tokens), (cost - tokens) / self._rate)
+
+    def _count_window(self, window: _Window, now: float, cost: int) -> RateLimitDecision:
+        index = int(now // self.window_seconds)
+        if index != window.index:
+            window.previous = window.current if index == window.index + 1 else 0
+            window.current = 0
+            window.index = index
+        elapsed = (now - index * self.window_seconds) / self.window_seconds
+        estimate = window.previous * (1.0 - elapsed) + window.current
+        if estimate + cost <= self.limit:
+            window.current += cost
+            return RateLimitDecision(True, int(self.limit - estimate - cost), 0.0)
+        return RateLimitDecision(False, 0, self._window_retry_after(window, elapsed, cost))
+
+    def _window_retry_after(self, window: _Window, elapsed: float, cost: int) -> float:
+        # Ainda nesta janela: espera o peso da anterior cair o suficiente
+        room = self.limit - window.current - cost
+        if room >= 0 and window.previous > 0:
+            return max(0.0, (1.0 - room / window.previous) - elapsed) * self.window_seconds
+        # Senão, na próxima janela a atual vira a anterior
+        wait = (1.0 - elapsed) * self.window_seconds
+        if window.current > 0 and cost <= self.limit:
+            wait += max(0.0, 1.0 - (self.limit - cost) / window.current) * self.window_seconds
+        return wait
+
+    def _evict(self, now: float) -> None:
+        keys = self._keys
+        cutoff = now - self.idle_ttl_seconds
+        while keys:
+            state = next(iter(keys.values()))
+            if state.last_seen >= cutoff and len(keys) <= self.max_keys:
+                break
+            keys.popitem(last=False)
+            self.evicted += 1
+
+
+def retry_after_header(decision: RateLimitDecision) -> str:
+    """Valor do header Retry-After (segundos inteiros, arredondados para cima)"""
+    return str(max(1, math.ceil(decision.retry_after_s)))
@@ -10,13 +10,14 @@ Funcionalidades:
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional, Any, Callable
-from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any, Callable, Union
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 import json
 import time
 import threading
-from collections import defaultdict, deque
+from collections import OrderedDict, defaultdict, deque
+from bisect import bisect_right
 import statistics
 import logging
 from dataclasses import dataclass, field
@@ -24,6 +25,13 @@ import uuid
 import asyncio
 from functools import wraps
 
+import numpy as np
+
+from ..telemetry.metrics import LatencySketch, SlidingWindowCounter
+from .expiry import ExpiryWheel
+from .heatmap import ClickHeatmap, HeatmapGrid
+from .rate_limiter import RateLimitAlgorithm, RateLimiter
+
 # Configuração de logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -71,7 +79,7 @@ class EndpointMetrics:
     total_requests: int = 0
     successful_requests: int = 0
     failed_requests: int = 0
-    response_times: List[float] = field(default_factory=list)
+    latency: LatencySketch = field(default_factory=LatencySketch)  # tempos de resposta (ms)
     status_codes: Dict[int, int] = field(default_factory=dict)
     last_accessed: Optional[datetime] = None
     first_accessed: Optional[datetime] = None
@@ -91,19 +99,16 @@ class EndpointMetrics:
     @property
     def avg_response_time(self) -> float:
         """Tempo médio de resposta em milissegundos"""
-        if not self.response_times:
-            return 0.0
-        return statistics.mean(self.response_times)
+        return self.latency.mean
     
     @property
     def median_response_time(self) -> float:
-        """Tempo mediano de resposta"""
-        if not self.response_times:
-            return 0.0
-        return statistics.median(self.response_times)
+        """Tempo mediano de resposta (aproximado, erro relativo <= 1%)"""
+        return self.latency.quantile(0.5)
     
     def to_dict(self) -> Dict[str, Any]:
         """Converte para dicionário"""
+        percentiles = self.latency.summary()
         return {
             "endpoint": self.endpoint,
             "method": self.method.value,
@@ -113,11 +118,54 @@ class EndpointMetrics:
             "success_rate": round(self.success_rate, 2),
             "failure_rate": round(self.failure_rate, 2),
             "avg_response_time_ms": round(self.avg_response_time, 2),
-            "median_response_time_ms": round(self.median_response_time, 2),
+            "median_response_time_ms": round(percentiles.pop("p50"), 2),
+            **{f"{name}_response_time_ms": round(value, 2) for name, value in percentiles.items()},
             "status_codes": self.status_codes,
             "last_accessed": self.last_accessed.isoformat() if self.last_accessed else None,
             "first_accessed": self.first_accessed.isoformat() if self.first_accessed else None
         }
+    
+    def merge(self, other: "EndpointMetrics"):
+        """Soma as métricas de `other` (mesmo endpoint, outro processo ou período)"""
+        self.total_requests += other.total_requests
+        self.successful_requests += other.successful_requests
+        self.failed_requests += other.failed_requests
+        self.latency.merge(other.latency)
+        for code, n in other.status_codes.items():
+            self.status_codes[code] = self.status_codes.get(code, 0) + n
+        if other.first_accessed is not None and (self.first_accessed is None or other.first_accessed < self.first_accessed):
+            self.first_accessed = other.first_accessed
+        if other.last_accessed is not None and (self.last_accessed is None or other.last_accessed > self.last_accessed):
+            self.last_accessed = other.last_accessed
+    
+    def to_snapshot(self) -> Dict[str, Any]:
+        """Estado completo serializável em JSON (ver from_snapshot)"""
+        return {
+            "endpoint": self.endpoint,
+            "method": self.method.value,
+            "total_requests": self.total_requests,
+            "successful_requests": self.successful_requests,
+            "failed_requests": self.failed_requests,
+            "latency": self.latency.to_snapshot(),
+            "status_codes": [list(self.status_codes), list(self.status_codes.values())],
+            "last_accessed": self.last_accessed.isoformat() if self.last_accessed else None,
+            "first_accessed": self.first_accessed.isoformat() if self.first_accessed else None
+        }
+    
+    @classmethod
+    def from_snapshot(cls, snapshot: Dict[str, Any]) -> "EndpointMetrics":
+        last, first = snapshot["last_accessed"], snapshot["first_accessed"]
+        return cls(
+            endpoint=snapshot["endpoint"],
+            method=HTTPMethod(snapshot["method"]),
+            total_requests=snapshot["total_requests"],
+            successful_requests=snapshot["successful_requests"],
+            failed_requests=snapshot["failed_requests"],
+            latency=LatencySketch.from_snapshot(snapshot["latency"]),
+            status_codes=dict(zip(*snapshot["status_codes"])),
+            last_accessed=datetime.fromisoformat(last) if last else None,
+            first_accessed=datetime.fromisoformat(first) if first else None
+        )
 
 
 @dataclass
@@ -203,48 +251,472 @@ class RequestEvent:
         }
 
 
+# --------------------------
+# Armazenamento colunar de eventos
+# --------------------------
+_EVENT_TYPES: List[EventType] = list(EventType)
+_EVENT_TYPE_CODES: Dict[EventType, int] = {t: i for i, t in enumerate(_EVENT_TYPES)}
+_EPOCH = datetime(1970, 1, 1)
+_NO_COORD = int(np.iinfo(np.int32).min)  # coordenada ausente
+_NO_ID = -1                              # string ausente (None) / metadata vazio
+_INT32_MAX = int(np.iinfo(np.int32).max)
+_UINT64_MASK = (1 << 64) - 1
+
+EVENT_DTYPE = np.dtype([
+    ("seq", np.int64),            # ordem de chegada (chave dos extras)
+    ("ts", np.int64),             # ns desde a época
+    ("type", np.int8),            # índice em EventType
+    ("x", np.int32),
+    ("y", np.int32),
+    ("element_id", np.int32),     # ids internados
+    ("element_class", np.int32),
+    ("element_tag", np.int32),
+    ("page_url", np.int32),
+    ("value", np.int32),
+    ("metadata", np.int32),
+    ("id_hi", np.uint64),         # event_id (uuid) em dois inteiros de 64 bits
+    ("id_lo", np.uint64),
+])
+
+_STRING_FIELDS = ("element_id", "element_class", "element_tag", "page_url", "value")
+
+
+def _to_ns(ts: datetime) -> int:
+    """datetime -> ns desde a época (exato; datetimes com fuso vão para UTC)"""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = ts - _EPOCH
+    return ((delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds) * 1000
+
+
+def _from_ns(ns: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=ns // 1000)
+
+
+def _format_uuid(value: int) -> str:
+    h = "%032x" % value
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def _new_event_id():
+    """Novo uuid4 como (str, int)"""
+    uid = uuid.uuid4()
+    return str(uid), uid.int
+
+
+def _seconds(ns: int) -> float:
+    """Intervalo em ns -> segundos, igual a timedelta.total_seconds()"""
+    return (ns // 1000) / 1_000_000
+
+
+class _Interner:
+    """
+    Tabela de valores repetidos (urls, ids de elemento, metadados) -> id
+    inteiro. Cada SessionEventBuffer tem a sua, usada sob o lock do buffer,
+    e ela é liberada junto com a sessão.
+    """
+    
+    def __init__(self):
+        self._ids: Dict[Any, int] = {}
+        self.values: List[Any] = []
+    
+    def intern(self, value: Any) -> int:
+        # Valores que não são str entram com o tipo na chave (1 != True != 1.0)
+        key = value if type(value) is str else (type(value), value)
+        index = self._ids.get(key)
+        if index is None:
+            self.values.append(value)
+            index = self._ids[key] = len(self.values) - 1
+        return index
+
+
+class SessionEventBuffer:
+    """
+    Eventos de uma sessão em colunas tipadas (array estruturado EVENT_DTYPE),
+    sempre em ordem de timestamp e limitados a `max_events`; ao encher, o
+    evento mais antigo é descartado. Eventos em ordem entram no fim em O(1)
+    amortizado; eventos atrasados são inseridos na posição certa por busca
+    binária. Strings e metadados repetidos viram ids internados; o que não
+    cabe nas colunas fica num dict esparso de extras. UserEvent só é montado
+    quando alguém pede os eventos (recent, iteração, to_dict).
+    
+    Escritas e leituras passam por `lock` (reentrante); as colunas saem como
+    cópias. Uma análise de vários passos segura o lock para ver um estado só.
+    """
+    
+    def __init__(self, session_id: str = "", max_events: int = 10000):
+        self.session_id = session_id
+        self.max_events = max_events
+        self.lock = threading.RLock()
+        self._strings = _Interner()
+        self._metadata = _Interner()
+        self._rows = np.empty(min(max_events, 64), dtype=EVENT_DTYPE)
+        self._start = 0
+        self._size = 0
+        self._seq = 0
+        self._last_ts = 0
+        self._extras: Dict[int, Dict[str, Any]] = {}
+        self.dropped = 0
+        self.reordered = 0  # eventos atrasados inseridos antes de outros
+        self._heatmap: Optional[ClickHeatmap] = None
+        self._heatmap_mark = (0, 0, 0)  # (_seq, dropped, reordered) na última atualização
+        # Contadores por tipo desde o início da sessão (não caem com o descarte)
+        self.type_counts = [0] * len(_EVENT_TYPES)
+        self._type_first_ns: List[Optional[int]] = [None] * len(_EVENT_TYPES)
+        self._type_last_ns: List[Optional[int]] = [None] * len(_EVENT_TYPES)
+    
+    # ---------------- escrita ----------------
+    
+    def add(self, event: UserEvent) -> str:
+        """Insere um UserEvent já montado"""
+        return self.append(
+            event.event_type, event.timestamp,
+            element_id=event.element_id, element_class=event.element_class,
+            element_tag=event.element_tag, page_url=event.page_url,
+            coordinates=event.coordinates, value=event.value,
+            metadata=event.metadata, event_id=event.event_id,
+        )
+    
+    def append(self, event_type: EventType, timestamp: Optional[datetime] = None,
+               element_id: Optional[str] = None, element_class: Optional[str] = None,
+               element_tag: Optional[str] = None, page_url: str = "",
+               coordinates: Optional[Dict[str, int]] = None, value: Optional[str] = None,
+               metadata: Optional[Dict[str, Any]] = None, event_id: Optional[str] = None,
+               event_id_int: Optional[int] = None) -> str:
+        """Grava o evento direto nas colunas; retorna o event_id (`event_id_int`: o uuid já convertido)"""
+        extras: Dict[str, Any] = {}
+        if timestamp is None:
+            timestamp = datetime.now()
+        elif timestamp.tzinfo is not None:
+            extras["timestamp"] = timestamp
+        ts = _to_ns(timestamp)
+        
+        if event_id is None:
+            event_id, id_int = _new_event_id()
+        elif event_id_int is not None:
+            id_int = event_id_int
+        else:
+            id_int = self._uuid_int(event_id)
+            if id_int is None:
+                extras["event_id"] = event_id
+                id_int = 0
+        
+        x = y = _NO_COORD
+        if coordinates is not None:
+            packed = self._pack_coordinates(coordinates)
+            if packed is None:
+                extras["coordinates"] = coordinates
+            else:
+                x, y = packed
+        
+        code = _EVENT_TYPE_CODES[event_type]
+        fields = (element_id, element_class, element_tag, page_url, value)
+        with self.lock:
+            meta_id = _NO_ID
+            if metadata:
+                values = tuple(metadata.values())
+                try:
+                    meta_id = self._metadata.intern((tuple(metadata), values, tuple(map(type, values))))
+                except TypeError:  # valores não hasheáveis
+                    extras["metadata"] = metadata
+            
+            intern = self._strings.intern
+            try:
+                string_ids = [_NO_ID if text is None else intern(text) for text in fields]
+            except TypeError:
+                string_ids = [_NO_ID] * len(fields)
+                for i, text in enumerate(fields):
+                    try:
+                        string_ids[i] = _NO_ID if text is None else intern(text)
+                    except TypeError:
+                        extras[_STRING_FIELDS[i]] = text
+            
+            self.type_counts[code] += 1
+            first, last = self._type_first_ns[code], self._type_last_ns[code]
+            if first is None or ts < first:
+                self._type_first_ns[code] = ts
+            if last is None or ts > last:
+                self._type_last_ns[code] = ts
+            
+            seq = self._seq
+            self._seq += 1
+            row = (seq, ts, code, x, y, *string_ids, meta_id,
+                   id_int >> 64, id_int & _UINT64_MASK)
+            size = self._size
+            if size < self.max_events and (not size or ts >= self._last_ts) and self._start + size < len(self._rows):
+                # Caminho comum: evento em ordem e espaço livre no fim
+                self._rows[self._start + size] = row
+                self._size = size + 1
+                self._last_ts = ts
+            elif not self._insert(ts, row):
+                return event_id
+            if extras:
+                self._extras[seq] = extras
+        return event_id
+    
+    @staticmethod
+    def _uuid_int(event_id: Any) -> Optional[int]:
+        if type(event_id) is not str:
+            return None
+        try:
+            uid = uuid.UUID(event_id)
+        except ValueError:
+            return None
+        return uid.int if str(uid) == event_id else None
+    
+    @staticmethod
+    def _pack_coordinates(coordinates: Dict[str, Any]):
+        if type(coordinates) is dict and len(coordinates) == 2:
+            x, y = coordinates.get("x"), coordinates.get("y")
+            if type(x) is int and type(y) is int and _NO_COORD < x <= _INT32_MAX and _NO_COORD < y <= _INT32_MAX:
+                return x, y
+        if not coordinates or not coordinates.keys() <= {"x", "y"}:
+            return None
+        packed = []
+        for axis in ("x", "y"):
+            if axis not in coordinates:
+                packed.append(_NO_COORD)
+                continue
+            v = coordinates[axis]
+            if type(v) is not int or not (_NO_COORD < v <= _INT32_MAX):
+                return None
+            packed.append(v)
+        return packed
+    
+    def _insert(self, ts: int, row: tuple) -> bool:
+        index = self._size
+        if index and ts < self._last_ts:
+            index = int(np.searchsorted(self._rows["ts"][self._start:self._start + self._size], ts, side="right"))
+        if self._size == self.max_events:
+            if index == 0:
+                self.dropped += 1  # mais antigo que tudo o que cabe no buffer
+                return False
+            self._drop_oldest()
+            index -= 1
+        self._reserve()
+        at = self._start + index
+        end = self._start + self._size
+        if at < end:
+            self._rows[at + 1:end + 1] = self._rows[at:end]
+            self.reordered += 1
+        else:
+            self._last_ts = ts
+        self._rows[at] = row
+        self._size += 1
+        return True
+    
+    def _drop_oldest(self):
+        if self._extras:
+            self._extras.pop(int(self._rows["seq"][self._start]), None)
+        self._start += 1
+        self._size -= 1
+        self.dropped += 1
+    
+    def _reserve(self):
+        capacity = len(self._rows)
+        if self._start + self._size < capacity:
+            return
+        if self._size * 2 <= capacity:
+            rows = self._rows  # compacta no lugar
+        else:
+            rows = np.empty(min(capacity * 2, self.max_events * 2), dtype=EVENT_DTYPE)
+        rows[:self._size] = self._rows[self._start:self._start + self._size]
+        self._rows = rows
+        self._start = 0
+    
+    # ---------------- leitura colunar ----------------
+    
+    def click_heatmap(self) -> ClickHeatmap:
+        """
+        Mapa de calor (regiões de 50 px) dos cliques com x e y nas colunas.
+        Só os eventos novos desde a última chamada são binados; descarte ou
+        inserção fora de ordem nesse meio tempo refaz o mapa.
+        """
+        with self.lock:
+            mark = (self._seq, self.dropped, self.reordered)
+            if self._heatmap is not None and mark == self._heatmap_mark:
+                return self._heatmap
+            if self._heatmap is not None and mark[1:] == self._heatmap_mark[1:]:
+                rows = self._rows[self._start + self._size - (mark[0] - self._heatmap_mark[0]):self._start + self._size]
+            else:
+                self._heatmap = ClickHeatmap({"hotspots": HeatmapGrid(cell=(50, 50))})
+                rows = self._rows[self._start:self._start + self._size]
+            clicks = rows[(rows["type"] == _EVENT_TYPE_CODES[EventType.CLICK])
+                          & (rows["x"] != _NO_COORD) & (rows["y"] != _NO_COORD)]
+            self._heatmap.add(clicks["x"], clicks["y"])
+            self._heatmap_mark = mark
+            return self._heatmap
+    
+    def column(self, name: str) -> np.ndarray:
+        """Cópia de uma coluna de EVENT_DTYPE, em ordem de timestamp"""
+        with self.lock:
+            return self._rows[name][self._start:self._start + self._size].copy()
+    
+    @property
+    def timestamps_ns(self) -> np.ndarray:
+        return self.column("ts")
+    
+    @property
+    def type_codes(self) -> np.ndarray:
+        return self.column("type")
+    
+    def timestamp_at(self, index: int) -> datetime:
+        with self.lock:
+            extras = self._extras.get(int(self._rows["seq"][self._start + index])) if self._extras else None
+            if extras and "timestamp" in extras:
+                return extras["timestamp"]
+            return _from_ns(int(self._rows["ts"][self._start + index]))
+    
+    def coordinates_at(self, index: int) -> Optional[Dict[str, Any]]:
+        return self.event_at(index).coordinates
+    
+    def type_span(self, event_type: EventType):
+        """(quantidade, primeiro ns, último ns) do tipo desde o início da sessão"""
+        code = _EVENT_TYPE_CODES[event_type]
+        with self.lock:
+            return self.type_counts[code], self._type_first_ns[code], self._type_last_ns[code]
+    
+    @property
+    def has_extras(self) -> bool:
+        return bool(self._extras)
+    
+    # ---------------- materialização ----------------
+    
+    def event_at(self, index: int) -> UserEvent:
+        """Monta o UserEvent da posição `index` (0 = mais antigo)"""
+        with self.lock:
+            (seq, ts, code, x, y, element_id, element_class, element_tag,
+             page_url, value, meta_id, id_hi, id_lo) = self._rows[self._start + index].item()
+            metadata = self._metadata.values[meta_id] if meta_id != _NO_ID else None
+            extras = self._extras.get(seq) if self._extras else None
+        strings = self._strings.values  # só cresce: ids já gravados continuam válidos
+        coordinates = None
+        if x != _NO_COORD or y != _NO_COORD:
+            coordinates = {}
+            if x != _NO_COORD:
+                coordinates["x"] = x
+            if y != _NO_COORD:
+                coordinates["y"] = y
+        event = UserEvent(
+            event_id=_format_uuid((id_hi << 64) | id_lo),
+            session_id=self.session_id,
+            event_type=_EVENT_TYPES[code],
+            timestamp=_from_ns(ts),
+            element_id=strings[element_id] if element_id != _NO_ID else None,
+            element_class=strings[element_class] if element_class != _NO_ID else None,
+            element_tag=strings[element_tag] if element_tag != _NO_ID else None,
+            page_url=strings[page_url] if page_url != _NO_ID else None,
+            coordinates=coordinates,
+            value=strings[value] if value != _NO_ID else None,
+            metadata=dict(zip(*metadata[:2])) if metadata is not None else {},
+        )
+        if extras:
+            for name, extra in extras.items():
+                setattr(event, name, extra)
+        return event
+    
+    def recent(self, n: int) -> List[UserEvent]:
+        """Últimos n eventos em ordem cronológica, sem percorrer o buffer todo"""
+        with self.lock:
+            return [self.event_at(i) for i in range(max(self._size - n, 0), self._size)]
+    
+    @property
+    def first(self) -> Optional[UserEvent]:
+        with self.lock:
+            return self.event_at(0) if self._size else None
+    
+    @property
+    def last(self) -> Optional[UserEvent]:
+        with self.lock:
+            return self.event_at(self._size - 1) if self._size else None
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def __iter__(self):
+        with self.lock:
+            events = [self.event_at(i) for i in range(self._size)]
+        return iter(events)
+
+
 class UserBehaviorAnalyzer:
     """Analisador de comportamento do usuário"""
     
-    def __init__(self):
-        self.sessions: Dict[str, List[UserEvent]] = defaultdict(list)
+    def __init__(self, max_events_per_session: int = 10000):
+        self.max_events_per_session = max_events_per_session
+        self.sessions: Dict[str, SessionEventBuffer] = {}
         self.idle_threshold_seconds = 30  # 30 segundos sem atividade = idle
     
+    def _buffer(self, session_id: str) -> SessionEventBuffer:
+        buffer = self.sessions.get(session_id)
+        if buffer is None:
+            buffer = self.sessions.setdefault(session_id, SessionEventBuffer(
+                session_id, self.max_events_per_session
+            ))
+        return buffer
+    
     def add_event(self, event: UserEvent):
         """Adiciona evento de usuário"""
-        self.sessions[event.session_id].append(event)
-        logger.debug(f"Evento adicionado: {event.event_type.value} para sessão {event.session_id}")
+        self._buffer(event.session_id).add(event)
+        logger.debug("Evento adicionado: %s para sessão %s", event.event_type.value, event.session_id)
+    
+    def record_event(self, session_id: str, event_type: EventType, **fields) -> str:
+        """Adiciona evento sem montar UserEvent (campos como em UserEvent); retorna o event_id"""
+        event_id = self._buffer(session_id).append(event_type, **fields)
+        logger.debug("Evento adicionado: %s para sessão %s", event_type.value, session_id)
+        return event_id
     
     def get_user_sequence(self, session_id: str, limit: Optional[int] = None) -> List[UserEvent]:
-        """Obtém sequência de ações do usuário"""
-        events = self.sessions.get(session_id, [])
-        events.sort(key=lambda x: x.timestamp)
+        """Obtém sequência de ações do usuário (já ordenada por timestamp)"""
+        events = self.sessions.get(session_id)
+        if events is None:
+            return []
         
         if limit:
-            return events[-limit:]
-        return events
+            return events.recent(limit)
+        return list(events)
+    
+    def click_rate_per_minute(self, session_id: str) -> float:
+        """
+        Cliques por minuto (mesma fórmula de analyze_click_patterns) a partir
+        dos contadores incrementais da sessão, em O(1)
+        """
+        events = self.sessions.get(session_id)
+        if events is None:
+            return 0.0
+        count, first, last = events.type_span(EventType.CLICK)
+        if count < 2:
+            return 0.0
+        return count / max(_seconds(last - first) / 60, 1)
+    
+    def count_event_types(self, session_id: str) -> Dict[str, int]:
+        """Eventos por tipo, na ordem em que cada tipo apareceu na sessão"""
+        events = self.sessions.get(session_id)
+        if not events:
+            return {}
+        codes, first_index, counts = np.unique(events.type_codes, return_index=True, return_counts=True)
+        order = np.argsort(first_index, kind="stable")
+        return {_EVENT_TYPES[codes[i]].value: int(counts[i]) for i in order}
     
     def calculate_idle_time(self, session_id: str) -> Dict[str, Any]:
         """Calcula tempo de inatividade do usuário"""
-        events = self.get_user_sequence(session_id)
+        events = self.sessions.get(session_id)
         
-        if len(events) < 2:
+        if events is None or len(events) < 2:
             return {"total_idle_time": 0, "idle_periods": [], "longest_idle": 0}
         
-        idle_periods = []
-        total_idle_time = 0
-        
-        for i in range(1, len(events)):
-            time_diff = (events[i].timestamp - events[i-1].timestamp).total_seconds()
-            
-            if time_diff > self.idle_threshold_seconds:
-                idle_period = {
-                    "start": events[i-1].timestamp.isoformat(),
-                    "end": events[i].timestamp.isoformat(),
-                    "duration_seconds": time_diff
+        with events.lock:
+            # Intervalos entre eventos consecutivos (segundos, resolução de µs como timedelta)
+            gaps = (np.diff(events.timestamps_ns) // 1000) / 1e6
+            idle_periods = [
+                {
+                    "start": events.timestamp_at(i).isoformat(),
+                    "end": events.timestamp_at(i + 1).isoformat(),
+                    "duration_seconds": float(gaps[i])
                 }
-                idle_periods.append(idle_period)
-                total_idle_time += time_diff
+                for i in np.flatnonzero(gaps > self.idle_threshold_seconds).tolist()
+            ]
+        total_idle_time = sum(p["duration_seconds"] for p in idle_periods)
         
         longest_idle = max([p["duration_seconds"] for p in idle_periods]) if idle_periods else 0
         
@@ -257,63 +729,149 @@ class UserBehaviorAnalyzer:
     
     def analyze_click_patterns(self, session_id: str) -> Dict[str, Any]:
         """Analisa padrões de clique"""
-        events = [e for e in self.sessions.get(session_id, []) 
-                 if e.event_type == EventType.CLICK]
-        
-        if not events:
+        events = self.sessions.get(session_id)
+        if events is None:
             return {"total_clicks": 0, "click_frequency": 0, "hotspots": []}
         
-        # Calcular frequência de cliques
-        if len(events) > 1:
-            session_duration = (events[-1].timestamp - events[0].timestamp).total_seconds()
-            click_frequency = len(events) / max(session_duration / 60, 1)  # cliques por minuto
-        else:
-            click_frequency = 0
-        
-        # Identificar hotspots (áreas mais clicadas)
-        hotspots = defaultdict(int)
-        for event in events:
-            if event.coordinates:
-                # Agrupar por região de 50x50 pixels
-                region_x = (event.coordinates["x"] // 50) * 50
-                region_y = (event.coordinates["y"] // 50) * 50
-                hotspots[f"{region_x},{region_y}"] += 1
-        
-        sorted_hotspots = sorted(hotspots.items(), key=lambda x: x[1], reverse=True)[:10]
+        with events.lock:
+            clicks = np.flatnonzero(events.type_codes == _EVENT_TYPE_CODES[EventType.CLICK])
+            
+            if not clicks.size:
+                return {"total_clicks": 0, "click_frequency": 0, "hotspots": []}
+            
+            # Calcular frequência de cliques
+            if clicks.size > 1:
+                ts = events.timestamps_ns
+                session_duration = _seconds(int(ts[clicks[-1]]) - int(ts[clicks[0]]))
+                click_frequency = int(clicks.size) / max(session_duration / 60, 1)  # cliques por minuto
+            else:
+                click_frequency = 0
+            
+            # Hotspots: regiões de 50x50 pixels; empates ficam na ordem do primeiro clique
+            heatmap = events.click_heatmap()
+            if not events.has_extras:
+                hotspots = [{"region": f"{cx * 50},{cy * 50}", "clicks": count}
+                            for cx, cy, count in heatmap.top("hotspots", 10)]
+            else:
+                hotspots = self._merge_extra_clicks(events, clicks, heatmap)
         
         return {
-            "total_clicks": len(events),
+            "total_clicks": int(clicks.size),
             "click_frequency_per_minute": round(click_frequency, 2),
-            "hotspots": [{"region": region, "clicks": count} for region, count in sorted_hotspots]
+            "hotspots": hotspots
         }
+    
+    @staticmethod
+    def _merge_extra_clicks(events: SessionEventBuffer, clicks: np.ndarray,
+                            heatmap: ClickHeatmap) -> List[Dict[str, Any]]:
+        """Hotspots incluindo cliques com coordenadas fora das colunas (floats, chaves extras)"""
+        packed = (events.column("x")[clicks] != _NO_COORD) & (events.column("y")[clicks] != _NO_COORD)
+        cx, cy, counts, first = heatmap.cells("hotspots")
+        positions = np.flatnonzero(packed)[first]
+        hotspots: Dict[str, List[int]] = {
+            f"{region_x * 50},{region_y * 50}": [count, position]
+            for region_x, region_y, count, position in zip(cx.tolist(), cy.tolist(), counts.tolist(), positions.tolist())
+        }
+        for position in np.flatnonzero(~packed).tolist():
+            coordinates = events.coordinates_at(int(clicks[position]))
+            if coordinates and "x" in coordinates and "y" in coordinates:
+                region = f"{(coordinates['x'] // 50) * 50},{(coordinates['y'] // 50) * 50}"
+                entry = hotspots.setdefault(region, [0, position])
+                entry[0] += 1
+        
+        sorted_hotspots = sorted(hotspots.items(), key=lambda item: (-item[1][0], item[1][1]))[:10]
+        return [{"region": region, "clicks": count} for region, (count, _) in sorted_hotspots]
 
 
-class EndpointMonitor:
-    """Monitor de endpoints e performance"""
+SNAPSHOT_VERSION = 1  # formato de EndpointMonitor.snapshot()
+
+
+class _MonitorShard:
+    """Fatia do estado do EndpointMonitor, com lock próprio"""
+    __slots__ = ("lock", "endpoints", "request_counter", "session_counters")
     
     def __init__(self):
+        self.lock = threading.Lock()
         self.endpoints: Dict[str, EndpointMetrics] = {}
-        self.request_history: deque = deque(maxlen=10000)  # Últimas 10k requisições
-        self.rate_limiter_windows: Dict[str, deque] = defaultdict(lambda: deque())
-        self._lock = threading.Lock()
+        self.request_counter = SlidingWindowCounter()  # parte do contador global
+        self.session_counters: "OrderedDict[str, SlidingWindowCounter]" = OrderedDict()
+    
+    def evict_session_counters(self, limit: int, now: float):
+        """Remove contadores de sessão em excesso ou ociosos (chamado sob o lock)"""
+        counters = self.session_counters
+        while counters:
+            session_id, counter = next(iter(counters.items()))
+            if len(counters) <= limit and not counter.is_idle(now):
+                break
+            del counters[session_id]
+
+
+class EndpointMonitor:
+    """
+    Monitor de endpoints e performance.
+    
+    O estado fica dividido em `n_shards` fatias com lock próprio: métricas do
+    endpoint (e a parte do contador global) na fatia do hash do endpoint,
+    contadores da sessão na fatia do hash da sessão. Requisições de
+    endpoints/sessões diferentes não disputam o mesmo lock; os relatórios
+    juntam as fatias.
+    """
+    
+    def __init__(self, rate_limiter: Optional[RateLimiter] = None, n_shards: int = 16,
+                 max_session_counters: int = 100_000, history_size: int = 10000):
+        self.request_history: deque = deque(maxlen=history_size)  # Últimas requisições (10k)
+        # Quantas entradas do histórico cada sessão tem (para forget_session)
+        self._history_sessions: Dict[str, int] = {}
+        self._history_lock = threading.Lock()
+        # Limite por sessão (padrão: 60 req/min, janela deslizante)
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter(
+            RateLimitAlgorithm.SLIDING_WINDOW, limit=60, window_seconds=60.0
+        )
+        self._shards = [_MonitorShard() for _ in range(max(1, n_shards))]
+        # Contadores por sessão ficam em ordem LRU em cada fatia: saem os que
+        # passam da cota da fatia e os que já não têm bucket em nenhuma janela
+        # consultável.
+        self.max_session_counters = max_session_counters
+        self._session_counters_per_shard = max(1, -(-max_session_counters // len(self._shards)))
+    
+    def _shard(self, key: str) -> _MonitorShard:
+        return self._shards[hash(key) % len(self._shards)]
+    
+    @property
+    def endpoints(self) -> Dict[str, EndpointMetrics]:
+        """Métricas de todos os endpoints (cópia do mapeamento, juntando as fatias)"""
+        merged: Dict[str, EndpointMetrics] = {}
+        for shard in self._shards:
+            with shard.lock:
+                merged.update(shard.endpoints)
+        return merged
+    
+    def endpoint_count(self) -> int:
+        """Quantidade de endpoints monitorados, sem montar o mapeamento"""
+        total = 0
+        for shard in self._shards:
+            with shard.lock:
+                total += len(shard.endpoints)
+        return total
     
     def record_request(self, request: RequestEvent):
         """Registra uma requisição"""
-        with self._lock:
-            endpoint_key = f"{request.method.value}:{request.endpoint}"
-            
+        endpoint_key = f"{request.method.value}:{request.endpoint}"
+        ts = _to_ns(request.timestamp) / 1e9
+        
+        shard = self._shard(endpoint_key)
+        with shard.lock:
             # Criar ou obter métricas do endpoint
-            if endpoint_key not in self.endpoints:
-                self.endpoints[endpoint_key] = EndpointMetrics(
+            metrics = shard.endpoints.get(endpoint_key)
+            if metrics is None:
+                metrics = shard.endpoints[endpoint_key] = EndpointMetrics(
                     endpoint=request.endpoint,
                     method=request.method
                 )
             
-            metrics = self.endpoints[endpoint_key]
-            
             # Atualizar métricas
             metrics.total_requests += 1
-            metrics.response_times.append(request.response_time_ms)
+            metrics.latency.add(request.response_time_ms)
             metrics.last_accessed = request.timestamp
             
             if metrics.first_accessed is None:
@@ -331,42 +889,83 @@ class EndpointMonitor:
             else:
                 metrics.failed_requests += 1
             
-            # Adicionar ao histórico
-            self.request_history.append(request)
-            
-            # Atualizar janela de rate limiting
-            session_window = self.rate_limiter_windows[request.session_id]
-            now = datetime.now()
-            
-            # Remover requisições antigas (mais de 1 minuto)
-            while session_window and (now - session_window[0]).total_seconds() > 60:
-                session_window.popleft()
-            
-            session_window.append(now)
-            
-            logger.info(f"Requisição registrada: {request.method.value} {request.endpoint} "
-                       f"- {request.status_code} - {request.response_time_ms:.2f}ms")
+            shard.request_counter.add(ts)
+        
+        # Contadores de taxa da sessão
+        shard = self._shard(request.session_id)
+        with shard.lock:
+            session_counter = shard.session_counters.get(request.session_id)
+            if session_counter is None:
+                session_counter = shard.session_counters[request.session_id] = SlidingWindowCounter()
+            else:
+                shard.session_counters.move_to_end(request.session_id)
+            session_counter.add(ts)
+            shard.evict_session_counters(self._session_counters_per_shard, ts)
+        
+        # Adicionar ao histórico
+        with self._history_lock:
+            history = self.request_history
+            if len(history) == history.maxlen:
+                self._uncount_history(history[0].session_id)
+            history.append(request)
+            self._history_sessions[request.session_id] = self._history_sessions.get(request.session_id, 0) + 1
+        
+        logger.info("Requisição registrada: %s %s - %s - %.2fms", request.method.value,
+                    request.endpoint, request.status_code, request.response_time_ms)
+    
+    def forget_session(self, session_id: str):
+        """Descarta os contadores, o estado de rate limit e o histórico da sessão"""
+        shard = self._shard(session_id)
+        with shard.lock:
+            shard.session_counters.pop(session_id, None)
+        self.rate_limiter.reset(session_id)
+        with self._history_lock:
+            # Só reconstrói o histórico se a sessão ainda tem entradas nele
+            if self._history_sessions.pop(session_id, None):
+                kept = [r for r in self.request_history if r.session_id != session_id]
+                self.request_history.clear()
+                self.request_history.extend(kept)
+    
+    def _uncount_history(self, session_id: str):
+        # Chamado com _history_lock, para a entrada que sai do histórico
+        remaining = self._history_sessions[session_id] - 1
+        if remaining:
+            self._history_sessions[session_id] = remaining
+        else:
+            del self._history_sessions[session_id]
     
     def get_endpoint_metrics(self, endpoint: str, method: HTTPMethod) -> Optional[EndpointMetrics]:
         """Obtém métricas de um endpoint específico"""
         endpoint_key = f"{method.value}:{endpoint}"
-        return self.endpoints.get(endpoint_key)
+        shard = self._shard(endpoint_key)
+        with shard.lock:
+            return shard.endpoints.get(endpoint_key)
     
     def get_all_endpoints_metrics(self) -> Dict[str, Dict[str, Any]]:
         """Obtém métricas de todos os endpoints"""
-        return {key: metrics.to_dict() for key, metrics in self.endpoints.items()}
+        merged: Dict[str, Dict[str, Any]] = {}
+        for shard in self._shards:
+            with shard.lock:
+                merged.update((key, metrics.to_dict()) for key, metrics in shard.endpoints.items())
+        return merged
     
     def calculate_requests_per_minute(self, session_id: Optional[str] = None, 
                                     window_minutes: int = 5) -> Dict[str, float]:
-        """Calcula requisições por minuto"""
-        now = datetime.now()
-        cutoff = now - timedelta(minutes=window_minutes)
+        """
+        Calcula requisições por minuto a partir dos contadores por bucket
+        (janelas de até 60 minutos; resolução de 1 s até 5 min, de 1 min acima).
+        O bucket da borda entra rateado e a contagem é arredondada, então
+        total_requests é inteiro como na contagem evento a evento.
+        """
+        now = _to_ns(datetime.now()) / 1e9
         
         if session_id:
             # Requisições específicas da sessão
-            session_requests = [r for r in self.request_history 
-                              if r.session_id == session_id and r.timestamp > cutoff]
-            rpm = len(session_requests) / window_minutes
+            shard = self._shard(session_id)
+            with shard.lock:
+                counter = shard.session_counters.get(session_id)
+                count = round(counter.count(window_minutes * 60, now)) if counter is not None else 0
+            rpm = count / window_minutes
             rps = rpm / 60
             
             return {
@@ -374,51 +973,259 @@ class EndpointMonitor:
                 "requests_per_minute": round(rpm, 2),
                 "requests_per_second": round(rps, 2),
                 "window_minutes": window_minutes,
-                "total_requests": len(session_requests)
+                "total_requests": count
             }
         else:
             # Todas as requisições
-            recent_requests = [r for r in self.request_history if r.timestamp > cutoff]
-            rpm = len(recent_requests) / window_minutes
+            count = 0.0
+            for shard in self._shards:
+                with shard.lock:
+                    count += shard.request_counter.count(window_minutes * 60, now)
+            count = round(count)
+            rpm = count / window_minutes
             rps = rpm / 60
             
             return {
                 "requests_per_minute": round(rpm, 2),
                 "requests_per_second": round(rps, 2),
                 "window_minutes": window_minutes,
-                "total_requests": len(recent_requests)
+                "total_requests": count
             }
     
     def get_top_endpoints(self, limit: int = 10, sort_by: str = "total_requests") -> List[Dict[str, Any]]:
         """Obtém endpoints mais acessados"""
-        metrics_list = [(key, metrics) for key, metrics in self.endpoints.items()]
-        
-        if sort_by == "response_time":
-            metrics_list.sort(key=lambda x: x[1].avg_response_time, reverse=True)
-        elif sort_by == "failure_rate":
-            metrics_list.sort(key=lambda x: x[1].failure_rate, reverse=True)
-        else:  # total_requests
-            metrics_list.sort(key=lambda x: x[1].total_requests, reverse=True)
-        
-        return [{"endpoint_key": key, **metrics.to_dict()} 
-                for key, metrics in metrics_list[:limit]]
+        return _top_endpoints(self.endpoints, limit, sort_by)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Foto serializável (JSON) das métricas de endpoint e do contador global.
+        Contadores por sessão, rate limit e histórico ficam de fora: são
+        estado local do processo.
+        """
+        endpoints: Dict[str, Any] = {}
+        request_counter = SlidingWindowCounter()
+        for shard in self._shards:
+            with shard.lock:
+                endpoints.update((key, metrics.to_snapshot()) for key, metrics in shard.endpoints.items())
+                request_counter.merge(shard.request_counter)
+        return {
+            "version": SNAPSHOT_VERSION,
+            "endpoints": endpoints,
+            "request_counter": request_counter.to_snapshot()
+        }
+
+
+
+class MergedEndpointMetrics:
+    """
+    Soma de fotos de EndpointMonitor.snapshot() (ex.: uma por worker). Só as
+    métricas de endpoint e o contador global, sem locks nem rate limiter:
+    é montado por quem lê e descartado em seguida.
+    """
+    
+    def __init__(self):
+        self.endpoints: Dict[str, EndpointMetrics] = {}
+        self.request_counter = SlidingWindowCounter()
+    
+    @classmethod
+    def from_snapshots(cls, snapshots: List[Dict[str, Any]]) -> "MergedEndpointMetrics":
+        merged = cls()
+        for snapshot in snapshots:
+            merged.merge_snapshot(snapshot)
+        return merged
+    
+    def merge_snapshot(self, snapshot: Dict[str, Any]):
+        """Soma uma foto (de EndpointMonitor.snapshot())"""
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Versão de snapshot não suportada: {snapshot.get('version')!r}")
+        for key, data in snapshot["endpoints"].items():
+            metrics = EndpointMetrics.from_snapshot(data)
+            current = self.endpoints.get(key)
+            if current is None:
+                self.endpoints[key] = metrics
+            else:
+                current.merge(metrics)
+        self.request_counter.merge(SlidingWindowCounter.from_snapshot(snapshot["request_counter"]))
+    
+    def get_all_endpoints_metrics(self) -> Dict[str, Dict[str, Any]]:
+        return {key: metrics.to_dict() for key, metrics in self.endpoints.items()}
+    
+    def get_top_endpoints(self, limit: int = 10, sort_by: str = "total_requests") -> List[Dict[str, Any]]:
+        return _top_endpoints(self.endpoints, limit, sort_by)
+
+
+def _top_endpoints(endpoints: Dict[str, EndpointMetrics], limit: int, sort_by: str) -> List[Dict[str, Any]]:
+    metrics_list = list(endpoints.items())
+    
+    if sort_by == "response_time":
+        metrics_list.sort(key=lambda x: x[1].avg_response_time, reverse=True)
+    elif sort_by == "failure_rate":
+        metrics_list.sort(key=lambda x: x[1].failure_rate, reverse=True)
+    else:  # total_requests
+        metrics_list.sort(key=lambda x: x[1].total_requests, reverse=True)
+    
+    return [{"endpoint_key": key, **metrics.to_dict()} 
+            for key, metrics in metrics_list[:limit]]
+
+
+def endpoint_performance_report(monitor: Union[EndpointMonitor, MergedEndpointMetrics]) -> Dict[str, Any]:
+    """Relatório de performance dos endpoints de um monitor (local ou combinado)"""
+    all_metrics = monitor.get_all_endpoints_metrics()
+    top_endpoints = monitor.get_top_endpoints(10)
+    top_slow = monitor.get_top_endpoints(5, "response_time")
+    top_errors = monitor.get_top_endpoints(5, "failure_rate")
+    
+    # Estatísticas globais
+    total_requests = sum(m["total_requests"] for m in all_metrics.values())
+    total_successful = sum(m["successful_requests"] for m in all_metrics.values())
+    
+    global_success_rate = (total_successful / max(total_requests, 1)) * 100
+    
+    return {
+        "report_timestamp": datetime.now().isoformat(),
+        "summary": {
+            "total_endpoints": len(all_metrics),
+            "total_requests": total_requests,
+            "global_success_rate": round(global_success_rate, 2),
+            "global_failure_rate": round(100 - global_success_rate, 2)
+        },
+        "top_endpoints_by_usage": top_endpoints,
+        "slowest_endpoints": top_slow,
+        "most_error_prone": top_errors,
+        "all_endpoints": all_metrics
+    }
+
+
+
+class EventIngestionQueue:
+    """
+    Fila limitada entre track_* e o analisador. Quem chama só enfileira uma
+    tupla compacta sob um lock curto (sem notify); uma thread de fundo,
+    iniciada por start(), acorda quando um lote de `batch_size` enche ou a
+    cada `flush_interval_s` e entrega os eventos em lotes a `apply_batch`.
+    Com a fila cheia o evento é descartado (contado em `dropped`) em vez de
+    bloquear o chamador.
+    """
+    
+    def __init__(self, apply_batch: Callable[[List[tuple]], None], max_size: int = 10000,
+                 batch_size: int = 256, flush_interval_s: float = 0.05):
+        self._records: deque = deque()
+        self._apply_batch = apply_batch
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.dropped = 0
+        self.processed = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._done = threading.Condition()
+        self._applying = False
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        """Inicia a thread de ingestão (idempotente)"""
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="session-behavior-ingestion", daemon=True)
+            self._thread.start()
+    
+    def put(self, record: tuple) -> bool:
+        records = self._records
+        with self._lock:
+            if len(records) >= self.max_size:
+                self.dropped += 1
+                return False
+            records.append(record)
+            full_batch = len(records) == self.batch_size
+        if full_batch:
+            self._wakeup.set()
+        return True
+    
+    def flush(self):
+        """Bloqueia até que todos os eventos enfileirados tenham sido aplicados"""
+        if self._thread is None:
+            self._drain()  # sem thread: aplica na thread de quem chama
+            return
+        self._wakeup.set()
+        with self._done:
+            while self._records or self._applying:
+                self._done.wait(self.flush_interval_s)
+    
+    def close(self, timeout: Optional[float] = 5.0):
+        """Aplica o que já está na fila e encerra a thread"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        else:
+            self._drain()
+    
+    @property
+    def pending(self) -> int:
+        return len(self._records)
+    
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval_s)
+            self._wakeup.clear()
+            self._drain()
+        self._drain()
+    
+    def _drain(self):
+        records = self._records
+        while records:
+            self._applying = True
+            batch = []
+            try:
+                while records and len(batch) < self.batch_size:
+                    batch.append(records.popleft())
+                self._apply_batch(batch)
+            except Exception as e:
+                logger.error("Erro ao aplicar lote de eventos: %s", e)
+            finally:
+                self.processed += len(batch)
+                with self._done:
+                    self._applying = False
+                    self._done.notify_all()
 
 
 class SessionBehaviorSDK:
     """SDK principal para monitoramento de comportamento de sessão"""
     
-    def __init__(self):
+    def __init__(self, async_ingestion: bool = False, queue_size: int = 10000, batch_size: int = 256,
+                 session_ttl_s: Optional[float] = 24 * 3600.0, background_expiry: bool = True,
+                 session_clock: Callable[[], float] = time.monotonic):
         self.behavior_analyzer = UserBehaviorAnalyzer()
         self.endpoint_monitor = EndpointMonitor()
         self.event_handlers: Dict[EventType, List[Callable]] = defaultdict(list)
+        self.forget_handlers: List[Callable[[str], None]] = []
         self._active_sessions: Dict[str, datetime] = {}
+        # Registro de atividade e descarte da mesma sessão não se intercalam
+        self._session_locks = [threading.Lock() for _ in range(16)]
+        # Sessões sem atividade há session_ttl_s (padrão 24h; None desliga) são
+        # descartadas por uma thread de fundo, criada no primeiro uso e parada
+        # com close(). Sem background_expiry, expire_idle_sessions() avança a roda.
+        self._expiry: Optional[ExpiryWheel] = None
+        if session_ttl_s is not None:
+            self._expiry = ExpiryWheel(session_ttl_s, self._expire_session, clock=session_clock,
+                                       autostart=background_expiry)
+        # Modo assíncrono: track_* só enfileira; analisador e handlers rodam em lote
+        self._ingestion: Optional[EventIngestionQueue] = None
+        if async_ingestion:
+            self.start_async_ingestion(queue_size, batch_size)
         
     # ============= EVENT HANDLERS =============
     
     def register_event_handler(self, event_type: EventType, handler: Callable):
         """Registra um handler para tipo de evento"""
         self.event_handlers[event_type].append(handler)
-        logger.info(f"Handler registrado para evento: {event_type.value}")
+        logger.info("Handler registrado para evento: %s", event_type.value)
+    
+    def register_forget_handler(self, handler: Callable[[str], None]):
+        """Registra um handler chamado com o session_id quando a sessão é descartada"""
+        self.forget_handlers.append(handler)
     
     def trigger_event_handlers(self, event: UserEvent):
         """Dispara handlers para um evento"""
@@ -426,7 +1233,7 @@ class SessionBehaviorSDK:
             try:
                 handler(event)
             except Exception as e:
-                logger.error(f"Erro ao executar handler para {event.event_type.value}: {str(e)}")
+                logger.error("Erro ao executar handler para %s: %s", event.event_type.value, e)
     
     # ============= USER EVENTS =============
     
@@ -434,73 +1241,113 @@ class SessionBehaviorSDK:
                    coordinates: Dict[str, int] = None, page_url: str = "",
                    **metadata) -> str:
         """Rastreia evento de clique"""
-        event = UserEvent(
-            session_id=session_id,
-            event_type=EventType.CLICK,
+        return self._track(
+            session_id,
+            EventType.CLICK,
             element_id=element_id,
             coordinates=coordinates,
             page_url=page_url,
             metadata=metadata
         )
-        
-        self.behavior_analyzer.add_event(event)
-        self.trigger_event_handlers(event)
-        self._update_session_activity(session_id)
-        
-        return event.event_id
     
     def track_scroll(self, session_id: str, scroll_position: Dict[str, int],
                     page_url: str = "", **metadata) -> str:
         """Rastreia evento de scroll"""
-        event = UserEvent(
-            session_id=session_id,
-            event_type=EventType.SCROLL,
+        return self._track(
+            session_id,
+            EventType.SCROLL,
             coordinates=scroll_position,
             page_url=page_url,
             metadata={"scroll_direction": metadata.get("direction", "unknown"), **metadata}
         )
-        
-        self.behavior_analyzer.add_event(event)
-        self.trigger_event_handlers(event)
-        self._update_session_activity(session_id)
-        
-        return event.event_id
     
     def track_form_submit(self, session_id: str, form_id: str,
                          page_url: str = "", **metadata) -> str:
         """Rastreia envio de formulário"""
-        event = UserEvent(
-            session_id=session_id,
-            event_type=EventType.FORM_SUBMIT,
+        return self._track(
+            session_id,
+            EventType.FORM_SUBMIT,
             element_id=form_id,
             page_url=page_url,
             metadata=metadata
         )
-        
-        self.behavior_analyzer.add_event(event)
-        self.trigger_event_handlers(event)
-        self._update_session_activity(session_id)
-        
-        return event.event_id
     
     def track_custom_event(self, session_id: str, event_name: str,
                           data: Dict[str, Any] = None) -> str:
         """Rastreia evento customizado"""
-        event = UserEvent(
-            session_id=session_id,
-            event_type=EventType.CUSTOM,
+        return self._track(
+            session_id,
+            EventType.CUSTOM,
             value=event_name,
             metadata=data or {}
         )
+    
+    def _track(self, session_id: str, event_type: EventType, **fields) -> str:
+        """Registra o evento; UserEvent só é montado se houver handlers para o tipo"""
+        if self._ingestion is not None:
+            # Id e timestamp são fixados agora; o resto fica para a thread de ingestão
+            event_id, id_int = _new_event_id()
+            fields["event_id"] = event_id
+            fields["timestamp"] = datetime.now()
+            self._ingestion.put((session_id, event_type, fields, id_int))
+            return event_id
         
-        self.behavior_analyzer.add_event(event)
-        self.trigger_event_handlers(event)
-        self._update_session_activity(session_id)
+        event = None
+        with self._session_lock(session_id):
+            if self.event_handlers.get(event_type):
+                event = UserEvent(session_id=session_id, event_type=event_type, **fields)
+                self.behavior_analyzer.add_event(event)
+                event_id = event.event_id
+            else:
+                event_id = self.behavior_analyzer.record_event(session_id, event_type, **fields)
+            self._update_session_activity(session_id)
+        if event is not None:
+            self.trigger_event_handlers(event)
         
-        return event.event_id
+        return event_id
+    
+    # ============= INGESTÃO ASSÍNCRONA =============
+    
+    def start_async_ingestion(self, queue_size: int = 10000, batch_size: int = 256):
+        """Passa track_* a só enfileirar eventos; uma thread de fundo os aplica em lotes"""
+        if self._ingestion is None:
+            ingestion = EventIngestionQueue(self._apply_events, queue_size, batch_size)
+            ingestion.start()
+            self._ingestion = ingestion
+    
+    def stop_async_ingestion(self):
+        """Aplica os eventos pendentes e volta ao modo síncrono"""
+        ingestion, self._ingestion = self._ingestion, None
+        if ingestion is not None:
+            ingestion.close()
+    
+    def flush_events(self):
+        """Espera a aplicação dos eventos enfileirados (no-op no modo síncrono)"""
+        if self._ingestion is not None:
+            self._ingestion.flush()
+    
+    def _apply_events(self, records: List[tuple]):
+        """Aplica um lote vindo da fila de ingestão"""
+        for session_id, event_type, fields, id_int in records:
+            event = None
+            with self._session_lock(session_id):
+                if self.event_handlers.get(event_type):
+                    event = UserEvent(session_id=session_id, event_type=event_type, **fields)
+                    self.behavior_analyzer.add_event(event)
+                else:
+                    self.behavior_analyzer.record_event(session_id, event_type, event_id_int=id_int, **fields)
+                self._active_sessions[session_id] = fields["timestamp"]
+                if self._expiry is not None:
+                    self._expiry.touch(session_id)
+            if event is not None:
+                self.trigger_event_handlers(event)
     
     # ============= REQUEST MONITORING =============
     
+    def allow_request(self, session_id: str) -> bool:
+        """Consulta (e consome) o limite de requisições da sessão; para uso em middlewares"""
+        return self.endpoint_monitor.rate_limiter.allow(session_id)
+    
     def track_request(self, session_id: str, endpoint: str, method: HTTPMethod,
                      status_code: int, response_time_ms: float,
                      request_size: int = 0, response_size: int = 0,
@@ -524,8 +1371,9 @@ class SessionBehaviorSDK:
             error_message=error_message
         )
         
-        self.endpoint_monitor.record_request(request)
-        self._update_session_activity(session_id)
+        with self._session_lock(session_id):
+            self.endpoint_monitor.record_request(request)
+            self._update_session_activity(session_id)
         
         return request.request_id
     
@@ -569,94 +1417,119 @@ class SessionBehaviorSDK:
     
     def get_session_behavior_analysis(self, session_id: str) -> Dict[str, Any]:
         """Análise completa do comportamento da sessão"""
-        user_sequence = self.behavior_analyzer.get_user_sequence(session_id)
+        user_sequence = self.behavior_analyzer.sessions.get(session_id, ())
         idle_analysis = self.behavior_analyzer.calculate_idle_time(session_id)
         click_patterns = self.behavior_analyzer.analyze_click_patterns(session_id)
         request_metrics = self.endpoint_monitor.calculate_requests_per_minute(session_id)
         
         # Estatísticas gerais da sessão
-        event_counts = defaultdict(int)
-        for event in user_sequence:
-            event_counts[event.event_type.value] += 1
+        event_counts = self.behavior_analyzer.count_event_types(session_id)
         
         session_duration = 0
         if user_sequence:
-            session_duration = (user_sequence[-1].timestamp - user_sequence[0].timestamp).total_seconds()
+            timestamps = user_sequence.timestamps_ns
+            session_duration = _seconds(int(timestamps[-1]) - int(timestamps[0]))
         
         return {
             "session_id": session_id,
             "analysis_timestamp": datetime.now().isoformat(),
             "session_duration_seconds": session_duration,
             "total_events": len(user_sequence),
-            "event_breakdown": dict(event_counts),
+            "event_breakdown": event_counts,
             "click_patterns": click_patterns,
             "idle_analysis": idle_analysis,
             "request_metrics": request_metrics,
-            "user_sequence": [event.to_dict() for event in user_sequence[-20:]]  # Últimos 20 eventos
+            "user_sequence": [event.to_dict() for event in self.behavior_analyzer.get_user_sequence(session_id, 20)]  # Últimos 20 eventos
         }
     
     def get_endpoint_performance_report(self) -> Dict[str, Any]:
-        """Relatório de performance dos endpoints"""
-        all_metrics = self.endpoint_monitor.get_all_endpoints_metrics()
-        top_endpoints = self.endpoint_monitor.get_top_endpoints(10)
-        top_slow = self.endpoint_monitor.get_top_endpoints(5, "response_time")
-        top_errors = self.endpoint_monitor.get_top_endpoints(5, "failure_rate")
-        
-        # Estatísticas globais
-        total_requests = sum(m["total_requests"] for m in all_metrics.values())
-        total_successful = sum(m["successful_requests"] for m in all_metrics.values())
-        
-        global_success_rate = (total_successful / max(total_requests, 1)) * 100
-        
-        return {
-            "report_timestamp": datetime.now().isoformat(),
-            "summary": {
-                "total_endpoints": len(all_metrics),
-                "total_requests": total_requests,
-                "global_success_rate": round(global_success_rate, 2),
-                "global_failure_rate": round(100 - global_success_rate, 2)
-            },
-            "top_endpoints_by_usage": top_endpoints,
-            "slowest_endpoints": top_slow,
-            "most_error_prone": top_errors,
-            "all_endpoints": all_metrics
-        }
+        """Relatório de performance dos endpoints (só deste processo; ver aggregation)"""
+        return endpoint_performance_report(self.endpoint_monitor)
     
     def get_real_time_metrics(self) -> Dict[str, Any]:
         """Métricas em tempo real"""
         current_rpm = self.endpoint_monitor.calculate_requests_per_minute(window_minutes=1)
-        active_sessions = len([s for s, last_activity in self._active_sessions.items() 
+        active_sessions = len([s for s, last_activity in list(self._active_sessions.items()) 
                               if (datetime.now() - last_activity).total_seconds() < 300])  # 5 min
         
-        return {
+        metrics = {
             "timestamp": datetime.now().isoformat(),
             "active_sessions": active_sessions,
             "current_requests_per_minute": current_rpm["requests_per_minute"],
             "current_requests_per_second": current_rpm["requests_per_second"],
-            "total_endpoints_monitored": len(self.endpoint_monitor.endpoints),
+            "total_endpoints_monitored": self.endpoint_monitor.endpoint_count(),
             "recent_request_count": len(self.endpoint_monitor.request_history)
         }
+        if self._expiry is not None:
+            metrics["expired_sessions"] = self._expiry.expired
+        if self._ingestion is not None:
+            metrics["ingestion_queue"] = {
+                "pending": self._ingestion.pending,
+                "processed": self._ingestion.processed,
+                "dropped": self._ingestion.dropped
+            }
+        return metrics
     
     # ============= UTILITY METHODS =============
     
+    def _session_lock(self, session_id: str) -> threading.Lock:
+        return self._session_locks[hash(session_id) % len(self._session_locks)]
+    
     def _update_session_activity(self, session_id: str):
-        """Atualiza última atividade da sessão"""
+        """Atualiza última atividade da sessão (chamar com _session_lock)"""
         self._active_sessions[session_id] = datetime.now()
+        if self._expiry is not None:
+            self._expiry.touch(session_id)
+    
+    def forget_session(self, session_id: str):
+        """
+        Descarta os dados da sessão: atividade, eventos (com as strings
+        internadas), contadores de taxa, rate limit, histórico de requisições
+        e o que os forget_handlers guardam.
+        """
+        with self._session_lock(session_id):
+            if self._expiry is not None:
+                self._expiry.discard(session_id)
+            self._drop_session(session_id)
+    
+    def expire_idle_sessions(self) -> int:
+        """Descarta agora as sessões ociosas há session_ttl_s; retorna quantas"""
+        return self._expiry.advance() if self._expiry is not None else 0
+    
+    def _expire_session(self, session_id: str):
+        """Callback da expiração: a sessão tocada depois do prazo voltou à roda e fica"""
+        with self._session_lock(session_id):
+            if session_id not in self._expiry:
+                self._drop_session(session_id)
+    
+    def _drop_session(self, session_id: str):
+        self._active_sessions.pop(session_id, None)
+        self.behavior_analyzer.sessions.pop(session_id, None)
+        self.endpoint_monitor.forget_session(session_id)
+        for handler in self.forget_handlers:
+            try:
+                handler(session_id)
+            except Exception as e:
+                logger.error("Erro ao descartar sessão %s no handler %r: %s", session_id, handler, e)
+    
+    def close(self):
+        """Para as threads de fundo (ingestão assíncrona e expiração de sessões)"""
+        self.stop_async_ingestion()
+        if self._expiry is not None:
+            self._expiry.stop()
     
     def cleanup_old_sessions(self, hours: int = 24):
-        """Remove dados de sessões antigas"""
+        """Remove já as sessões sem atividade há `hours` (a expiração automática usa session_ttl_s)"""
         cutoff = datetime.now() - timedelta(hours=hours)
         
         # Limpar sessões inativas
-        inactive_sessions = [sid for sid, last_activity in self._active_sessions.items() 
+        inactive_sessions = [sid for sid, last_activity in list(self._active_sessions.items()) 
                            if last_activity < cutoff]
         
         for session_id in inactive_sessions:
-            del self._active_sessions[session_id]
-            if session_id in self.behavior_analyzer.sessions:
-                del self.behavior_analyzer.sessions[session_id]
+            self.forget_session(session_id)
         
-        logger.info(f"Limpeza executada: {len(inactive_sessions)} sessões antigas removidas")
+        logger.info("Limpeza executada: %s sessões antigas removidas", len(inactive_sessions))
 
 
 # ============= EXEMPLO DE USO =============
@@ -1061,6 +1934,49 @@ def get_performance_recommendations(level: str, avg_response_time: float) -> Lis
 
 # ============= FUNCIONALIDADES AVANÇADAS =============
 
+class AlertStore:
+    """
+    Alertas em ordem de criação, limitados aos `max_alerts` mais recentes
+    e indexados por timestamp: consultas por período fazem busca binária
+    em vez de reprocessar o timestamp ISO de cada alerta. As listas crescem
+    até max_alerts + max_alerts // 4 e são aparadas em bloco, então o
+    append é O(1) amortizado e a busca binária tem acesso O(1) por índice.
+    """
+    
+    def __init__(self, max_alerts: int = 10000):
+        self.max_alerts = max_alerts
+        self._trim_at = max_alerts + max(max_alerts // 4, 1)
+        self._alerts: List[Dict[str, Any]] = []
+        self._timestamps: List[int] = []  # ns, não decrescente
+        self._lock = threading.Lock()
+    
+    def append(self, alert: Dict[str, Any], timestamp: Optional[datetime] = None):
+        ts = _to_ns(timestamp or datetime.fromisoformat(alert["timestamp"]))
+        with self._lock:
+            if self._timestamps and ts < self._timestamps[-1]:
+                ts = self._timestamps[-1]  # relógio voltou: mantém o índice ordenado
+            self._alerts.append(alert)
+            self._timestamps.append(ts)
+            if len(self._alerts) > self._trim_at:
+                excess = len(self._alerts) - self.max_alerts
+                del self._alerts[:excess]
+                del self._timestamps[:excess]
+    
+    def since(self, cutoff: datetime) -> List[Dict[str, Any]]:
+        """Alertas com timestamp posterior a `cutoff`"""
+        with self._lock:
+            oldest = max(len(self._alerts) - self.max_alerts, 0)
+            start = bisect_right(self._timestamps, _to_ns(cutoff), lo=oldest)
+            return self._alerts[start:]
+    
+    def __len__(self) -> int:
+        return min(len(self._alerts), self.max_alerts)
+    
+    def __iter__(self):
+        with self._lock:
+            return iter(self._alerts[-self.max_alerts:] if self.max_alerts else [])
+
+
 class RealTimeEventProcessor:
     """Processador de eventos em tempo real"""
     
@@ -1072,7 +1988,7 @@ class RealTimeEventProcessor:
             "long_idle_time": 300,  # segundos
             "high_error_rate": 20   # percentual
         }
-        self.alerts: List[Dict[str, Any]] = []
+        self.alerts = AlertStore()
     
     def process_event_stream(self, events: List[Dict[str, Any]]):
         """Processa stream de eventos em tempo real"""
@@ -1126,8 +2042,7 @@ class RealTimeEventProcessor:
         
         # Verificar alta taxa de cliques
         if event_data.get('type') == 'user_event' and event_data.get('event_type') == 'CLICK':
-            behavior_analysis = self.sdk.get_session_behavior_analysis(session_id)
-            click_rate = behavior_analysis['click_patterns']['click_frequency_per_minute']
+            click_rate = round(self.sdk.behavior_analyzer.click_rate_per_minute(session_id), 2)
             
             if click_rate > self.alert_thresholds['high_click_rate']:
                 self._create_alert("high_click_rate", session_id, 
@@ -1144,17 +2059,18 @@ class RealTimeEventProcessor:
     
     def _create_alert(self, alert_type: str, session_id: str, message: str):
         """Cria um alerta"""
+        now = datetime.now()
         alert = {
             "id": str(uuid.uuid4()),
             "type": alert_type,
             "session_id": session_id,
             "message": message,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": now.isoformat(),
             "severity": self._get_alert_severity(alert_type)
         }
         
-        self.alerts.append(alert)
-        logger.warning(f"ALERTA [{alert['severity']}]: {message}")
+        self.alerts.append(alert, now)
+        logger.warning("ALERTA [%s]: %s", alert["severity"], message)
     
     def _get_alert_severity(self, alert_type: str) -> str:
         """Determina severidade do alerta"""
@@ -1168,9 +2084,7 @@ class RealTimeEventProcessor:
     
     def get_active_alerts(self, hours: int = 1) -> List[Dict[str, Any]]:
         """Obtém alertas ativos"""
-        cutoff = datetime.now() - timedelta(hours=hours)
-        return [alert for alert in self.alerts 
-                if datetime.fromisoformat(alert['timestamp']) > cutoff]
+        return self.alerts.since(datetime.now() - timedelta(hours=hours))
 
 
 # Executar demonstração se o arquivo for executado diretamente
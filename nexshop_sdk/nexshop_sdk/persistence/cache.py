@@ -0,0 +1,99 @@
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+
+class ScoreCache:
+    """
+    Cache LRU com TTL para resultados de score.
+
+    A chave é a impressão digital das entradas brutas quantizadas (bytes dos
+    valores arredondados para múltiplos de `quantum`) mais o que mais define
+    o resultado (valores lidos pelas hard rules, versões dos perfis).
+    Retentativas e checkouts em várias etapas com as mesmas entradas
+    reaproveitam o resultado em vez de refazer extração, regras, soma
+    ponderada, razões e logging.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        ttl_s: float = 10.0,
+        quantum: float = 1e-6,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_entries < 1:
+            raise ValueError("max_entries deve ser >= 1")
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.quantum = quantum
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def key(self, values: np.ndarray, *parts: Hashable) -> Tuple[Hashable, ...]:
+        fingerprint = np.rint(np.asarray(values, dtype=np.float64) / self.quantum).astype(np.int64).tobytes()
+        return (fingerprint,) + parts
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        expires_at = self._clock() + self.ttl_s
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def purge_expired(self) -> int:
+        """Remove entradas vencidas; retorna quantas saíram."""
+        now = self._clock()
+        with self._lock:
+            expired = [k for k, (expires_at, _) in self._entries.items() if expires_at <= now]
+            for k in expired:
+                del self._entries[k]
+            self.expirations += len(expired)
+        return len(expired)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,449 @@
+from __future__ import annotations
+import argparse
+import csv
+import json
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .calibration import CalibrationFitter, normalize_scores
+from .features import ExtractorPlugin, _raw_row, features_from_raw, read_raw_matrix
+from .profiles import ProfileBundle, WeightProfile, resolve_profile
+from .rules import DEFAULT_RULESET, CompiledRuleSet, weighted_sum_matrix
+from .scoring import (
+    ALLOW_THRESHOLD,
+    STEP_UP_THRESHOLD,
+    _STATUS_ACTIONS,
+    _calibrate_profile_scores,
+    required_extractors,
+)
+
+logger = logging.getLogger(__name__)
+
+N_SCORE_BINS = 101  # scores inteiros 0..100
+
+# Classes de rótulo (linhas das matrizes de confusão)
+LABELS = ("legit", "fraud", "unlabeled")
+_FRAUD_VALUES = {"1", "true", "yes", "fraud", "fraude", "chargeback"}
+_LEGIT_VALUES = {"0", "false", "no", "legit", "legitimo", "legítimo"}
+
+# Colunas de ação, na mesma ordem de _STATUS_ACTIONS (0=BLOCK, 1=STEP_UP, 2=ALLOW)
+ACTIONS = tuple(action.value for _, action in _STATUS_ACTIONS)
+STATUSES = tuple(status.value for status, _ in _STATUS_ACTIONS)
+
+
+# --------------------------
+# Leitura em streaming
+# --------------------------
+def iter_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """Um registro por linha; linhas vazias são ignoradas."""
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_csv(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Colunas com caminho pontuado ("device.seen_before", "geo.proxy", ...)
+    viram o payload aninhado. Células vazias ficam ausentes (valor default
+    do extractor) e as demais são lidas como JSON quando possível.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as fh:
+        for row in csv.DictReader(fh):
+            record: Dict[str, Any] = {}
+            for column, cell in row.items():
+                if column is None or cell is None or cell == "":
+                    continue
+                target = record
+                *parents, leaf = column.split(".")
+                for key in parents:
+                    target = target.setdefault(key, {})
+                target[leaf] = _parse_cell(cell)
+            yield record
+
+
+def _parse_cell(cell: str) -> Any:
+    try:
+        return json.loads(cell)
+    except ValueError:
+        return cell
+
+
+def iter_records(path: str, fmt: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    if fmt == "csv":
+        return iter_csv(path)
+    if fmt == "jsonl":
+        return iter_jsonl(path)
+    raise ValueError(f"Formato desconhecido: {fmt}")
+
+
+def label_index(value: Any) -> int:
+    """Normaliza o rótulo do registro para um índice em LABELS."""
+    if value is None:
+        return 2
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return 1 if value else 0
+    text = str(value).strip().lower()
+    if text in _FRAUD_VALUES:
+        return 1
+    if text in _LEGIT_VALUES:
+        return 0
+    return 2
+
+
+# --------------------------
+# Relatório
+# --------------------------
+@dataclass
+class BacktestReport:
+    """
+    Acumuladores de tamanho fixo: por variante de pesos e por rótulo, um
+    histograma de 101 bins com os scores das linhas não bloqueadas por hard
+    rule. Distribuições e matrizes de confusão para qualquer par de
+    thresholds saem desses histogramas, sem repontuar o arquivo.
+    """
+    variants: Tuple[str, ...]
+    histograms: np.ndarray                      # (V, len(LABELS), N_SCORE_BINS) int64
+    hard_blocked: np.ndarray                    # (len(LABELS),) int64
+    rule_counts: Counter = field(default_factory=Counter)
+    records: int = 0
+    errors: int = 0
+    elapsed_s: float = 0.0
+
+    def variant_index(self, variant: Union[int, str]) -> int:
+        return variant if isinstance(variant, int) else self.variants.index(variant)
+
+    def score_histogram(self, variant: Union[int, str] = 0) -> np.ndarray:
+        """Histograma (101,) de scores de todas as linhas pontuadas."""
+        return self.histograms[self.variant_index(variant)].sum(axis=0)
+
+    def confusion_matrix(
+        self,
+        variant: Union[int, str] = 0,
+        allow_threshold: int = ALLOW_THRESHOLD,
+        step_up_threshold: int = STEP_UP_THRESHOLD,
+    ) -> np.ndarray:
+        """Contagens (len(LABELS), len(ACTIONS)): rótulo x ação recomendada."""
+        hist = self.histograms[self.variant_index(variant)]
+        cum = np.concatenate([np.zeros((len(LABELS), 1), dtype=np.int64), np.cumsum(hist, axis=1)], axis=1)
+        allow_at = int(np.clip(allow_threshold, 0, N_SCORE_BINS))
+        block_at = int(np.clip(min(step_up_threshold, allow_threshold), 0, N_SCORE_BINS))
+        total = cum[:, -1]
+        block = cum[:, block_at] + self.hard_blocked
+        allow = total - cum[:, allow_at]
+        step_up = total - cum[:, block_at] - allow
+        return np.stack([block, step_up, allow], axis=1)
+
+    def summary(
+        self,
+        variant: Union[int, str] = 0,
+        allow_threshold: int = ALLOW_THRESHOLD,
+        step_up_threshold: int = STEP_UP_THRESHOLD,
+    ) -> Dict[str, Any]:
+        matrix = self.confusion_matrix(variant, allow_threshold, step_up_threshold)
+        by_action = matrix.sum(axis=0)
+        legit, fraud = matrix[0], matrix[1]
+        blocked = legit[0] + fraud[0]
+        intervened = blocked + legit[1] + fraud[1]
+        return {
+            "variant": self.variants[self.variant_index(variant)],
+            "allow_threshold": allow_threshold,
+            "step_up_threshold": step_up_threshold,
+            "actions": dict(zip(ACTIONS, by_action.tolist())),
+            "statuses": dict(zip(STATUSES, by_action.tolist())),
+            "confusion_matrix": {label: dict(zip(ACTIONS, row)) for label, row in zip(LABELS, matrix.tolist())},
+            "block_precision": _ratio(fraud[0], blocked),
+            "block_recall": _ratio(fraud[0], fraud.sum()),
+            "intervention_recall": _ratio(fraud[0] + fraud[1], fraud.sum()),
+            "intervention_precision": _ratio(fraud[0] + fraud[1], intervened),
+            "legit_block_rate": _ratio(legit[0], legit.sum()),
+            "legit_friction_rate": _ratio(legit[0] + legit[1], legit.sum()),
+        }
+
+    def threshold_sweep(
+        self,
+        allow_thresholds: Iterable[int],
+        step_up_thresholds: Iterable[int],
+        variants: Optional[Sequence[Union[int, str]]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Resumo para cada combinação variante x threshold de allow x threshold de step-up."""
+        allow_thresholds, step_up_thresholds = list(allow_thresholds), list(step_up_thresholds)
+        out = []
+        for variant in (variants if variants is not None else range(len(self.variants))):
+            for allow in allow_thresholds:
+                for step_up in step_up_thresholds:
+                    if step_up <= allow:
+                        out.append(self.summary(variant, allow, step_up))
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "records": self.records,
+            "errors": self.errors,
+            "elapsed_s": round(self.elapsed_s, 3),
+            "hard_blocked": dict(zip(LABELS, self.hard_blocked.tolist())),
+            "rule_counts": dict(self.rule_counts),
+            "variants": {
+                name: {
+                    "score_histogram": self.score_histogram(v).tolist(),
+                    "summary": self.summary(v),
+                }
+                for v, name in enumerate(self.variants)
+            },
+        }
+
+
+def _ratio(num, den) -> Optional[float]:
+    return round(float(num) / float(den), 4) if den else None
+
+
+# --------------------------
+# Motor
+# --------------------------
+def _variant_profiles(
+    weights: Union[None, Mapping[str, float], WeightProfile],
+    variants: Union[None, Mapping[str, Any], Sequence[Any]],
+) -> List[WeightProfile]:
+    profiles = [resolve_profile(weights)]
+    if isinstance(variants, Mapping):
+        for name, w in variants.items():
+            profiles.append(w if isinstance(w, WeightProfile) else WeightProfile.compile(w, version=name))
+    elif variants:
+        profiles.extend(resolve_profile(w) for w in variants)
+    return profiles
+
+
+def _read_chunk(
+    records: List[Dict[str, Any]],
+    label_field: str,
+    plan: Tuple[ExtractorPlugin, ...],
+) -> Tuple[List[Dict[str, Any]], np.ndarray, np.ndarray, int]:
+    payloads = [r.get("payload", r) for r in records]
+    labels = np.fromiter((label_index(r.get(label_field)) for r in records), dtype=np.int64, count=len(records))
+    try:
+        return payloads, read_raw_matrix(payloads, plan), labels, 0
+    except (TypeError, ValueError, AttributeError):
+        # Lote com linha inválida: separa as linhas boas uma a uma
+        keep = []
+        for i, payload in enumerate(payloads):
+            try:
+                _raw_row(payload, plan)
+                keep.append(i)
+            except (TypeError, ValueError, AttributeError):
+                pass
+        payloads = [payloads[i] for i in keep]
+        return payloads, read_raw_matrix(payloads, plan), labels[keep], len(records) - len(keep)
+
+
+def _score_chunks(
+    source: Union[str, Iterable[Dict[str, Any]]],
+    bundle: ProfileBundle,
+    ruleset: CompiledRuleSet,
+    chunk_size: int,
+    label_field: str,
+    fmt: Optional[str],
+) -> Iterator[Tuple[int, int, np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Lê e pontua a fonte em chunks. Para cada chunk produz (registros,
+    inválidos, rótulos, hard rules disparadas, máscara de bloqueio e score
+    bruto (n_pontuados, P) das linhas não bloqueadas, um perfil por coluna).
+    """
+    records = iter_records(source, fmt) if isinstance(source, str) else iter(source)
+    plan = required_extractors(bundle, ruleset)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        payloads, raw, labels, errors = _read_chunk(chunk, label_field, plan)
+        if not payloads:
+            yield len(chunk), errors, labels, np.zeros(0, dtype=np.int16), np.zeros(0, dtype=bool), np.zeros((0, 0))
+            continue
+
+        values, confidences = features_from_raw(raw, plan, payloads)
+        fired = ruleset.fired_indices(ruleset.payload_conditions(payloads), values)
+        hit = fired >= 0
+        blocked = np.zeros(len(payloads), dtype=bool)
+        blocked[hit] = ruleset.ordered_force_block[fired[hit]]
+        scored = ~blocked
+        raw_scores, _ = weighted_sum_matrix(values[scored], confidences[scored], bundle.matrix)
+        yield len(chunk), errors, labels, fired, blocked, raw_scores
+
+
+def run_backtest(
+    source: Union[str, Iterable[Dict[str, Any]]],
+    weights: Union[None, Mapping[str, float], WeightProfile] = None,
+    variants: Union[None, Mapping[str, Any], Sequence[Any]] = None,
+    rules: Optional[CompiledRuleSet] = None,
+    chunk_size: int = 50_000,
+    label_field: str = "label",
+    fmt: Optional[str] = None,
+) -> BacktestReport:
+    """
+    Pontua um arquivo (JSONL/CSV) ou iterável de registros em chunks, com
+    memória constante. Cada registro é o payload de calculate_score (ou tem o
+    payload em "payload") e o rótulo em `label_field`. O perfil `weights` e
+    as `variants` são pontuados na mesma passada, numa única matriz de pesos.
+    """
+    started = time.perf_counter()
+    profiles = _variant_profiles(weights, variants)
+    bundle = ProfileBundle.compile(profiles[0], profiles[1:])
+    ruleset = rules if rules is not None else DEFAULT_RULESET
+    n_variants = len(profiles)
+    n_labels = len(LABELS)
+
+    report = BacktestReport(
+        variants=tuple(p.version for p in profiles),
+        histograms=np.zeros((n_variants, n_labels, N_SCORE_BINS), dtype=np.int64),
+        hard_blocked=np.zeros(n_labels, dtype=np.int64),
+    )
+    # Deslocamento de cada variante no bincount achatado (V x rótulo x score)
+    variant_offsets = (np.arange(n_variants, dtype=np.int64) * n_labels * N_SCORE_BINS)[None, :]
+
+    for n_records, errors, labels, fired, blocked, raw_scores in _score_chunks(
+        source, bundle, ruleset, chunk_size, label_field, fmt
+    ):
+        report.records += n_records
+        report.errors += errors
+        if not len(fired):
+            continue
+        for i, count in Counter(fired[fired >= 0].tolist()).items():
+            report.rule_counts[ruleset.ordered_rules[i].code] += count
+        report.hard_blocked += np.bincount(labels[blocked], minlength=n_labels)
+
+        scores = _calibrate_profile_scores(raw_scores, profiles)  # (n, V)
+        flat = variant_offsets + labels[~blocked][:, None] * N_SCORE_BINS + scores
+        report.histograms += np.bincount(flat.ravel(), minlength=report.histograms.size).reshape(report.histograms.shape)
+
+        logger.debug("Backtest: %s registros processados", report.records)
+
+    report.elapsed_s = time.perf_counter() - started
+    logger.info("Backtest de %s registros em %.1fs (%s inválidos)", report.records, report.elapsed_s, report.errors)
+    return report
+
+
+def fit_calibration_from_records(
+    source: Union[str, Iterable[Dict[str, Any]]],
+    weights: Union[None, Mapping[str, float], WeightProfile] = None,
+    version: Optional[str] = None,
+    rules: Optional[CompiledRuleSet] = None,
+    chunk_size: int = 50_000,
+    label_field: str = "label",
+    fmt: Optional[str] = None,
+    n_bins: int = 200,
+) -> WeightProfile:
+    """
+    Ajusta a tabela de calibração (isotônica) dos pesos sobre o histórico
+    rotulado, com a mesma leitura em chunks do backtest. Linhas bloqueadas por
+    hard rule não entram no ajuste. Retorna o perfil com a tabela anexada;
+    to_config() dele é o arquivo a versionar junto com os pesos.
+    """
+    profile = resolve_profile(weights)
+    bundle = ProfileBundle.compile(profile)
+    ruleset = rules if rules is not None else DEFAULT_RULESET
+    fitter = CalibrationFitter(n_bins)
+    for _, _, labels, fired, blocked, raw_scores in _score_chunks(
+        source, bundle, ruleset, chunk_size, label_field, fmt
+    ):
+        if len(fired):
+            fitter.add(normalize_scores(raw_scores[:, 0], profile.max_abs_weight), labels[~blocked])
+    table = fitter.fit(version or f"{profile.version}-cal")
+    return WeightProfile.compile(profile.weights, version=profile.version, calibration=table)
+
+
+# --------------------------
+# CLI
+# --------------------------
+def format_report(report: BacktestReport, sweep: Sequence[Dict[str, Any]] = ()) -> str:
+    lines = [f"Registros: {report.records} (inválidos: {report.errors}) em {report.elapsed_s:.1f}s"]
+    lines.append(f"Bloqueados por hard rule: {dict(zip(LABELS, report.hard_blocked.tolist()))}")
+    for code, count in report.rule_counts.most_common():
+        lines.append(f"  {code}: {count}")
+    for v, name in enumerate(report.variants):
+        summary = report.summary(v)
+        hist = report.score_histogram(v)
+        deciles = [int(hist[i:i + 10].sum()) for i in range(0, 100, 10)]
+        deciles[-1] += int(hist[100])
+        lines.append(f"\n[{name}] ações: {summary['actions']}")
+        lines.append(f"  scores por decil: {deciles}")
+        lines.append("  rótulo        " + "".join(f"{a:>14}" for a in ACTIONS))
+        for label, row in summary["confusion_matrix"].items():
+            lines.append(f"  {label:<14}" + "".join(f"{row[a]:>14}" for a in ACTIONS))
+        lines.append(
+            f"  block precision={summary['block_precision']} recall={summary['block_recall']}"
+            f" | legit block rate={summary['legit_block_rate']}"
+        )
+    if sweep:
+        lines.append("\nvariante, allow, step_up, block_precision, block_recall, intervention_recall, legit_friction_rate")
+        for row in sweep:
+            lines.append(
+                f"{row['variant']}, {row['allow_threshold']}, {row['step_up_threshold']}, {row['block_precision']},"
+                f" {row['block_recall']}, {row['intervention_recall']}, {row['legit_friction_rate']}"
+            )
+    return "\n".join(lines)
+
+
+def _int_list(text: str) -> List[int]:
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m nexshop_sdk.risk_engine.backtest",
+        description="Backtest offline do risk_engine sobre arquivos de payloads históricos.",
+    )
+    parser.add_argument("path", help="arquivo JSONL ou CSV")
+    parser.add_argument("--format", choices=("jsonl", "csv"), default=None)
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--label-field", default="label")
+    parser.add_argument("--weights", help="perfil de pesos (JSON) usado como champion")
+    parser.add_argument("--variant", action="append", default=[], metavar="ARQUIVO",
+                        help="perfil de pesos (JSON) alternativo; pode repetir")
+    parser.add_argument("--allow-thresholds", type=_int_list, default=None, help="ex.: 70,75,80")
+    parser.add_argument("--step-up-thresholds", type=_int_list, default=None, help="ex.: 40,50,60")
+    parser.add_argument("--output", help="grava o relatório completo em JSON")
+    parser.add_argument("--fit-calibration", metavar="ARQUIVO",
+                        help="ajusta a calibração dos pesos e grava o perfil (pesos + tabela) em JSON")
+    parser.add_argument("--calibration-version", default=None)
+    args = parser.parse_args(argv)
+
+    weights = WeightProfile.from_file(args.weights) if args.weights else None
+    if args.fit_calibration:
+        profile = fit_calibration_from_records(args.path, weights, args.calibration_version,
+                                               chunk_size=args.chunk_size, label_field=args.label_field,
+                                               fmt=args.format)
+        with open(args.fit_calibration, "w", encoding="utf-8") as fh:
+            json.dump(profile.to_config(), fh, ensure_ascii=False, indent=2)
+        print(f"Calibração {profile.calibration.version} ({len(profile.calibration.knots)} pontos) "
+              f"gravada em {args.fit_calibration}")
+        return 0
+
+    variants = [WeightProfile.from_file(path) for path in args.variant]
+    report = run_backtest(args.path, weights, variants, chunk_size=args.chunk_size,
+                          label_field=args.label_field, fmt=args.format)
+
+    sweep: List[Dict[str, Any]] = []
+    if args.allow_thresholds or args.step_up_thresholds:
+        sweep = report.threshold_sweep(args.allow_thresholds or [ALLOW_THRESHOLD],
+                                       args.step_up_thresholds or [STEP_UP_THRESHOLD])
+    print(format_report(report, sweep))
+
+    if args.output:
+        data = report.to_dict()
+        data["threshold_sweep"] = sweep
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(data, fh, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,152 @@
+from __future__ import annotations
+import asyncio
+import logging
+from concurrent.futures import Executor
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from .profiles import WeightProfile
+from .rules import CompiledRuleSet
+from .scoring import ScoreResult, calculate_score, calculate_scores_batch
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatchScorer:
+    """
+    Front-end asyncio que agrupa chamadas concorrentes de score.
+
+    Cada chamada a score() entra numa fila; o coletor fecha um lote quando
+    atinge max_batch_size ou quando o primeiro item esperou max_wait_ms, pontua
+    tudo com calculate_scores_batch e resolve o future de cada chamador.
+    max_wait_ms limita a latência extra que o agrupamento adiciona. O kernel
+    roda num executor, então um lote grande não bloqueia o event loop.
+    A fila tem no máximo max_queue_size itens: com ela cheia, score() espera
+    uma vaga (backpressure) em vez de acumular memória.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = 256,
+        max_wait_ms: float = 2.0,
+        weights: Union[None, Dict[str, float], WeightProfile] = None,
+        rules: Optional[CompiledRuleSet] = None,
+        executor: Optional[Executor] = None,
+        max_queue_size: int = 4096,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size deve ser >= 1")
+        if max_queue_size < 1:
+            raise ValueError("max_queue_size deve ser >= 1")
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000.0
+        self.weights = weights
+        self.rules = rules
+        # O kernel roda fora do event loop: no `executor` dado ou, sem ele, no
+        # executor padrão do loop (pool de threads)
+        self.executor = executor
+        self.max_queue_size = max_queue_size
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._collector: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.items = 0
+
+    async def start(self) -> None:
+        if self._collector is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._collector = asyncio.create_task(self._run(), name="micro-batch-scorer")
+
+    async def stop(self) -> None:
+        """Processa o que já está na fila e encerra o coletor."""
+        if self._collector is None:
+            return
+        await self._queue.put(None)
+        await self._collector
+        self._collector = None
+        self._queue = None
+
+    async def __aenter__(self) -> "MicroBatchScorer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    async def score(self, payload: Dict[str, Any]) -> ScoreResult:
+        if self._collector is None:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((payload, future))
+        return await future
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+    # ------------------------------------------------------------------
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        stopping = False
+        while not stopping:
+            item = await queue.get()
+            if item is None:
+                break
+            batch: List[Tuple[Dict[str, Any], asyncio.Future]] = [item]
+            deadline = loop.time() + self.max_wait_s
+
+            while len(batch) < self.max_batch_size:
+                # Drena o que já chegou sem criar timers
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._score_batch(loop, batch)
+
+    async def _score_batch(self, loop: asyncio.AbstractEventLoop, batch) -> None:
+        payloads = [payload for payload, _ in batch]
+        try:
+            results = await loop.run_in_executor(self.executor, self._kernel, payloads)
+        except Exception as e:
+            # Um payload inválido não pode derrubar o lote: refaz item a item
+            logger.warning("Falha no lote de %s scores, pontuando individualmente: %s", len(batch), e)
+            results = await loop.run_in_executor(self.executor, self._score_each, payloads)
+
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():  # chamador cancelado
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _kernel(self, payloads: List[Dict[str, Any]]) -> List[ScoreResult]:
+        return calculate_scores_batch(payloads, self.weights, rules=self.rules)
+
+    def _score_each(self, payloads: List[Dict[str, Any]]) -> List[Union[ScoreResult, Exception]]:
+        results: List[Union[ScoreResult, Exception]] = []
+        for payload in payloads:
+            try:
+                results.append(calculate_score(payload, self.weights, rules=self.rules))
+            except Exception as e:
+                results.append(e)
+        return results
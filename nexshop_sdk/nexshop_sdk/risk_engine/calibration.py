@@ -0,0 +1,126 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any, List, Mapping, Optional, Union
+
+import numpy as np
+
+
+@dataclass(frozen=True, eq=False)
+class CalibrationTable:
+    """
+    Tabela de calibração aprendida: pontos (knots) no score bruto normalizado
+    (-1..1, o mesmo domínio da escala linear) e o score calibrado 0..100 em
+    cada ponto. Entre pontos o valor é interpolado linearmente (busca binária
+    via np.interp), fora deles fica no valor da ponta.
+    """
+    version: str
+    knots: np.ndarray    # crescente
+    values: np.ndarray   # não decrescente, 0..100
+
+    @classmethod
+    def build(cls, version: str, knots, values) -> "CalibrationTable":
+        knots = np.asarray(knots, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        if knots.ndim != 1 or knots.shape != values.shape or knots.size == 0:
+            raise ValueError("Tabela de calibração precisa de knots e values do mesmo tamanho")
+        if np.any(np.diff(knots) <= 0):
+            raise ValueError("Knots da calibração devem ser estritamente crescentes")
+        if np.any(np.diff(values) < 0) or values[0] < 0 or values[-1] > 100:
+            raise ValueError("Values da calibração devem ser não decrescentes e estar em 0..100")
+        knots.flags.writeable = False
+        values.flags.writeable = False
+        return cls(version=version, knots=knots, values=values)
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any]) -> "CalibrationTable":
+        """Formato: {"version": "cal-2024-06", "knots": [...], "values": [...]}"""
+        return cls.build(str(config.get("version", "")), config["knots"], config["values"])
+
+    def to_config(self) -> dict:
+        return {"version": self.version, "knots": self.knots.tolist(), "values": self.values.tolist()}
+
+    def calibrate(self, normalized: float) -> int:
+        return int(round(float(np.interp(normalized, self.knots, self.values))))
+
+    def calibrate_array(self, normalized: np.ndarray) -> np.ndarray:
+        # np.rint arredonda como round(), então bate com calibrate()
+        return np.rint(np.interp(normalized, self.knots, self.values)).astype(np.int64)
+
+
+# --------------------------
+# Ajuste offline (isotônico)
+# --------------------------
+class CalibrationFitter:
+    """
+    Acumula scores normalizados e rótulos em bins fixos (memória constante,
+    pode receber o histórico em chunks) e ajusta uma regressão isotônica
+    (pool adjacent violators) da taxa de legítimos por score.
+    O score calibrado é 100 * P(legítimo | score bruto).
+    """
+
+    def __init__(self, n_bins: int = 200):
+        self.n_bins = n_bins
+        self.counts = np.zeros(n_bins, dtype=np.int64)
+        self.legit = np.zeros(n_bins, dtype=np.int64)
+        self.sum_x = np.zeros(n_bins, dtype=np.float64)
+
+    def add(self, normalized: np.ndarray, labels: np.ndarray) -> None:
+        """`labels`: 0 = legítimo, 1 = fraude; outros valores são ignorados."""
+        normalized = np.clip(np.asarray(normalized, dtype=np.float64), -1.0, 1.0)
+        labels = np.asarray(labels)
+        keep = (labels == 0) | (labels == 1)
+        x, y = normalized[keep], labels[keep]
+        idx = np.minimum(((x + 1.0) * 0.5 * self.n_bins).astype(np.int64), self.n_bins - 1)
+        self.counts += np.bincount(idx, minlength=self.n_bins)
+        self.legit += np.bincount(idx[y == 0], minlength=self.n_bins)
+        self.sum_x += np.bincount(idx, weights=x, minlength=self.n_bins)
+
+    def fit(self, version: str) -> CalibrationTable:
+        used = np.flatnonzero(self.counts)
+        if used.size == 0:
+            raise ValueError("Sem amostras rotuladas para ajustar a calibração")
+        weight = self.counts[used].astype(np.float64)
+        x = self.sum_x[used] / weight
+        rate = self.legit[used] / weight
+        knots, values = _pool_adjacent_violators(x, rate, weight)
+        return CalibrationTable.build(version, knots, np.clip(values * 100.0, 0.0, 100.0))
+
+
+def _pool_adjacent_violators(x: np.ndarray, y: np.ndarray, w: np.ndarray):
+    # Cada bloco guarda (soma de w*x, soma de w*y, soma de w); blocos vizinhos
+    # que violam a monotonicidade são fundidos.
+    blocks: List[List[float]] = []
+    for xi, yi, wi in zip(x.tolist(), y.tolist(), w.tolist()):
+        blocks.append([xi * wi, yi * wi, wi])
+        while len(blocks) > 1 and blocks[-2][1] / blocks[-2][2] > blocks[-1][1] / blocks[-1][2]:
+            sx, sy, sw = blocks.pop()
+            blocks[-1][0] += sx
+            blocks[-1][1] += sy
+            blocks[-1][2] += sw
+    knots = np.array([b[0] / b[2] for b in blocks])
+    values = np.array([b[1] / b[2] for b in blocks])
+    return knots, values
+
+
+def fit_calibration(
+    normalized: np.ndarray,
+    labels: np.ndarray,
+    version: str,
+    n_bins: int = 200,
+) -> CalibrationTable:
+    fitter = CalibrationFitter(n_bins)
+    fitter.add(normalized, labels)
+    return fitter.fit(version)
+
+
+def normalize_scores(score_raw: Union[float, np.ndarray], max_abs_weight: float):
+    """Score bruto -> -1..1, a mesma normalização da calibração linear."""
+    if max_abs_weight <= 0:
+        max_abs_weight = 1.0
+    if isinstance(score_raw, np.ndarray):
+        return np.maximum(np.minimum(score_raw / max_abs_weight, 1.0), -1.0)
+    return max(min(score_raw / max_abs_weight, 1.0), -1.0)
+
+
+def calibration_from_config(config: Optional[Mapping[str, Any]]) -> Optional[CalibrationTable]:
+    return CalibrationTable.from_config(config) if config else None
@@ -1,12 +1,73 @@
 from __future__ import annotations
-from typing import Dict, List
+import heapq
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
 
 def top_reason_codes(contributions: Dict[str, float], top_k: int = 5) -> List[Dict[str, float]]:
     """
     Retorna top_k razões com maiores magnitudes (positivas e negativas).
+    Empates mantêm a ordem de inserção (heapq.nlargest equivale ao sort estável).
     """
-    items = sorted(contributions.items(), key=lambda kv: abs(kv[1]), reverse=True)
+    items = heapq.nlargest(top_k, contributions.items(), key=lambda kv: abs(kv[1]))
     return [
         {"code": name.upper(), "contribution": round(val, 4)}
-        for name, val in items[:top_k]
+        for name, val in items
+    ]
+
+def top_reason_codes_vector(
+    contributions: Sequence[float], names: Sequence[str], top_k: int = 5
+) -> List[Dict[str, float]]:
+    """
+    Mesmo resultado de top_reason_codes para contribuições alinhadas a `names`,
+    sem montar o dict intermediário.
+    """
+    picked = heapq.nlargest(top_k, range(len(contributions)), key=lambda i: abs(contributions[i]))
+    return [
+        {"code": names[i].upper(), "contribution": round(contributions[i], 4)}
+        for i in picked
     ]
+
+def top_reason_indices(contributions: np.ndarray, top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Índices (N, k) das top_k contribuições por magnitude em cada linha e os
+    valores correspondentes, na ordem de desempate do sort estável escalar.
+    Usa argpartition para achar o k-ésimo maior e só ordena os k escolhidos.
+    """
+    n, f = contributions.shape
+    k = min(top_k, f)
+    mag = np.abs(contributions)
+    if 0 < k < f:
+        part = np.argpartition(-mag, k - 1, axis=1)
+        kth = np.take_along_axis(mag, part[:, k - 1:k], axis=1)
+        # Todos acima do limiar entram; os empatados no limiar entram pela
+        # ordem de índice, como no sort estável.
+        above = mag > kth
+        tied = mag == kth
+        need = k - above.sum(axis=1, keepdims=True)
+        chosen = above | (tied & (np.cumsum(tied, axis=1) <= need))
+        candidates = np.nonzero(chosen)[1].reshape(n, k)
+    else:
+        candidates = np.broadcast_to(np.arange(k), (n, k))
+    cand_mag = np.take_along_axis(mag, candidates, axis=1)
+    order = np.take_along_axis(candidates, np.argsort(-cand_mag, axis=1, kind="stable"), axis=1)
+    return order, np.take_along_axis(contributions, order, axis=1)
+
+def reason_codes_from_indices(
+    order: np.ndarray, picked: np.ndarray, names: Sequence[str]
+) -> List[List[Dict[str, float]]]:
+    """Formata a saída de top_reason_indices no formato de top_reason_codes."""
+    codes = [name.upper() for name in names]
+    return [
+        [{"code": codes[j], "contribution": round(val, 4)} for j, val in zip(row_idx, row_val)]
+        for row_idx, row_val in zip(order.tolist(), picked.tolist())
+    ]
+
+def top_reason_codes_batch(
+    contributions: np.ndarray, names: Sequence[str], top_k: int = 5
+) -> List[List[Dict[str, float]]]:
+    """
+    Versão batch de top_reason_codes sobre uma matriz (N, F) de contribuições.
+    Mantém a ordem de desempate do sort estável da versão escalar.
+    """
+    return reason_codes_from_indices(*top_reason_indices(contributions, top_k), names)
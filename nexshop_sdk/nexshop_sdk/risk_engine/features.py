@@ -1,6 +1,8 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Dict, Any, Optional
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
 
 @dataclass
 class FeatureValue:
@@ -9,105 +11,405 @@ class FeatureValue:
     confidence: float = 1 # 0..1 confiança na medida
     detail: Optional[Dict[str, Any]] = None
 
-@dataclass
+@dataclass(frozen=True)
+class FeatureSpec:
+    name: str
+    group: str
+    detail_key: str         # chave do detail (entrada bruta que gerou a feature)
+    confidence: float = 1.0
+
+# ---------------------------
+# Registro fixo de features
+# ---------------------------
+
+# A ordem define as posições nos arrays do FeatureSet e as colunas da matriz
+# usada no modo batch.
+FEATURE_REGISTRY: Tuple[FeatureSpec, ...] = (
+    # device
+    FeatureSpec("device_trust", "device", "seen_before"),
+    FeatureSpec("emulator_flag", "device", "emulator"),
+    FeatureSpec("velocity_device_switch", "device", "switches_24h"),
+    # behavior
+    FeatureSpec("dwell_time", "behavior", "seconds"),
+    FeatureSpec("scroll_natural", "behavior", "avg_scroll_speed"),
+    FeatureSpec("click_burst", "behavior", "burst"),
+    # geo
+    FeatureSpec("ip_distance", "geo", "km"),
+    FeatureSpec("proxy_flag", "geo", "proxy"),
+    FeatureSpec("geo_velocity", "geo", "kmh"),
+    # biometrics
+    FeatureSpec("face_match", "biometrics", "match", confidence=0.9),
+    FeatureSpec("liveness", "biometrics", "liveness", confidence=0.9),
+)
+
+FEATURE_GROUPS: Tuple[str, ...] = ("device", "behavior", "geo", "biometrics")
+FEATURE_NAMES: Tuple[str, ...] = tuple(spec.name for spec in FEATURE_REGISTRY)
+FEATURE_INDEX: Dict[str, int] = {name: i for i, name in enumerate(FEATURE_NAMES)}
+N_FEATURES = len(FEATURE_REGISTRY)
+
+FEATURE_CONFIDENCES = np.array([spec.confidence for spec in FEATURE_REGISTRY], dtype=np.float64)
+FEATURE_CONFIDENCES.flags.writeable = False
+
+
 class FeatureSet:
-    device: Dict[str, FeatureValue]
-    behavior: Dict[str, FeatureValue]
-    geo: Dict[str, FeatureValue]
-    biometrics: Dict[str, FeatureValue]
+    """
+    Features de um payload em arrays alinhados a FEATURE_NAMES.
+    FeatureValue (com detail) só é montado sob demanda, via get()/group().
+    """
+    __slots__ = ("values", "confidences", "inputs")
+
+    def __init__(
+        self,
+        values: Optional[np.ndarray] = None,
+        confidences: Optional[np.ndarray] = None,
+        inputs: Optional[List[Any]] = None,
+    ):
+        self.values = np.zeros(N_FEATURES, dtype=np.float64) if values is None else values
+        self.confidences = FEATURE_CONFIDENCES.copy() if confidences is None else confidences
+        self.inputs: List[Any] = [None] * N_FEATURES if inputs is None else inputs
+
+    def set(self, name: str, value: float, raw: Any) -> None:
+        i = FEATURE_INDEX[name]
+        self.values[i] = value
+        self.inputs[i] = raw
+
+    def value(self, name: str) -> float:
+        return float(self.values[FEATURE_INDEX[name]])
+
+    def get(self, name: str) -> Optional[FeatureValue]:
+        i = FEATURE_INDEX.get(name)
+        if i is None:
+            return None
+        spec = FEATURE_REGISTRY[i]
+        return FeatureValue(
+            name,
+            value=float(self.values[i]),
+            confidence=float(self.confidences[i]),
+            detail={spec.detail_key: self.inputs[i]},
+        )
+
+    def group(self, group: str) -> Dict[str, FeatureValue]:
+        return {spec.name: self.get(spec.name) for spec in FEATURE_REGISTRY if spec.group == group}
+
+    # Visões por grupo, compatíveis com o layout antigo (dict de FeatureValue)
+    @property
+    def device(self) -> Dict[str, FeatureValue]:
+        return self.group("device")
+
+    @property
+    def behavior(self) -> Dict[str, FeatureValue]:
+        return self.group("behavior")
+
+    @property
+    def geo(self) -> Dict[str, FeatureValue]:
+        return self.group("geo")
+
+    @property
+    def biometrics(self) -> Dict[str, FeatureValue]:
+        return self.group("biometrics")
+
+    def __repr__(self) -> str:
+        pairs = ", ".join(f"{name}={v:.4f}" for name, v in zip(FEATURE_NAMES, self.values.tolist()))
+        return f"FeatureSet({pairs})"
+
+# ---------------------------
+# Registro de extractors (plugins)
+# ---------------------------
+
+@dataclass(frozen=True)
+class ExtractorPlugin:
+    """
+    Extractor registrado: declara os campos do payload que lê (inputs) e as
+    features que produz (outputs). read_raw faz a leitura/conversão dos
+    inputs, compartilhada pelo modo escalar (extract) e pelo batch.
+    vectorized, opcional, é a versão batch de extract: recebe as colunas
+    brutas (N, len(outputs)) e devolve os valores das features no mesmo shape.
+    """
+    name: str
+    inputs: Tuple[str, ...]
+    outputs: Tuple[str, ...]
+    read_raw: Callable[[Dict[str, Any]], Tuple[Any, ...]]
+    extract: Callable[..., FeatureSet]
+    vectorized: Optional[Callable[[np.ndarray], np.ndarray]] = None
+
+    @property
+    def columns(self) -> List[int]:
+        return [FEATURE_INDEX[name] for name in self.outputs]
+
+
+EXTRACTORS: Dict[str, ExtractorPlugin] = {}
+_PLAN_CACHE: Dict[bytes, Tuple[ExtractorPlugin, ...]] = {}
+
+
+def register_extractor(
+    name: str,
+    inputs: Sequence[str],
+    outputs: Sequence[str],
+    read_raw: Callable[[Dict[str, Any]], Tuple[Any, ...]],
+    vectorized: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+) -> Callable[[Callable[..., FeatureSet]], Callable[..., FeatureSet]]:
+    """
+    Decorator que registra um extractor. Os outputs precisam estar em
+    FEATURE_REGISTRY e cada feature tem um único extractor. Sem `vectorized`,
+    o modo batch roda o extract escalar payload a payload.
+    """
+    def decorator(func: Callable[..., FeatureSet]) -> Callable[..., FeatureSet]:
+        for feature in outputs:
+            if feature not in FEATURE_INDEX:
+                raise ValueError(f"Extractor {name}: feature desconhecida {feature}")
+            owner = next((p.name for p in EXTRACTORS.values() if feature in p.outputs and p.name != name), None)
+            if owner is not None:
+                raise ValueError(f"Extractor {name}: feature {feature} já produzida por {owner}")
+        EXTRACTORS[name] = ExtractorPlugin(name, tuple(inputs), tuple(outputs), read_raw, func, vectorized)
+        _PLAN_CACHE.clear()
+        return func
+    return decorator
+
+
+def unregister_extractor(name: str) -> ExtractorPlugin:
+    """Remove um extractor registrado e devolve o plugin removido."""
+    plugin = EXTRACTORS.pop(name)
+    _PLAN_CACHE.clear()
+    return plugin
+
+
+def extraction_plan(needed: Optional[np.ndarray] = None) -> Tuple[ExtractorPlugin, ...]:
+    """
+    Extractors a executar, na ordem de registro: só os que produzem alguma
+    feature marcada em `needed` (máscara bool por FEATURE_NAMES). Sem máscara,
+    todos.
+    """
+    if needed is None:
+        return tuple(EXTRACTORS.values())
+    key = np.asarray(needed, dtype=bool).tobytes()
+    plan = _PLAN_CACHE.get(key)
+    if plan is None:
+        plan = _PLAN_CACHE[key] = tuple(p for p in EXTRACTORS.values() if needed[p.columns].any())
+    return plan
 
 # ---------------------------
 # Extractors (simples/mockáveis)
 # ---------------------------
 
-def extract_device_features(payload: Dict[str, Any]) -> Dict[str, FeatureValue]:
+def _read_device(payload: Dict[str, Any]) -> Tuple[bool, bool, int]:
+    device = payload.get("device", {})
+    return (
+        bool(device.get("seen_before", False)),
+        bool(device.get("emulator", False)),
+        int(device.get("switches_24h", 0)),
+    )
+
+def _device_matrix(raw: np.ndarray) -> np.ndarray:
+    return np.column_stack((
+        np.where(raw[:, 0] != 0, 0.5, -0.1),
+        np.where(raw[:, 1] != 0, -0.7, 0.0),
+        -np.minimum(raw[:, 2] * 0.15, 1.0),
+    ))
+
+@register_extractor(
+    "device",
+    inputs=("device.seen_before", "device.emulator", "device.switches_24h"),
+    outputs=("device_trust", "emulator_flag", "velocity_device_switch"),
+    read_raw=_read_device,
+    vectorized=_device_matrix,
+)
+def extract_device_features(payload: Dict[str, Any], features: Optional[FeatureSet] = None) -> FeatureSet:
     """
     Exemplos de sinais:
       - device_trust: se fingerprint visto antes para o mesmo user
       - emulator_flag: heurística anti-emulador
       - velocity_device_switch: troca rápida de dispositivos
     """
-    seen_before = bool(payload.get("device", {}).get("seen_before", False))
-    emulator = bool(payload.get("device", {}).get("emulator", False))
-    device_switches_24h = int(payload.get("device", {}).get("switches_24h", 0))
-
-    return {
-        "device_trust": FeatureValue(
-            "device_trust",
-            value=0.5 if seen_before else -0.1,
-            detail={"seen_before": seen_before},
-        ),
-        "emulator_flag": FeatureValue(
-            "emulator_flag",
-            value=-0.7 if emulator else 0.0,
-            detail={"emulator": emulator},
-        ),
-        "velocity_device_switch": FeatureValue(
-            "velocity_device_switch",
-            value=-min(device_switches_24h * 0.15, 1.0),
-            detail={"switches_24h": device_switches_24h},
-        ),
-    }
-
-def extract_behavior_features(payload: Dict[str, Any]) -> Dict[str, FeatureValue]:
+    fs = features if features is not None else FeatureSet()
+    seen_before, emulator, device_switches_24h = _read_device(payload)
+
+    fs.set("device_trust", 0.5 if seen_before else -0.1, seen_before)
+    fs.set("emulator_flag", -0.7 if emulator else 0.0, emulator)
+    fs.set("velocity_device_switch", -min(device_switches_24h * 0.15, 1.0), device_switches_24h)
+    return fs
+
+def _read_behavior(payload: Dict[str, Any]) -> Tuple[float, float, int]:
+    behavior = payload.get("behavior", {})
+    return (
+        float(behavior.get("session_time_s", 0.0)),
+        float(behavior.get("avg_scroll_speed", 0.0)),
+        int(behavior.get("click_burst", 0)),
+    )
+
+def _behavior_matrix(raw: np.ndarray) -> np.ndarray:
+    return np.column_stack((
+        np.minimum(raw[:, 0] / 30.0, 1.0) - 0.1,
+        np.minimum(raw[:, 1] / 2000.0, 1.0) - 0.1,
+        -np.minimum(raw[:, 2] * 0.2, 1.0),
+    ))
+
+@register_extractor(
+    "behavior",
+    inputs=("behavior.session_time_s", "behavior.avg_scroll_speed", "behavior.click_burst"),
+    outputs=("dwell_time", "scroll_natural", "click_burst"),
+    read_raw=_read_behavior,
+    vectorized=_behavior_matrix,
+)
+def extract_behavior_features(payload: Dict[str, Any], features: Optional[FeatureSet] = None) -> FeatureSet:
     """
     Sinais comportamentais:
       - session_time_s (tempo de sessão)
       - avg_scroll_speed
       - click_burst (rajadas de clique)
     """
-    t = float(payload.get("behavior", {}).get("session_time_s", 0.0))
-    scroll = float(payload.get("behavior", {}).get("avg_scroll_speed", 0.0))
-    click_burst = int(payload.get("behavior", {}).get("click_burst", 0))
+    fs = features if features is not None else FeatureSet()
+    t, scroll, click_burst = _read_behavior(payload)
 
-    value_time = min(t / 30.0, 1.0) - 0.1  # <30s pode ser suspeito leve
-    value_scroll = min(scroll / 2000.0, 1.0) - 0.1  # sem scroll pode ser roteirizado
-    value_click_burst = -min(click_burst * 0.2, 1.0)
+    fs.set("dwell_time", min(t / 30.0, 1.0) - 0.1, t)  # <30s pode ser suspeito leve
+    fs.set("scroll_natural", min(scroll / 2000.0, 1.0) - 0.1, scroll)  # sem scroll pode ser roteirizado
+    fs.set("click_burst", -min(click_burst * 0.2, 1.0), click_burst)
+    return fs
 
-    return {
-        "dwell_time": FeatureValue("dwell_time", value=value_time, detail={"seconds": t}),
-        "scroll_natural": FeatureValue("scroll_natural", value=value_scroll, detail={"avg_scroll_speed": scroll}),
-        "click_burst": FeatureValue("click_burst", value=value_click_burst, detail={"burst": click_burst}),
-    }
+def _read_geo(payload: Dict[str, Any]) -> Tuple[float, bool, float]:
+    geo = payload.get("geo", {})
+    return (
+        float(geo.get("ip_distance_home_km", 0.0)),
+        bool(geo.get("proxy", False)),
+        float(geo.get("geo_velocity", 0.0)),  # km/h estimado
+    )
 
-def extract_geo_features(payload: Dict[str, Any]) -> Dict[str, FeatureValue]:
+def _geo_matrix(raw: np.ndarray) -> np.ndarray:
+    return np.column_stack((
+        -np.minimum(raw[:, 0] / 2000.0, 1.0),
+        np.where(raw[:, 1] != 0, -0.6, 0.0),
+        -np.minimum(raw[:, 2] / 800.0, 1.0),
+    ))
+
+@register_extractor(
+    "geo",
+    inputs=("geo.ip_distance_home_km", "geo.proxy", "geo.geo_velocity"),
+    outputs=("ip_distance", "proxy_flag", "geo_velocity"),
+    read_raw=_read_geo,
+    vectorized=_geo_matrix,
+)
+def extract_geo_features(payload: Dict[str, Any], features: Optional[FeatureSet] = None) -> FeatureSet:
     """
     Sinais de geolocalização:
       - ip_distance_home_km: distância do local habitual
       - proxy_flag: uso de proxy/vpn
       - geo_velocity: salto geográfico em pouco tempo
     """
-    dist = float(payload.get("geo", {}).get("ip_distance_home_km", 0.0))
-    proxy = bool(payload.get("geo", {}).get("proxy", False))
-    geo_velocity = float(payload.get("geo", {}).get("geo_velocity", 0.0))  # km/h estimado
+    fs = features if features is not None else FeatureSet()
+    dist, proxy, geo_velocity = _read_geo(payload)
+
+    fs.set("ip_distance", -min(dist / 2000.0, 1.0), dist)
+    fs.set("proxy_flag", -0.6 if proxy else 0.0, proxy)
+    fs.set("geo_velocity", -min(geo_velocity / 800.0, 1.0), geo_velocity)
+    return fs
 
-    return {
-        "ip_distance": FeatureValue("ip_distance", value=-min(dist / 2000.0, 1.0), detail={"km": dist}),
-        "proxy_flag": FeatureValue("proxy_flag", value=-0.6 if proxy else 0.0, detail={"proxy": proxy}),
-        "geo_velocity": FeatureValue("geo_velocity", value=-min(geo_velocity / 800.0, 1.0), detail={"kmh": geo_velocity}),
-    }
+def _read_biometrics(payload: Dict[str, Any]) -> Tuple[float, float]:
+    bio = payload.get("biometrics", {})
+    return float(bio.get("face_match_score", 0.0)), float(bio.get("liveness_score", 0.0))
 
-def extract_biometrics_features(payload: Dict[str, Any]) -> Dict[str, FeatureValue]:
+def _biometrics_matrix(raw: np.ndarray) -> np.ndarray:
+    return np.maximum(np.minimum((raw - 0.5) * 2.0, 1.0), -1.0)
+
+@register_extractor(
+    "biometrics",
+    inputs=("biometrics.face_match_score", "biometrics.liveness_score"),
+    outputs=("face_match", "liveness"),
+    read_raw=_read_biometrics,
+    vectorized=_biometrics_matrix,
+)
+def extract_biometrics_features(payload: Dict[str, Any], features: Optional[FeatureSet] = None) -> FeatureSet:
     """
     Sinais biométricos:
       - face_match_score: 0..1 (provider externo)
       - liveness_score: 0..1
     """
-    match = float(payload.get("biometrics", {}).get("face_match_score", 0.0))
-    live = float(payload.get("biometrics", {}).get("liveness_score", 0.0))
+    fs = features if features is not None else FeatureSet()
+    match, live = _read_biometrics(payload)
 
     # normaliza para -1..1 ao redor de 0.5
     def center(x): return max(min((x - 0.5) * 2.0, 1.0), -1.0)
 
-    return {
-        "face_match": FeatureValue("face_match", value=center(match), confidence=0.9, detail={"match": match}),
-        "liveness": FeatureValue("liveness", value=center(live), confidence=0.9, detail={"liveness": live}),
-    }
+    fs.set("face_match", center(match), match)
+    fs.set("liveness", center(live), live)
+    return fs
+
+def extract_features(payload: Dict[str, Any], plan: Optional[Sequence[ExtractorPlugin]] = None) -> FeatureSet:
+    """
+    Roda só os extractors do plano (ver extraction_plan). Features de
+    extractors fora do plano ficam zeradas, sem ler o payload.
+    """
+    fs = FeatureSet()
+    for plugin in (plan if plan is not None else EXTRACTORS.values()):
+        plugin.extract(payload, fs)
+    return fs
 
 def extract_all_features(payload: Dict[str, Any]) -> FeatureSet:
-    return FeatureSet(
-        device=extract_device_features(payload),
-        behavior=extract_behavior_features(payload),
-        geo=extract_geo_features(payload),
-        biometrics=extract_biometrics_features(payload),
-    )
+    return extract_features(payload)
+
+# ---------------------------
+# Modo batch (vetorizado)
+# ---------------------------
+
+def _raw_row(payload: Dict[str, Any], plan: Optional[Sequence[ExtractorPlugin]] = None) -> Tuple[Any, ...]:
+    # Entradas brutas do payload, com as mesmas conversões dos extractors,
+    # na ordem das colunas de _plan_columns(plan).
+    row: Tuple[Any, ...] = ()
+    for plugin in (plan if plan is not None else EXTRACTORS.values()):
+        row += plugin.read_raw(payload)
+    return row
+
+def _plan_columns(plan: Sequence[ExtractorPlugin]) -> List[int]:
+    return [column for plugin in plan for column in plugin.columns]
+
+def read_raw_matrix(payloads: Sequence[Dict[str, Any]], plan: Optional[Sequence[ExtractorPlugin]] = None) -> np.ndarray:
+    """
+    Lê as entradas brutas de N payloads numa matriz float (N, N_FEATURES),
+    uma coluna por feature. É a única etapa do modo batch que percorre dicts.
+    Com `plan`, só os grupos do plano são lidos; as demais colunas ficam 0.
+    """
+    plan = tuple(plan) if plan is not None else extraction_plan()
+    n = len(payloads)
+    columns = _plan_columns(plan)
+    rows = np.array([_raw_row(p, plan) for p in payloads], dtype=np.float64).reshape(n, len(columns))
+    if len(columns) == N_FEATURES and columns == list(range(N_FEATURES)):
+        return rows
+    raw = np.zeros((n, N_FEATURES), dtype=np.float64)
+    raw[:, columns] = rows
+    return raw
+
+def features_from_raw(
+    raw: np.ndarray,
+    plan: Optional[Sequence[ExtractorPlugin]] = None,
+    payloads: Optional[Sequence[Dict[str, Any]]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calcula (values, confidences) a partir da matriz de read_raw_matrix,
+    com os mesmos valores que extract_features(payload, plan) produziria
+    payload a payload: features fora do plano ficam 0. Extractors sem
+    versão vetorizada rodam o extract escalar, e para isso precisam dos
+    `payloads` que geraram `raw`.
+    """
+    plan = tuple(plan) if plan is not None else extraction_plan()
+    values = np.zeros_like(raw)
+    for plugin in plan:
+        columns = plugin.columns
+        if plugin.vectorized is not None:
+            values[:, columns] = plugin.vectorized(raw[:, columns])
+            continue
+        if payloads is None:
+            raise ValueError(f"Extractor {plugin.name} não tem versão vetorizada; passe os payloads")
+        for i, payload in enumerate(payloads):
+            values[i, columns] = plugin.extract(payload, FeatureSet()).values[columns]
+
+    confidences = np.broadcast_to(FEATURE_CONFIDENCES, values.shape)
+    return values, confidences
+
+def extract_feature_matrix(
+    payloads: Sequence[Dict[str, Any]],
+    plan: Optional[Sequence[ExtractorPlugin]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Extrai as features de N payloads de uma vez.
+    Retorna (values, confidences), ambos com shape (N, N_FEATURES).
+    """
+    plan = tuple(plan) if plan is not None else extraction_plan()
+    return features_from_raw(read_raw_matrix(payloads, plan), plan, payloads)
@@ -0,0 +1,228 @@
+from __future__ import annotations
+import logging
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .features import N_FEATURES, features_from_raw, read_raw_matrix
+from .profiles import ProfileBundle, WeightProfile, resolve_bundle
+from .rules import DEFAULT_RULESET, CompiledRuleSet, HardRule, compile_rules
+from .scoring import BatchScores, ScoreResult, assemble_results, required_extractors, score_feature_matrix
+
+logger = logging.getLogger(__name__)
+
+
+# --------------------------
+# Layout do bloco de memória compartilhada
+# --------------------------
+@dataclass(frozen=True)
+class _ChunkLayout:
+    """
+    Um bloco por chunk: entrada (matriz bruta + condições de payload das hard
+    rules) e saída (arrays de BatchScores), cada array alinhado a 8 bytes.
+    """
+    n: int
+    n_conds: int
+    top_k: int
+    n_shadows: int
+
+    def _fields(self) -> List[Tuple[str, np.dtype, Tuple[int, ...]]]:
+        return [
+            ("raw", np.dtype(np.float64), (self.n, N_FEATURES)),
+            ("conds", np.dtype(np.bool_), (self.n, self.n_conds)),
+            ("scores", np.dtype(np.int64), (self.n,)),
+            ("status_idx", np.dtype(np.int8), (self.n,)),
+            ("fired", np.dtype(np.int16), (self.n,)),
+            ("reason_idx", np.dtype(np.int16), (self.n, self.top_k)),
+            ("reason_val", np.dtype(np.float64), (self.n, self.top_k)),
+            ("shadow_scores", np.dtype(np.int64), (self.n, self.n_shadows)),
+        ]
+
+    @property
+    def size(self) -> int:
+        offset = 0
+        for _, dtype, shape in self._fields():
+            offset += _aligned(int(np.prod(shape)) * dtype.itemsize)
+        return max(offset, 1)
+
+    def views(self, buf) -> Dict[str, np.ndarray]:
+        out, offset = {}, 0
+        for name, dtype, shape in self._fields():
+            count = int(np.prod(shape))
+            out[name] = np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset) if count else np.zeros(shape, dtype)
+            offset += _aligned(count * dtype.itemsize)
+        return out
+
+
+def _aligned(nbytes: int) -> int:
+    return (nbytes + 7) & ~7
+
+
+# --------------------------
+# Lado do worker
+# --------------------------
+_worker_state: Dict[str, Any] = {}
+
+
+def _init_worker(profiles: List[Dict[str, Any]], rules: Tuple[HardRule, ...]) -> None:
+    # Perfis e regras são recompilados no worker (vetores e operadores não
+    # precisam ser serializados).
+    compiled = [WeightProfile.from_config(config) for config in profiles]
+    _worker_state["bundle"] = ProfileBundle.compile(compiled[0], compiled[1:])
+    _worker_state["ruleset"] = compile_rules(rules)
+    _worker_state["plan"] = required_extractors(_worker_state["bundle"], _worker_state["ruleset"])
+
+
+def _score_chunk(shm_name: str, layout: _ChunkLayout) -> None:
+    shm = SharedMemory(name=shm_name)
+    try:
+        views = layout.views(shm.buf)
+        bundle, ruleset = _worker_state["bundle"], _worker_state["ruleset"]
+        values, confidences = features_from_raw(views["raw"], _worker_state["plan"])
+        fired = ruleset.fired_indices(views["conds"], values)
+        batch = score_feature_matrix(values, confidences, fired, bundle, ruleset, layout.top_k)
+        views["scores"][:] = batch.scores
+        views["status_idx"][:] = batch.status_idx
+        views["fired"][:] = batch.fired
+        views["reason_idx"][:] = batch.reason_idx
+        views["reason_val"][:] = batch.reason_val
+        if batch.shadow_scores is not None:
+            views["shadow_scores"][:] = batch.shadow_scores
+        del views  # libera os buffers antes de fechar o bloco
+    finally:
+        shm.close()
+
+
+# --------------------------
+# Lado do processo principal
+# --------------------------
+@dataclass
+class _PendingChunk:
+    payloads: Sequence[Dict[str, Any]]
+    shm: SharedMemory
+    layout: _ChunkLayout
+    future: Future
+
+
+class ParallelScorer:
+    """
+    Pontua grandes volumes (replays, backfills) em todos os cores.
+
+    O processo principal só lê as entradas brutas de cada chunk para um bloco
+    de memória compartilhada; os workers calculam features, hard rules, score
+    e razões sobre esse bloco e escrevem a saída nele. Nenhum payload é
+    serializado entre processos e os resultados saem na ordem de entrada.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        chunk_size: int = 4096,
+        weights: Union[None, Dict[str, float], WeightProfile] = None,
+        shadows: Optional[Sequence[Union[Dict[str, float], WeightProfile]]] = None,
+        rules: Optional[CompiledRuleSet] = None,
+        top_k: int = 5,
+        max_in_flight: Optional[int] = None,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.top_k = top_k
+        self.max_in_flight = max_in_flight or self.workers * 2
+        self.bundle = resolve_bundle(weights, shadows)
+        self.ruleset = rules if rules is not None else DEFAULT_RULESET
+        self._plan = required_extractors(self.bundle, self.ruleset)
+        scalar_only = [p.name for p in self._plan if p.vectorized is None]
+        if scalar_only:
+            # Os workers só recebem a matriz bruta, não os payloads
+            raise ValueError(f"ParallelScorer exige extractors vetorizados: {', '.join(scalar_only)}")
+        profiles = [p.to_config() for p in (self.bundle.champion,) + self.bundle.shadows]
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(profiles, self.ruleset.rules),
+        )
+
+    def __enter__(self) -> "ParallelScorer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+
+    def score_iter(self, payloads: Iterable[Dict[str, Any]]) -> Iterator[ScoreResult]:
+        """Pontua um iterável (possivelmente infinito) de payloads, em ordem."""
+        pending: Deque[_PendingChunk] = deque()
+        it = iter(payloads)
+        try:
+            while True:
+                chunk = list(islice(it, self.chunk_size))
+                if not chunk:
+                    break
+                pending.append(self._submit(chunk))
+                while len(pending) >= self.max_in_flight:
+                    yield from self._collect(pending.popleft())
+            while pending:
+                yield from self._collect(pending.popleft())
+        finally:
+            # Gerador interrompido ou erro: libera os blocos ainda pendentes
+            for item in pending:
+                item.future.cancel()
+                try:
+                    item.future.exception()
+                except Exception:
+                    pass
+                _release(item.shm)
+
+    def _submit(self, chunk: List[Dict[str, Any]]) -> _PendingChunk:
+        conds = self.ruleset.payload_conditions(chunk)
+        layout = _ChunkLayout(len(chunk), conds.shape[1], self.top_k, len(self.bundle.shadows))
+        shm = SharedMemory(create=True, size=layout.size)
+        try:
+            views = layout.views(shm.buf)
+            views["raw"][:] = read_raw_matrix(chunk, self._plan)
+            views["conds"][:] = conds
+            del views
+            future = self._pool.submit(_score_chunk, shm.name, layout)
+        except BaseException:
+            _release(shm)
+            raise
+        return _PendingChunk(chunk, shm, layout, future)
+
+    def _collect(self, item: _PendingChunk) -> List[ScoreResult]:
+        try:
+            item.future.result()
+            views = item.layout.views(item.shm.buf)
+            batch = BatchScores(
+                scores=views["scores"].copy(),
+                status_idx=views["status_idx"].copy(),
+                fired=views["fired"].copy(),
+                reason_idx=views["reason_idx"].copy(),
+                reason_val=views["reason_val"].copy(),
+                shadow_scores=views["shadow_scores"].copy() if self.bundle.shadows else None,
+            )
+            del views
+        finally:
+            _release(item.shm)
+        return assemble_results(item.payloads, batch, self.bundle, self.ruleset)
+
+
+def _release(shm: SharedMemory) -> None:
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def score_payloads_parallel(payloads: Iterable[Dict[str, Any]], **kwargs) -> Iterator[ScoreResult]:
+    """Atalho: cria um ParallelScorer, pontua tudo em ordem e encerra o pool."""
+    with ParallelScorer(**kwargs) as scorer:
+        yield from scorer.score_iter(payloads)
@@ -0,0 +1,242 @@
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .calibration import CalibrationTable, calibration_from_config
+from .rules import DEFAULT_WEIGHTS, weight_vector
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_VERSION = "v0.1.0"
+
+
+@dataclass(frozen=True, eq=False)
+class WeightProfile:
+    """
+    Pesos compilados uma única vez: vetor alinhado a FEATURE_NAMES, constante
+    de normalização e, opcionalmente, a tabela de calibração aprendida para
+    esses pesos (sem ela vale a escala linear de _calibrate_score).
+    """
+    version: str
+    weights: Mapping[str, float]
+    vector: np.ndarray
+    max_abs_weight: float
+    calibration: Optional[CalibrationTable] = None
+
+    @classmethod
+    def compile(
+        cls,
+        weights: Mapping[str, float],
+        version: Optional[str] = None,
+        calibration: Optional[CalibrationTable] = None,
+    ) -> "WeightProfile":
+        clean = {str(k): float(v) for k, v in weights.items()}
+        vector = weight_vector(clean)
+        vector.flags.writeable = False
+        return cls(
+            version=version or _fingerprint(clean),
+            weights=MappingProxyType(clean),
+            vector=vector,
+            max_abs_weight=max(1.0, sum(abs(v) for v in clean.values()) / 2.0),
+            calibration=calibration,
+        )
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any]) -> "WeightProfile":
+        """
+        Formato: {"version": "v0.2.0", "weights": {"device_trust": 0.35, ...},
+                  "calibration": {"version": ..., "knots": [...], "values": [...]}}
+        ("calibration" é opcional)
+        """
+        weights = config.get("weights")
+        if not isinstance(weights, Mapping) or not weights:
+            raise ValueError("Perfil de pesos sem o campo 'weights'")
+        return cls.compile(
+            weights,
+            version=config.get("version"),
+            calibration=calibration_from_config(config.get("calibration")),
+        )
+
+    def to_config(self) -> dict:
+        config = {"version": self.version, "weights": dict(self.weights)}
+        if self.calibration is not None:
+            config["calibration"] = self.calibration.to_config()
+        return config
+
+    @classmethod
+    def from_file(cls, path: str) -> "WeightProfile":
+        with open(path, "r", encoding="utf-8") as fh:
+            return cls.from_config(json.load(fh))
+
+
+def _fingerprint(weights: Mapping[str, float]) -> str:
+    # Versão derivada do conteúdo para pesos passados sem versão explícita.
+    digest = hashlib.sha1(json.dumps(sorted(weights.items())).encode()).hexdigest()
+    return f"custom-{digest[:8]}"
+
+
+DEFAULT_PROFILE = WeightProfile.compile(DEFAULT_WEIGHTS, version=DEFAULT_MODEL_VERSION)
+
+
+@dataclass(frozen=True, eq=False)
+class ProfileBundle:
+    """
+    Perfil champion (decide a ação) e perfis shadow avaliados em paralelo,
+    empilhados numa matriz (1 + K, F) para um único produto com as features.
+    active_features marca as features com peso não nulo em algum perfil.
+    """
+    champion: WeightProfile
+    shadows: Tuple[WeightProfile, ...]
+    matrix: np.ndarray
+    max_abs_weights: np.ndarray
+    active_features: np.ndarray
+
+    @classmethod
+    def compile(cls, champion: WeightProfile, shadows: Sequence[WeightProfile] = ()) -> "ProfileBundle":
+        shadows = tuple(shadows)
+        profiles = (champion,) + shadows
+        matrix = np.vstack([p.vector for p in profiles])
+        max_abs = np.array([p.max_abs_weight for p in profiles], dtype=np.float64)
+        active = np.any(matrix != 0, axis=0)
+        for array in (matrix, max_abs, active):
+            array.flags.writeable = False
+        return cls(
+            champion=champion,
+            shadows=shadows,
+            matrix=matrix,
+            max_abs_weights=max_abs,
+            active_features=active,
+        )
+
+
+class ProfileStore:
+    """
+    Guarda o perfil ativo e os perfis shadow. A troca é uma única atribuição
+    de referência, então leitores nunca veem um estado pela metade e não
+    precisam de lock.
+    """
+
+    def __init__(self, profile: WeightProfile = DEFAULT_PROFILE):
+        self._bundle = ProfileBundle.compile(profile)
+        self._lock = threading.Lock()
+        self._path: Optional[str] = None
+        self._mtime: Optional[float] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def active(self) -> WeightProfile:
+        return self._bundle.champion
+
+    @property
+    def bundle(self) -> ProfileBundle:
+        return self._bundle
+
+    def swap(self, profile: WeightProfile) -> WeightProfile:
+        """Troca o perfil ativo (mantendo os shadows) e retorna o anterior."""
+        return self._install(profile)
+
+    def _install(self, profile: WeightProfile, path: Optional[str] = None,
+                 mtime: Optional[float] = None) -> WeightProfile:
+        # Perfil e origem (arquivo/mtime) mudam juntos, sob o mesmo lock
+        with self._lock:
+            previous = self._bundle.champion
+            self._bundle = ProfileBundle.compile(profile, self._bundle.shadows)
+            if path is not None:
+                self._path, self._mtime = path, mtime
+        logger.info("Perfil de pesos ativo: %s -> %s", previous.version, profile.version)
+        return previous
+
+    def set_shadows(self, shadows: Sequence[WeightProfile]) -> None:
+        """Define os perfis avaliados em shadow junto com o ativo."""
+        with self._lock:
+            self._bundle = ProfileBundle.compile(self._bundle.champion, shadows)
+        logger.info("Perfis shadow: %s", [p.version for p in self._bundle.shadows])
+
+    def load_config(self, config: Mapping[str, Any]) -> WeightProfile:
+        profile = WeightProfile.from_config(config)
+        self.swap(profile)
+        return profile
+
+    def load_file(self, path: str) -> WeightProfile:
+        mtime = os.path.getmtime(path)
+        profile = WeightProfile.from_file(path)
+        self._install(profile, path, mtime)
+        return profile
+
+    def reload_if_changed(self) -> bool:
+        """Recarrega o arquivo carregado por load_file se ele mudou."""
+        if self._path is None:
+            return False
+        try:
+            mtime = os.path.getmtime(self._path)
+            if mtime == self._mtime:
+                return False
+            self.load_file(self._path)
+            return True
+        except (OSError, ValueError) as e:
+            # Arquivo inválido ou em escrita: mantém o perfil atual
+            logger.error("Falha ao recarregar perfil de pesos %s: %s", self._path, e)
+            return False
+
+    def watch(self, path: str, interval_s: float = 5.0) -> None:
+        """Carrega o arquivo e passa a recarregá-lo em background quando mudar."""
+        self.load_file(path)
+        if self._watcher is not None:
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval_s):
+                self.reload_if_changed()
+
+        self._watcher = threading.Thread(target=loop, name="weight-profile-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+
+profile_store = ProfileStore()
+
+
+def get_active_profile() -> WeightProfile:
+    return profile_store.active
+
+
+def resolve_profile(weights: Union[None, Mapping[str, float], WeightProfile]) -> WeightProfile:
+    """Normaliza o argumento `weights` aceito pelo scoring em um WeightProfile."""
+    if isinstance(weights, WeightProfile):
+        return weights
+    if not weights:
+        return profile_store.active
+    return WeightProfile.compile(weights)
+
+
+def resolve_bundle(
+    weights: Union[None, Mapping[str, float], WeightProfile],
+    shadows: Optional[Sequence[Union[Mapping[str, float], WeightProfile]]] = None,
+) -> ProfileBundle:
+    """
+    Sem argumentos usa o perfil ativo e os shadows do profile_store; caso
+    contrário monta o bundle a partir do champion e shadows informados.
+    """
+    if shadows is None:
+        if not isinstance(weights, WeightProfile) and not weights:
+            return profile_store.bundle
+        shadows = ()
+    return ProfileBundle.compile(
+        resolve_profile(weights),
+        [s if isinstance(s, WeightProfile) else WeightProfile.compile(s) for s in shadows],
+    )
@@ -1,6 +1,11 @@
 from __future__ import annotations
-from typing import Dict, Tuple
-from .features import FeatureSet, FeatureValue
+import operator
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .features import FeatureSet, FEATURE_INDEX, FEATURE_NAMES
 
 # Pesos padrão (podem vir de config externa)
 DEFAULT_WEIGHTS: Dict[str, float] = {
@@ -21,31 +26,303 @@ DEFAULT_WEIGHTS: Dict[str, float] = {
     "liveness": 0.55,
 }
 
+# ---------------------------
 # Regras duras (hard rules) que podem “forçar” decisão
-def hard_rules(feature_set: FeatureSet) -> Tuple[bool, str]:
-    # Ex.: emulador + proxy forte => block imediato
-    emulator = feature_set.device.get("emulator_flag")
-    proxy = feature_set.geo.get("proxy_flag")
-    if emulator and emulator.value < -0.5 and proxy and proxy.value < -0.5:
-        return True, "HARD_BLOCK_EMULATOR_PROXY"
-    return False, ""
+# ---------------------------
+
+FEATURE_FIELD_PREFIX = "features."
+
+_OPS: Dict[str, Callable[[Any, Any], bool]] = {
+    "truthy": lambda v, _: bool(v),
+    "falsy": lambda v, _: not v,
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "gt": operator.gt,
+    "ge": operator.ge,
+    "lt": operator.lt,
+    "le": operator.le,
+    "in": lambda v, ref: v in ref,
+}
+
+# Mesmos operadores sobre colunas float de features (modo batch)
+_VECTOR_OPS: Dict[str, Callable[[np.ndarray, Any], np.ndarray]] = {
+    "truthy": lambda a, _: a != 0,
+    "falsy": lambda a, _: a == 0,
+    "eq": np.equal,
+    "ne": np.not_equal,
+    "gt": np.greater,
+    "ge": np.greater_equal,
+    "lt": np.less,
+    "le": np.less_equal,
+    "in": lambda a, ref: np.isin(a, list(ref)),
+}
+
+@dataclass(frozen=True)
+class Condition:
+    """
+    Predicado sobre um campo bruto do payload ("device.emulator") ou sobre o
+    valor de uma feature ("features.emulator_flag").
+    """
+    field: str
+    op: str = "truthy"
+    value: Any = None
+
+@dataclass(frozen=True)
+class HardRule:
+    code: str
+    conditions: Tuple[Condition, ...]
+    force_block: bool = True  # False: só adiciona a razão, sem forçar BLOCK
 
-def weighted_sum(feature_set: FeatureSet, weights: Dict[str, float]) -> Tuple[float, Dict[str, float]]:
+# Ex.: emulador + proxy forte. Mesma condição da hard_rules original (sobre
+# os valores das features): só anota a razão (contribuição -999) e mantém o
+# score calculado.
+DEFAULT_HARD_RULES: Tuple[HardRule, ...] = (
+    HardRule(
+        "HARD_BLOCK_EMULATOR_PROXY",
+        (Condition("features.emulator_flag", "lt", -0.5), Condition("features.proxy_flag", "lt", -0.5)),
+        force_block=False,
+    ),
+)
+
+# Variante opt-in que força BLOCK: lê os campos brutos, então dispara antes da
+# extração de features (short-circuit). Use com calculate_score(..., rules=BLOCKING_RULESET).
+BLOCKING_HARD_RULES: Tuple[HardRule, ...] = (
+    HardRule(
+        "HARD_BLOCK_EMULATOR_PROXY",
+        (Condition("device.emulator"), Condition("geo.proxy")),
+        force_block=True,
+    ),
+)
+
+class CompiledRuleSet:
+    """
+    Regras compiladas numa estrutura plana: cada campo distinto vira um slot
+    lido uma única vez, e cada regra vira uma tupla de (slot, op, valor).
+
+    - Estágio "payload": regras de BLOCK que só tocam campos brutos; rodam
+      antes da extração de features e permitem short-circuit.
+    - Estágio "features": demais regras, avaliadas após a extração.
+    Em cada estágio as regras de BLOCK vêm antes das que só anotam razão.
+    """
+
+    def __init__(self, rules: Sequence[HardRule]):
+        self.rules: Tuple[HardRule, ...] = tuple(rules)
+        payload_fields: List[str] = []
+        feature_fields: List[str] = []
+        for rule in self.rules:
+            for cond in rule.conditions:
+                if cond.op not in _OPS:
+                    raise ValueError(f"Operador desconhecido na regra {rule.code}: {cond.op}")
+                if cond.field.startswith(FEATURE_FIELD_PREFIX):
+                    name = cond.field[len(FEATURE_FIELD_PREFIX):]
+                    if name not in FEATURE_INDEX:
+                        raise ValueError(f"Feature desconhecida na regra {rule.code}: {name}")
+                    if cond.field not in feature_fields:
+                        feature_fields.append(cond.field)
+                elif cond.field not in payload_fields:
+                    payload_fields.append(cond.field)
+
+        # Slots: campos do payload primeiro, depois features
+        self.fields: Tuple[str, ...] = tuple(payload_fields + feature_fields)
+        self._slot = {f: i for i, f in enumerate(self.fields)}
+        self._paths = tuple(tuple(f.split(".")) for f in payload_fields)
+        self._feature_cols = tuple(
+            FEATURE_INDEX[f[len(FEATURE_FIELD_PREFIX):]] for f in feature_fields
+        )
+        # Máscara (por FEATURE_NAMES) das features que as regras leem
+        self.feature_mask = np.zeros(len(FEATURE_NAMES), dtype=bool)
+        self.feature_mask[list(self._feature_cols)] = True
+        self.feature_mask.flags.writeable = False
+
+        # Índice campo -> regras que o tocam
+        rules_by_field: Dict[str, List[int]] = {f: [] for f in self.fields}
+        for i, rule in enumerate(self.rules):
+            for cond in rule.conditions:
+                if i not in rules_by_field[cond.field]:
+                    rules_by_field[cond.field].append(i)
+        self.rules_by_field: Dict[str, Tuple[int, ...]] = {f: tuple(v) for f, v in rules_by_field.items()}
+
+        n_payload = len(payload_fields)
+        pre, post = [], []
+        for rule in sorted(self.rules, key=lambda r: not r.force_block):
+            program = tuple((self._slot[c.field], _OPS[c.op], c.value) for c in rule.conditions)
+            payload_only = all(slot < n_payload for slot, _, _ in program)
+            (pre if rule.force_block and payload_only else post).append((rule, program))
+        self._pre = tuple(pre)
+        self._post = tuple(post)
+
+        # Programa do modo batch, na mesma ordem de avaliação (pre + post):
+        # condições de payload viram colunas de uma matriz booleana e as de
+        # features viram operações vetorizadas sobre a matriz de features.
+        self.ordered_rules: Tuple[HardRule, ...] = tuple(rule for rule, _ in self._pre + self._post)
+        self.ordered_force_block = np.array([r.force_block for r in self.ordered_rules], dtype=bool)
+        payload_conds: List[Tuple[int, Callable[[Any, Any], bool], Any]] = []
+        matrix_program = []
+        for rule in self.ordered_rules:
+            cols, feature_conds = [], []
+            for c in rule.conditions:
+                slot = self._slot[c.field]
+                if slot < n_payload:
+                    cols.append(len(payload_conds))
+                    payload_conds.append((slot, _OPS[c.op], c.value))
+                else:
+                    feature_conds.append((self._feature_cols[slot - n_payload], _VECTOR_OPS[c.op], c.value))
+            matrix_program.append((tuple(cols), tuple(feature_conds)))
+        self._payload_conds = tuple(payload_conds)
+        self._matrix_program = tuple(matrix_program)
+
+    @property
+    def feature_names(self) -> Tuple[str, ...]:
+        """Features necessárias às regras do estágio pós-extração."""
+        return tuple(FEATURE_NAMES[i] for i in self._feature_cols)
+
+    def read_payload(self, payload: Dict[str, Any]) -> List[Any]:
+        """Lê cada campo bruto uma vez; os slots de features ficam em None."""
+        slots: List[Any] = []
+        for path in self._paths:
+            v: Any = payload
+            for key in path:
+                v = v.get(key) if isinstance(v, dict) else None
+            slots.append(v)
+        slots.extend([None] * len(self._feature_cols))
+        return slots
+
+    def check_payload(self, slots: List[Any]) -> Optional[HardRule]:
+        """Estágio pré-extração: primeira regra de BLOCK disparada, se houver."""
+        return _first_fired(self._pre, slots)
+
+    def check_features(self, slots: List[Any], feature_set: FeatureSet) -> Optional[HardRule]:
+        """Estágio pós-extração: completa os slots de features e avalia o restante."""
+        if not self._post:
+            return None
+        base = len(self._paths)
+        for k, col in enumerate(self._feature_cols):
+            slots[base + k] = float(feature_set.values[col])
+        return _first_fired(self._post, slots)
+
+    def payload_conditions(self, payloads: Sequence[Dict[str, Any]]) -> np.ndarray:
+        """
+        Avalia as condições sobre campos brutos de N payloads numa matriz
+        booleana (N, C). Não depende das features, então pode ser calculada
+        antes (ou em outro processo) da extração.
+        """
+        conds = self._payload_conds
+        rows = [
+            [_safe(op, slots[slot], ref) for slot, op, ref in conds]
+            for slots in map(self.read_payload, payloads)
+        ] if conds else []
+        return np.array(rows, dtype=bool).reshape(len(payloads), len(conds))
+
+    def fired_indices(self, payload_conds: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """
+        Primeira regra disparada por linha, como índice em ordered_rules
+        (-1 quando nenhuma dispara).
+        """
+        n = values.shape[0]
+        fired = np.full(n, -1, dtype=np.int16)
+        pending = np.ones(n, dtype=bool)
+        for r, (cols, feature_conds) in enumerate(self._matrix_program):
+            mask = pending.copy()
+            for c in cols:
+                mask &= payload_conds[:, c]
+            for col, op, ref in feature_conds:
+                mask &= op(values[:, col], ref)
+            fired[mask] = r
+            pending &= ~mask
+        return fired
+
+    def check_matrix(self, payloads: Sequence[Dict[str, Any]], values: np.ndarray) -> List[Optional[HardRule]]:
+        """Avalia todas as regras para N payloads já extraídos (modo batch)."""
+        fired = self.fired_indices(self.payload_conditions(payloads), values)
+        return [self.ordered_rules[i] if i >= 0 else None for i in fired.tolist()]
+
+def _safe(op: Callable[[Any, Any], bool], v: Any, ref: Any) -> bool:
+    # Campo ausente ou de tipo incompatível não dispara a condição.
+    try:
+        return bool(op(v, ref))
+    except TypeError:
+        return False
+
+def _first_fired(program: Sequence[Tuple[HardRule, Tuple[Any, ...]]], slots: List[Any]) -> Optional[HardRule]:
+    for rule, conds in program:
+        for slot, op, ref in conds:
+            if not _safe(op, slots[slot], ref):
+                break
+        else:
+            return rule
+    return None
+
+def compile_rules(rules: Sequence[HardRule]) -> CompiledRuleSet:
+    return CompiledRuleSet(rules)
+
+DEFAULT_RULESET = compile_rules(DEFAULT_HARD_RULES)
+BLOCKING_RULESET = compile_rules(BLOCKING_HARD_RULES)
+
+def hard_rules(
+    feature_set: FeatureSet,
+    payload: Optional[Dict[str, Any]] = None,
+    ruleset: Optional[CompiledRuleSet] = None,
+) -> Tuple[bool, str]:
+    """
+    Interface antiga sobre o rule set compilado: (disparou, código).
+    Regras sobre campos brutos só disparam se o payload for informado.
+    """
+    ruleset = ruleset if ruleset is not None else DEFAULT_RULESET
+    slots = ruleset.read_payload(payload or {})
+    rule = ruleset.check_payload(slots) or ruleset.check_features(slots, feature_set)
+    return (True, rule.code) if rule is not None else (False, "")
+
+def weighted_sum(
+    feature_set: FeatureSet, weights: Union[Dict[str, float], np.ndarray]
+) -> Tuple[float, Dict[str, float]]:
     """
     Combina atributos por soma ponderada (valor -1..1) * peso.
+    `weights` pode ser um dict ou um vetor já alinhado a FEATURE_NAMES.
     Retorna score_raw e contribuição por feature.
     """
-    contributions: Dict[str, float] = {}
+    score_raw, contributions = weighted_sum_vector(feature_set, weights)
+    return score_raw, dict(zip(FEATURE_NAMES, contributions.tolist()))
+
+def weighted_sum_vector(
+    feature_set: FeatureSet, weights: Union[Dict[str, float], np.ndarray]
+) -> Tuple[Union[float, np.ndarray], np.ndarray]:
+    """
+    Como weighted_sum, mas com as contribuições num vetor alinhado a
+    FEATURE_NAMES (sem montar dict). `weights` também pode ser uma matriz
+    (K, F) com um perfil por linha (champion + shadows); nesse caso retorna
+    score_raw (K,) e contribuições (K, F).
+    """
+    w = weights if isinstance(weights, np.ndarray) else weight_vector(weights)
+    contributions = feature_set.values * w * np.maximum(feature_set.confidences, 0.1)
+    if contributions.ndim == 1:
+        score_raw = sum(contributions.tolist())  # tipicamente na faixa [-Σw, +Σw]
+    else:
+        score_raw = _sum_features(contributions)
+    return score_raw, contributions
 
-    def acc(group: Dict[str, FeatureValue]):
-        for k, f in group.items():
-            w = weights.get(k, 0.0)
-            contributions[k] = f.value * w * max(f.confidence, 0.1)
+def weight_vector(weights: Dict[str, float]) -> np.ndarray:
+    """Alinha um dicionário de pesos à ordem de FEATURE_NAMES."""
+    return np.array([weights.get(k, 0.0) for k in FEATURE_NAMES], dtype=np.float64)
 
-    acc(feature_set.device)
-    acc(feature_set.behavior)
-    acc(feature_set.geo)
-    acc(feature_set.biometrics)
+def weighted_sum_matrix(
+    values: np.ndarray, confidences: np.ndarray, weights: Union[Dict[str, float], np.ndarray]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Versão vetorizada de weighted_sum para uma matriz (N, F) de features.
+    Com pesos (F,) retorna score_raw (N,) e contribuições (N, F); com uma
+    matriz de perfis (K, F) retorna (N, K) e (N, K, F).
+    """
+    w = weights if isinstance(weights, np.ndarray) else weight_vector(weights)
+    factor = np.maximum(confidences, 0.1)
+    if w.ndim == 2:
+        values, factor = values[:, None, :], factor[:, None, :]
+    contributions = values * w * factor
+    return _sum_features(contributions), contributions
 
-    score_raw = sum(contributions.values())  # tipicamente na faixa [-Σw, +Σw]
-    return score_raw, contributions
+def _sum_features(contributions: np.ndarray) -> np.ndarray:
+    # Acumula feature a feature (vetorizado nas demais dimensões) para
+    # reproduzir a ordem da soma escalar e obter exatamente o mesmo float.
+    score_raw = np.zeros(contributions.shape[:-1], dtype=np.float64)
+    for j in range(contributions.shape[-1]):
+        score_raw += contributions[..., j]
+    return score_raw
@@ -1,11 +1,17 @@
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from enum import Enum
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
-from .features import extract_all_features, FeatureSet
-from .rules import DEFAULT_WEIGHTS, weighted_sum, hard_rules
-from .explainability import top_reason_codes
+import numpy as np
+
+from .features import ExtractorPlugin, _raw_row, extract_feature_matrix, extract_features, extraction_plan, FeatureSet, FEATURE_NAMES
+from .rules import DEFAULT_RULESET, CompiledRuleSet, HardRule, weighted_sum_vector, weighted_sum_matrix
+from .profiles import ProfileBundle, WeightProfile, resolve_bundle
+from .calibration import normalize_scores
+from .explainability import top_reason_codes_vector, top_reason_indices
+from ..persistence.cache import ScoreCache
+from ..telemetry.tracing import Trace, start_trace
 
 logger = logging.getLogger(__name__)
 
@@ -49,6 +55,12 @@ class ScoreResult:
 # --------------------------
 # CORE FUNCTIONS
 # --------------------------
+# Faixas de decisão: score >= ALLOW_THRESHOLD libera, >= STEP_UP_THRESHOLD
+# pede autenticação adicional, abaixo disso bloqueia.
+ALLOW_THRESHOLD = 75
+STEP_UP_THRESHOLD = 50
+
+
 def _calibrate_score(score_raw: float, max_abs_weight: float) -> int:
 #    Converte o score bruto (~ -max..+max) para a faixa 0..100.
     if max_abs_weight <= 0:
@@ -61,64 +73,394 @@ def _calibrate_score(score_raw: float, max_abs_weight: float) -> int:
 
 def _map_to_status_action(score: int) -> Tuple[RiskStatus, RecommendedAction]:
 #    Mapeia score para status e ação.
-    if score >= 75:
+    if score >= ALLOW_THRESHOLD:
         return RiskStatus.LEGITIMO, RecommendedAction.ALLOW
-    if score >= 50:
+    if score >= STEP_UP_THRESHOLD:
         return RiskStatus.DESCONFIAVEL, RecommendedAction.STEP_UP_AUTH
     return RiskStatus.ALTO_RISCO, RecommendedAction.BLOCK
 
 
+def _calibrate_scores(score_raw: np.ndarray, max_abs_weight: Union[float, np.ndarray]) -> np.ndarray:
+#    Versão vetorizada de _calibrate_score (np.rint arredonda como round()).
+#    max_abs_weight pode ser um array, um valor por perfil (última dimensão).
+    max_abs_weight = np.where(np.asarray(max_abs_weight) <= 0, 1.0, max_abs_weight)
+
+    normalized = np.maximum(np.minimum(score_raw / max_abs_weight, 1.0), -1.0)
+    scaled = (normalized + 1.0) * 50.0
+    return np.rint(scaled).astype(np.int64)
+
+
+def _calibrate_profile_score(score_raw: float, profile: WeightProfile) -> int:
+#    Usa a tabela de calibração do perfil, se houver; senão a escala linear.
+    if profile.calibration is None:
+        return _calibrate_score(score_raw, profile.max_abs_weight)
+    return profile.calibration.calibrate(normalize_scores(score_raw, profile.max_abs_weight))
+
+
+def _calibrate_profile_scores(score_raw: np.ndarray, profiles: Sequence[WeightProfile]) -> np.ndarray:
+#    Versão vetorizada: score_raw (..., P), uma coluna por perfil.
+    linear = [p.max_abs_weight for p in profiles]
+    scores = _calibrate_scores(score_raw, np.array(linear, dtype=np.float64))
+    for j, profile in enumerate(profiles):
+        if profile.calibration is not None:
+            normalized = normalize_scores(score_raw[..., j], profile.max_abs_weight)
+            scores[..., j] = profile.calibration.calibrate_array(normalized)
+    return scores
+
+
+def _bundle_key(bundle: ProfileBundle) -> Tuple[Tuple[str, Optional[str]], ...]:
+#    Identifica os perfis (e tabelas de calibração) que produziram um resultado.
+    return tuple(
+        (p.version, p.calibration.version if p.calibration is not None else None)
+        for p in (bundle.champion,) + bundle.shadows
+    )
+
+
+def _cache_key(
+    cache: ScoreCache,
+    payload: Dict[str, Any],
+    plan: Sequence[ExtractorPlugin],
+    slots: List[Any],
+    bundle: ProfileBundle,
+) -> Optional[Tuple[Any, ...]]:
+#    Entradas brutas lidas pelos extractors do plano + valores que as hard rules
+#    leem do payload + perfis. None quando algum valor lido não é hashable.
+    rule_inputs = tuple(slots)
+    try:
+        hash(rule_inputs)
+    except TypeError:
+        return None
+    return cache.key(np.asarray(_raw_row(payload, plan), dtype=np.float64), rule_inputs, _bundle_key(bundle))
+
+
+def _copy_result(result: ScoreResult, metadata: Optional[Dict[str, Any]] = None) -> ScoreResult:
+#    Cópia rasa que isola listas/dicts mutáveis entre o cache e o chamador.
+    return replace(
+        result,
+        reason_codes=[dict(r) for r in result.reason_codes],
+        metadata={**result.metadata, **(metadata or {})},
+    )
+
+
+def _model_metadata(profile: WeightProfile) -> Dict[str, Any]:
+    metadata = {"model_version": profile.version}
+    if profile.calibration is not None:
+        metadata["calibration_version"] = profile.calibration.version
+    return metadata
+
+
+_STATUS_ACTIONS = (
+    (RiskStatus.ALTO_RISCO, RecommendedAction.BLOCK),
+    (RiskStatus.DESCONFIAVEL, RecommendedAction.STEP_UP_AUTH),
+    (RiskStatus.LEGITIMO, RecommendedAction.ALLOW),
+)
+
+
+def _map_to_status_action_indices(
+    scores: np.ndarray,
+    allow_threshold: int = ALLOW_THRESHOLD,
+    step_up_threshold: int = STEP_UP_THRESHOLD,
+) -> np.ndarray:
+#    Versão vetorizada de _map_to_status_action: índices em _STATUS_ACTIONS.
+    allow = scores >= allow_threshold
+    return np.where(allow, 2, scores >= step_up_threshold).astype(np.int8)
+
+
+def _shadow_metadata(shadows: Sequence[WeightProfile], scores: List[int]) -> Dict[str, Dict[str, Any]]:
+#    Resultado de cada perfil shadow; não influencia a ação recomendada.
+    out = {}
+    for profile, score in zip(shadows, scores):
+        status, action = _map_to_status_action(score)
+        out[profile.version] = {
+            "score": score,
+            "status": status.value,
+            "recommended_action": action.value,
+        }
+    return out
+
+
+def _hard_block_result(payload: Dict[str, Any], profile: WeightProfile, rule: HardRule) -> ScoreResult:
+#    Resultado de uma regra de BLOCK: dispensa soma ponderada e explainability.
+    return ScoreResult(
+        score=0,
+        status=RiskStatus.ALTO_RISCO,
+        recommended_action=RecommendedAction.BLOCK,
+        reason_codes=[{"code": rule.code, "contribution": -999.0}],
+        metadata={
+            **_model_metadata(profile),
+            "hard_rule_fired": True,
+            "hard_rule": rule.code,
+            "context": payload.get("context", {}),
+        },
+    )
+
+
+def required_extractors(bundle: ProfileBundle, ruleset: CompiledRuleSet) -> Tuple[ExtractorPlugin, ...]:
+#    Extractors com alguma feature de peso não nulo no bundle ou lida pelas hard rules.
+    return extraction_plan(bundle.active_features | ruleset.feature_mask)
+
+
 # --------------------------
 # MAIN ENTRYPOINT
 # --------------------------
 def calculate_score(
     payload: Dict[str, Any],
-    weights: Optional[Dict[str, float]] = None
+    weights: Union[None, Dict[str, float], WeightProfile] = None,
+    shadows: Optional[Sequence[Union[Dict[str, float], WeightProfile]]] = None,
+    rules: Optional[CompiledRuleSet] = None,
+    cache: Optional[ScoreCache] = None,
 ) -> ScoreResult:
     """
     Calcula score de risco baseado em features, regras e pesos.
+    `weights` pode ser um dict ou um WeightProfile; sem ele usa o perfil ativo
+    e os shadows configurados no profile_store. Perfis shadow são avaliados
+    na mesma passada e saem em metadata["shadow_scores"].
+    Uma hard rule de BLOCK encerra o cálculo assim que dispara.
+    Com `cache`, payloads com as mesmas entradas brutas (e perfis) reaproveitam
+    o resultado anterior, marcado com metadata["cached"]. A chave é montada
+    antes da extração, então um hit pula extração, hard rules e soma ponderada.
+    Com o tracing ligado (telemetry.tracing.enable_tracing), as durações de
+    cada estágio são registradas nas chamadas amostradas.
     """
+    trace = start_trace()
     logger.debug("Iniciando cálculo de score")
-    w = weights or DEFAULT_WEIGHTS
+    bundle = resolve_bundle(weights, shadows)
+    profile = bundle.champion
+    ruleset = rules if rules is not None else DEFAULT_RULESET
 
-    # 1) Extrair features
-    features: FeatureSet = extract_all_features(payload)
-    logger.debug(f"Features extraídas: {features}")
+    # 1) Hard rules sobre campos brutos (antes da extração)
+    slots = ruleset.read_payload(payload)
+    rule = ruleset.check_payload(slots)
+    if trace is not None:
+        trace.mark("hard_rules")
+    if rule is not None:
+        logger.info("Hard rule %s: BLOCK antes da extração de features", rule.code)
+        if trace is not None:
+            trace.finish("hard_block")
+        return _hard_block_result(payload, profile, rule)
 
-    # 2) Aplicar hard rules
-    fired_rule, hard_code = hard_rules(features)
-    logger.debug(f"Hard rule disparada: {fired_rule}, código: {hard_code}")
+    plan = required_extractors(bundle, ruleset)
+    cache_key = _cache_key(cache, payload, plan, slots, bundle) if cache is not None else None
+    if cache_key is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            if trace is not None:
+                trace.mark("cache")
+                trace.finish("cached")
+            return _copy_result(cached, {"context": payload.get("context", {}), "cached": True})
 
-    # 3) Calcular score bruto
-    score_raw, contributions = weighted_sum(features, w)
-    logger.debug(f"Score bruto: {score_raw}, Contribuições: {contributions}")
+    # 2) Extrair features (só os extractors que o perfil e as regras usam)
+    features: FeatureSet = extract_features(payload, plan)
+    logger.debug("Features extraídas: %s", features)
+    if trace is not None:
+        trace.mark("extract")
+
+    result = score_features(payload, features, bundle, ruleset, slots, trace)
+    if cache_key is not None:
+        cache.put(cache_key, _copy_result(result))
+    return result
+
+
+def score_features(
+    payload: Dict[str, Any],
+    features: FeatureSet,
+    bundle: ProfileBundle,
+    ruleset: CompiledRuleSet,
+    slots: Optional[List[Any]] = None,
+    trace: Optional[Trace] = None,
+) -> ScoreResult:
+    """
+    Etapas de calculate_score após a extração, para quem já mantém o
+    FeatureSet (ex.: score incremental por sessão). `slots` é a leitura de
+    ruleset.read_payload; sem ele o estágio pré-extração roda aqui.
+    """
+    profile = bundle.champion
+    if slots is None:
+        slots = ruleset.read_payload(payload)
+        rule = ruleset.check_payload(slots)
+        if rule is not None:
+            if trace is not None:
+                trace.mark("hard_rules")
+                trace.finish("hard_block")
+            return _hard_block_result(payload, profile, rule)
+
+    # Demais hard rules (dependem das features)
+    rule = ruleset.check_features(slots, features)
+    if trace is not None:
+        trace.mark("hard_rules")
+    if rule is not None and rule.force_block:
+        logger.info("Hard rule %s: BLOCK", rule.code)
+        if trace is not None:
+            trace.finish("hard_block")
+        return _hard_block_result(payload, profile, rule)
+    fired_rule = rule is not None
+    logger.debug("Hard rule disparada: %s", fired_rule)
+
+    # 3) Calcular score bruto (champion + shadows numa única multiplicação)
+    if bundle.shadows:
+        raw_all, contrib_all = weighted_sum_vector(features, bundle.matrix)
+        score_raw, contributions = float(raw_all[0]), contrib_all[0]
+    else:
+        score_raw, contributions = weighted_sum_vector(features, profile.vector)
+    logger.debug("Score bruto: %s, Contribuições: %s", score_raw, contributions)
+    if trace is not None:
+        trace.mark("weighted_sum")
 
     # 4) Calibrar score
-    dynamic_max = max(1.0, sum(abs(v) for v in w.values()) / 2.0)
-    score = _calibrate_score(score_raw, dynamic_max)
-    logger.debug(f"Score calibrado: {score}")
+    score = _calibrate_profile_score(score_raw, profile)
+    shadow_scores = _calibrate_profile_scores(raw_all[1:], bundle.shadows).tolist() if bundle.shadows else None
+    logger.debug("Score calibrado: %s", score)
 
     # 5) Mapear para status e ação
     status, action = _map_to_status_action(score)
+    if trace is not None:
+        trace.mark("calibrate")
 
     # 6) Gerar razões (explainability)
-    reasons = top_reason_codes(contributions, top_k=5)
+    reasons = top_reason_codes_vector(contributions.tolist(), FEATURE_NAMES, top_k=5)
     if fired_rule:
-        reasons.insert(0, {"code": hard_code, "contribution": -999.0})
+        reasons.insert(0, {"code": rule.code, "contribution": -999.0})
 
     # 7) Montar metadata
     metadata = {
-        "model_version": "v0.1.0",
+        **_model_metadata(profile),
         "hard_rule_fired": fired_rule,
         "context": payload.get("context", {}),
     }
+    if shadow_scores is not None:
+        metadata["shadow_scores"] = _shadow_metadata(bundle.shadows, shadow_scores)
 
-    logger.info(f"Score final: {score}, Status: {status}, Ação: {action}")
+    logger.info("Score final: %s, Status: %s, Ação: %s", score, status, action)
 
-    return ScoreResult(
+    result = ScoreResult(
         score=score,
         status=status,
         recommended_action=action,
         reason_codes=reasons,
         metadata=metadata,
     )
+    if trace is not None:
+        trace.mark("explain")
+        trace.finish("scored")
+    return result
+
+
+@dataclass
+class BatchScores:
+    """
+    Saída compacta (só arrays) do kernel batch, antes de virar ScoreResult.
+    fired indexa CompiledRuleSet.ordered_rules (-1 = nenhuma regra).
+    """
+    scores: np.ndarray          # (N,) int64
+    status_idx: np.ndarray      # (N,) int8, índice em _STATUS_ACTIONS
+    fired: np.ndarray           # (N,) int16
+    reason_idx: np.ndarray      # (N, k) índices de feature
+    reason_val: np.ndarray      # (N, k) contribuições
+    shadow_scores: Optional[np.ndarray] = None  # (N, K) int64
+
+
+def score_feature_matrix(
+    values: np.ndarray,
+    confidences: np.ndarray,
+    fired: np.ndarray,
+    bundle: ProfileBundle,
+    ruleset: CompiledRuleSet,
+    top_k: int = 5,
+) -> BatchScores:
+    """
+    Kernel vetorizado do modo batch: soma ponderada, calibração, status e
+    top-k razões a partir da matriz de features e das hard rules já avaliadas.
+    """
+    n = values.shape[0]
+    if bundle.shadows:
+        raw_all, contrib_all = weighted_sum_matrix(values, confidences, bundle.matrix)
+        score_raw, contributions = raw_all[:, 0], contrib_all[:, 0, :]
+        shadow_scores = _calibrate_profile_scores(raw_all[:, 1:], bundle.shadows)
+    else:
+        score_raw, contributions = weighted_sum_matrix(values, confidences, bundle.champion.vector)
+        shadow_scores = None
+
+    scores = _calibrate_profile_scores(score_raw[:, None], (bundle.champion,))[:, 0]
+    status_idx = _map_to_status_action_indices(scores)
+
+    # Razões só para as linhas que não foram bloqueadas por hard rule
+    blocked = np.zeros(n, dtype=bool)
+    hit = fired >= 0
+    blocked[hit] = ruleset.ordered_force_block[fired[hit]]
+    k = min(top_k, contributions.shape[1])
+    reason_idx = np.zeros((n, k), dtype=np.int16)
+    reason_val = np.zeros((n, k), dtype=np.float64)
+    scored_rows = np.flatnonzero(~blocked)
+    reason_idx[scored_rows], reason_val[scored_rows] = top_reason_indices(contributions[scored_rows], k)
+
+    return BatchScores(scores, status_idx, fired, reason_idx, reason_val, shadow_scores)
+
+
+def assemble_results(
+    payloads: Sequence[Dict[str, Any]],
+    batch: BatchScores,
+    bundle: ProfileBundle,
+    ruleset: CompiledRuleSet,
+) -> List[ScoreResult]:
+    """Converte a saída de score_feature_matrix em ScoreResult, na ordem dos payloads."""
+    profile = bundle.champion
+    codes = [name.upper() for name in FEATURE_NAMES]
+    shadow_rows = batch.shadow_scores.tolist() if batch.shadow_scores is not None else None
+
+    results: List[ScoreResult] = []
+    for i, (payload, score, idx, fired, r_idx, r_val) in enumerate(zip(
+        payloads, batch.scores.tolist(), batch.status_idx.tolist(), batch.fired.tolist(),
+        batch.reason_idx.tolist(), batch.reason_val.tolist(),
+    )):
+        rule = ruleset.ordered_rules[fired] if fired >= 0 else None
+        if rule is not None and rule.force_block:
+            results.append(_hard_block_result(payload, profile, rule))
+            continue
+        reasons = [{"code": codes[j], "contribution": round(val, 4)} for j, val in zip(r_idx, r_val)]
+        if rule is not None:
+            reasons.insert(0, {"code": rule.code, "contribution": -999.0})
+        status, action = _STATUS_ACTIONS[idx]
+        metadata = {
+            **_model_metadata(profile),
+            "hard_rule_fired": rule is not None,
+            "context": payload.get("context", {}),
+        }
+        if shadow_rows is not None:
+            metadata["shadow_scores"] = _shadow_metadata(bundle.shadows, shadow_rows[i])
+        results.append(ScoreResult(
+            score=score,
+            status=status,
+            recommended_action=action,
+            reason_codes=reasons,
+            metadata=metadata,
+        ))
+    return results
+
+
+def calculate_scores_batch(
+    payloads: Sequence[Dict[str, Any]],
+    weights: Union[None, Dict[str, float], WeightProfile] = None,
+    shadows: Optional[Sequence[Union[Dict[str, float], WeightProfile]]] = None,
+    rules: Optional[CompiledRuleSet] = None,
+) -> List[ScoreResult]:
+    """
+    Calcula o score de N payloads de uma vez, com operações vetorizadas.
+    O resultado de cada item é idêntico ao de calculate_score(payload, weights, shadows, rules).
+    """
+    if not payloads:
+        return []
+    bundle = resolve_bundle(weights, shadows)
+    ruleset = rules if rules is not None else DEFAULT_RULESET
+
+    # 1) Extrair features (matriz N x F)
+    values, confidences = extract_feature_matrix(payloads, required_extractors(bundle, ruleset))
+
+    # 2) Hard rules
+    fired = ruleset.fired_indices(ruleset.payload_conditions(payloads), values)
+
+    # 3..6) Score bruto, calibração, status e razões
+    batch = score_feature_matrix(values, confidences, fired, bundle, ruleset)
+    results = assemble_results(payloads, batch, bundle, ruleset)
+
+    logger.info("Batch de %s scores calculado", len(results))
+    return results
@@ -0,0 +1,241 @@
+from __future__ import annotations
+import logging
+import math
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple, Union
+
+from ..data_collection.session_behavior import EventType, UserEvent
+from .features import EXTRACTORS, extract_all_features
+from .profiles import ProfileBundle, WeightProfile, resolve_bundle
+from .rules import DEFAULT_RULESET, CompiledRuleSet, weighted_sum_vector
+from .scoring import ScoreResult, _calibrate_profile_score, score_features
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+
+# Eventos que mudam o score: cliques e scroll alimentam click_burst e
+# avg_scroll_speed; envio de formulário e page view marcam atividade e
+# estendem session_time_s. Os demais tipos não passam pelo tracker.
+TRACKED_EVENTS: Tuple[EventType, ...] = (
+    EventType.CLICK, EventType.SCROLL, EventType.FORM_SUBMIT, EventType.PAGE_VIEW,
+)
+
+
+def haversine_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """Distância em km entre dois pontos (lat, lon)."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+class _SessionState:
+    """Estado incremental de uma sessão: payload equivalente, features e score."""
+    __slots__ = (
+        "payload", "features", "score", "result", "result_bundle",
+        "first_ts", "last_ts", "last_click_ts",
+        "last_scroll_ts", "last_scroll_y", "scroll_px", "scroll_s",
+        "home", "last_location", "last_location_ts",
+    )
+
+    def __init__(self):
+        self.payload: Dict[str, Any] = {"device": {}, "behavior": {}, "geo": {}, "biometrics": {}, "context": {}}
+        self.features = extract_all_features(self.payload)
+        self.score: Optional[int] = None
+        self.result: Optional[ScoreResult] = None
+        self.result_bundle: Optional[ProfileBundle] = None
+        self.first_ts: Optional[datetime] = None
+        self.last_ts: Optional[datetime] = None
+        self.last_click_ts: Optional[datetime] = None
+        self.last_scroll_ts: Optional[datetime] = None
+        self.last_scroll_y: Optional[float] = None
+        self.scroll_px = 0.0
+        self.scroll_s = 0.0
+        self.home: Optional[Tuple[float, float]] = None
+        self.last_location: Optional[Tuple[float, float]] = None
+        self.last_location_ts: Optional[datetime] = None
+
+
+class SessionRiskTracker:
+    """
+    Score de risco por sessão, mantido atualizado conforme os eventos chegam.
+
+    Cada sessão guarda um payload equivalente ao de calculate_score e o seu
+    FeatureSet. Um evento atualiza só os campos brutos do seu grupo, reextrai
+    esse grupo e recalcula o score (custo constante por evento). get_score()
+    devolve o mesmo ScoreResult que calculate_score daria para o payload
+    acumulado, sem reextrair nada no momento da decisão.
+
+    click_burst conta os cliques da rajada atual (intervalo menor que
+    click_burst_gap_s) e volta a 0 no primeiro clique fora dela. O tracker
+    guarda no máximo `max_sessions` sessões; ao passar disso descarta a usada
+    há mais tempo.
+    """
+
+    def __init__(
+        self,
+        weights: Union[None, Dict[str, float], WeightProfile] = None,
+        rules: Optional[CompiledRuleSet] = None,
+        click_burst_gap_s: float = 0.5,
+        max_sessions: int = 100_000,
+    ):
+        # Pesos explícitos são compilados uma vez; sem eles segue o profile_store
+        self._fixed_bundle = resolve_bundle(weights) if weights else None
+        self.ruleset = rules if rules is not None else DEFAULT_RULESET
+        self.click_burst_gap_s = click_burst_gap_s
+        self.max_sessions = max_sessions
+        self.sessions: "OrderedDict[str, _SessionState]" = OrderedDict()  # LRU: mais antiga primeiro
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+    # ---------------- integração com os SDKs ----------------
+
+    def attach(self, behavior_sdk) -> None:
+        """
+        Registra o tracker nos eventos do SessionBehaviorSDK que alteram o
+        score; sessões descartadas pelo SDK (forget_session ou expiração)
+        saem também do tracker.
+        """
+        for event_type in TRACKED_EVENTS:
+            behavior_sdk.register_event_handler(event_type, self.on_event)
+        behavior_sdk.register_forget_handler(self.drop_session)
+
+    def on_event(self, event: UserEvent) -> None:
+        with self._lock:
+            state = self._state(event.session_id)
+            self._touch(state, event.timestamp)
+            behavior = state.payload["behavior"]
+            if event.event_type == EventType.CLICK:
+                if state.last_click_ts is not None:
+                    gap = (event.timestamp - state.last_click_ts).total_seconds()
+                    if gap < self.click_burst_gap_s:
+                        behavior["click_burst"] = behavior.get("click_burst", 0) + 1
+                    elif behavior.get("click_burst"):
+                        behavior["click_burst"] = 0  # rajada terminou
+                state.last_click_ts = event.timestamp
+            elif event.event_type == EventType.SCROLL and event.coordinates:
+                y = float(event.coordinates.get("y", 0))
+                if state.last_scroll_ts is not None:
+                    dt = (event.timestamp - state.last_scroll_ts).total_seconds()
+                    if dt > 0:
+                        state.scroll_px += abs(y - state.last_scroll_y)
+                        state.scroll_s += dt
+                        behavior["avg_scroll_speed"] = state.scroll_px / state.scroll_s
+                state.last_scroll_ts, state.last_scroll_y = event.timestamp, y
+            self._refresh(state, "behavior")
+
+    def track_ip(self, session_id: str, ip_sdk, ip_address: str) -> Optional[int]:
+        """Consulta o IP no IPLocationSDK e aplica a localização à sessão."""
+        location = ip_sdk.get_ip_location(ip_address)
+        if location is None:
+            return self.current_score(session_id)
+        return self.update_geo(session_id, location)
+
+    # ---------------- atualizações por grupo ----------------
+
+    def update_device(self, session_id: str, **fields: Any) -> int:
+        """Campos aceitos: seen_before, emulator, switches_24h."""
+        with self._lock:
+            state = self._state(session_id)
+            state.payload["device"].update(fields)
+            return self._refresh(state, "device")
+
+    def update_geo(self, session_id: str, location, home: Optional[Tuple[float, float]] = None) -> int:
+        """
+        Aplica uma localização (GeoLocationData ou objeto com latitude,
+        longitude, is_proxy, is_vpn e timestamp). Sem `home`, a primeira
+        localização da sessão vira o local habitual.
+        """
+        point = (float(location.latitude), float(location.longitude))
+        ts = getattr(location, "timestamp", None) or datetime.now()
+        with self._lock:
+            state = self._state(session_id)
+            if home is not None:
+                state.home = home
+            elif state.home is None:
+                state.home = point
+            geo = state.payload["geo"]
+            geo["ip_distance_home_km"] = haversine_km(state.home, point)
+            geo["proxy"] = bool(getattr(location, "is_proxy", False) or getattr(location, "is_vpn", False))
+            if state.last_location is not None:
+                hours = (ts - state.last_location_ts).total_seconds() / 3600.0
+                if hours > 0:
+                    geo["geo_velocity"] = haversine_km(state.last_location, point) / hours
+            state.last_location, state.last_location_ts = point, ts
+            return self._refresh(state, "geo")
+
+    def update_biometrics(self, session_id: str, face_match_score: Optional[float] = None,
+                          liveness_score: Optional[float] = None) -> int:
+        with self._lock:
+            state = self._state(session_id)
+            bio = state.payload["biometrics"]
+            if face_match_score is not None:
+                bio["face_match_score"] = face_match_score
+            if liveness_score is not None:
+                bio["liveness_score"] = liveness_score
+            return self._refresh(state, "biometrics")
+
+    def update_context(self, session_id: str, **context: Any) -> None:
+        with self._lock:
+            state = self._state(session_id)
+            state.payload["context"].update(context)
+            state.result = None
+
+    # ---------------- leitura ----------------
+
+    def current_score(self, session_id: str) -> Optional[int]:
+        """Score calibrado atual (sem hard rules); None para sessão desconhecida."""
+        with self._lock:
+            state = self.sessions.get(session_id)
+            return state.score if state is not None else None
+
+    def get_score(self, session_id: str) -> ScoreResult:
+        """ScoreResult completo (hard rules, razões e shadows) da sessão."""
+        with self._lock:
+            state = self._state(session_id)
+            bundle = self._bundle()
+            if state.result is None or state.result_bundle is not bundle:
+                state.result = score_features(state.payload, state.features, bundle, self.ruleset)
+                state.result_bundle = bundle
+            return state.result
+
+    def drop_session(self, session_id: str) -> None:
+        with self._lock:
+            self.sessions.pop(session_id, None)
+
+    # ---------------- interno ----------------
+
+    def _bundle(self) -> ProfileBundle:
+        return self._fixed_bundle if self._fixed_bundle is not None else resolve_bundle(None)
+
+    def _state(self, session_id: str) -> _SessionState:
+        state = self.sessions.get(session_id)
+        if state is None:
+            state = self.sessions[session_id] = _SessionState()
+            state.score = self._score(state)
+            if len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.evicted += 1
+        else:
+            self.sessions.move_to_end(session_id)
+        return state
+
+    def _touch(self, state: _SessionState, ts: datetime) -> None:
+        if state.first_ts is None or ts < state.first_ts:
+            state.first_ts = ts
+        if state.last_ts is None or ts > state.last_ts:
+            state.last_ts = ts
+        state.payload["behavior"]["session_time_s"] = (state.last_ts - state.first_ts).total_seconds()
+
+    def _refresh(self, state: _SessionState, group: str) -> int:
+        EXTRACTORS[group].extract(state.payload, state.features)
+        state.result = None
+        state.score = self._score(state)
+        return state.score
+
+    def _score(self, state: _SessionState) -> int:
+        profile = self._bundle().champion
+        score_raw, _ = weighted_sum_vector(state.features, profile.vector)
+        return _calibrate_profile_score(score_raw, profile)
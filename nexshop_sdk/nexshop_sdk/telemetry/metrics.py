@@ -0,0 +1,211 @@
+from __future__ import annotations
+import math
+from typing import Any, Dict, Sequence
+
+import numpy as np
+
+# Percentis publicados nos relatórios de endpoint
+REPORT_PERCENTILES = (50, 90, 95, 99)
+
+
+class LatencySketch:
+    """
+    Histograma logarítmico de latências (no estilo DDSketch): cada bucket
+    cobre (min_value * gamma^(i-1), min_value * gamma^i], então qualquer
+    percentil sai com erro relativo <= `relative_accuracy` em memória fixa.
+    Dois sketches com os mesmos parâmetros se combinam somando contagens.
+    count, soma, mínimo e máximo são exatos.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-3, max_value: float = 3.6e6):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy deve estar entre 0 e 1")
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        n_buckets = int(math.ceil(math.log(max_value / min_value) / self._log_gamma)) + 1
+        self.counts = np.zeros(n_buckets, dtype=np.int64)
+        self.low_count = 0  # valores <= min_value (inclui zero)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if value <= self.min_value:
+            self.low_count += 1
+        else:
+            index = int(math.ceil(math.log(value / self.min_value) / self._log_gamma))
+            self.counts[min(index, len(self.counts) - 1)] += 1
+
+    def merge(self, other: "LatencySketch") -> None:
+        if (other.relative_accuracy, other.min_value, other.max_value) != \
+                (self.relative_accuracy, self.min_value, self.max_value):
+            raise ValueError("Sketches com parâmetros diferentes não podem ser combinados")
+        self.counts += other.counts
+        self.low_count += other.low_count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def quantiles(self, qs: Sequence[float]) -> np.ndarray:
+        """Valores nos quantis `qs` (0..1); 0.0 para sketch vazio."""
+        qs = np.asarray(qs, dtype=np.float64)
+        if not self.count:
+            return np.zeros(qs.shape)
+        # Posição (0-based) do elemento de cada quantil, como em DDSketch
+        ranks = qs * (self.count - 1)
+        cumulative = self.low_count + np.cumsum(self.counts)
+        index = np.searchsorted(cumulative, ranks, side="right")
+        index = np.minimum(index, len(self.counts) - 1)
+        values = 2.0 * self.min_value * np.power(self._gamma, index) / (self._gamma + 1.0)
+        values = np.where(ranks < self.low_count, self.min, values)
+        return np.clip(values, self.min, self.max)
+
+    def quantile(self, q: float) -> float:
+        return float(self.quantiles([q])[0])
+
+    def summary(self, percentiles: Sequence[int] = REPORT_PERCENTILES) -> Dict[str, float]:
+        """{"p50": ..., "p90": ..., "max": ...} em uma passada."""
+        values = self.quantiles([p / 100.0 for p in percentiles]).tolist()
+        out = {f"p{p}": v for p, v in zip(percentiles, values)}
+        out["max"] = self.max if self.count else 0.0
+        return out
+
+    def to_snapshot(self) -> Dict[str, Any]:
+        """Forma serializável em JSON (buckets esparsos), para juntar entre processos."""
+        used = np.flatnonzero(self.counts)
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "min_value": self.min_value,
+            "max_value": self.max_value,
+            "count": self.count,
+            "total": self.total,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "low_count": self.low_count,
+            "buckets": [used.tolist(), self.counts[used].tolist()],
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Dict[str, Any]) -> "LatencySketch":
+        sketch = cls(snapshot["relative_accuracy"], snapshot["min_value"], snapshot["max_value"])
+        index, counts = snapshot["buckets"]
+        sketch.counts[np.asarray(index, dtype=np.int64)] = np.asarray(counts, dtype=np.int64)
+        sketch.low_count = snapshot["low_count"]
+        sketch.count = snapshot["count"]
+        sketch.total = snapshot["total"]
+        if sketch.count:
+            sketch.min, sketch.max = snapshot["min"], snapshot["max"]
+        return sketch
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class SlidingWindowCounter:
+    """
+    Contagem de eventos em buckets de tempo rotativos: um nível por segundo
+    (últimos `fine_buckets` s) e um por minuto (últimos `coarse_buckets` min).
+    count() soma só os buckets que cobrem a janela; o bucket da borda entra
+    proporcionalmente à parte dele que está dentro da janela. O padrão de
+    302 s de buckets finos cobre janelas de até 5 min (mais o bucket da
+    borda) com resolução de 1 s. Os buckets são esparsos (dict), então uma
+    chave com poucos eventos ocupa pouco.
+    """
+
+    def __init__(self, fine_buckets: int = 302, coarse_buckets: int = 61):
+        self.fine_buckets = fine_buckets
+        self.coarse_buckets = coarse_buckets
+        self._fine: Dict[int, int] = {}    # segundo -> contagem
+        self._coarse: Dict[int, int] = {}  # minuto -> contagem
+        self._newest = 0                   # segundo mais recente visto
+        self.total = 0
+
+    @property
+    def max_window_s(self) -> int:
+        return (self.coarse_buckets - 1) * 60
+
+    def add(self, ts: float, n: int = 1) -> None:
+        """Registra `n` eventos no instante `ts` (segundos desde a época)."""
+        second = int(ts // 1)
+        minute = second // 60
+        fine, coarse = self._fine, self._coarse
+        fine[second] = fine.get(second, 0) + n
+        coarse[minute] = coarse.get(minute, 0) + n
+        self.total += n
+        if second > self._newest:
+            self._newest = second
+        # Poda amortizada: só quando o dict passa do dobro do necessário
+        if len(fine) > 2 * self.fine_buckets:
+            self._prune(fine, self._newest - self.fine_buckets)
+        if len(coarse) > 2 * self.coarse_buckets:
+            self._prune(coarse, self._newest // 60 - self.coarse_buckets)
+
+    def is_idle(self, now: float) -> bool:
+        """True quando nenhum evento cai numa janela de até max_window_s terminando em `now`"""
+        return self._newest < now - self.max_window_s - 60
+
+    @staticmethod
+    def _prune(buckets: Dict[int, int], oldest: int) -> None:
+        for key in [k for k in buckets if k <= oldest]:
+            del buckets[key]
+
+    def count(self, window_s: float, now: float) -> float:
+        """Eventos com instante em (now - window_s, now]; janelas acima de max_window_s são limitadas."""
+        window_s = min(window_s, self.max_window_s)
+        cutoff = now - window_s
+        if window_s + 1 < self.fine_buckets:  # cabe a janela mais o bucket da borda
+            buckets, width = self._fine, 1
+        else:
+            buckets, width = self._coarse, 60
+        first = int(cutoff // width)
+        last = int(now // width)
+        # Fração do bucket da borda que fica depois do corte
+        total = buckets.get(first, 0) * (1.0 - (cutoff - first * width) / width)
+        for index in range(first + 1, last + 1):
+            total += buckets.get(index, 0)
+        return total
+
+    def merge(self, other: "SlidingWindowCounter") -> None:
+        """Soma as contagens de `other` (mesmos tamanhos de bucket)."""
+        for mine, theirs in ((self._fine, other._fine), (self._coarse, other._coarse)):
+            for key, n in theirs.items():
+                mine[key] = mine.get(key, 0) + n
+        self.total += other.total
+        self._newest = max(self._newest, other._newest)
+
+    def to_snapshot(self) -> Dict[str, Any]:
+        return {
+            "fine_buckets": self.fine_buckets,
+            "coarse_buckets": self.coarse_buckets,
+            "fine": [list(self._fine), list(self._fine.values())],
+            "coarse": [list(self._coarse), list(self._coarse.values())],
+            "newest": self._newest,
+            "total": self.total,
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Dict[str, Any]) -> "SlidingWindowCounter":
+        counter = cls(snapshot["fine_buckets"], snapshot["coarse_buckets"])
+        counter._fine = dict(zip(*snapshot["fine"]))
+        counter._coarse = dict(zip(*snapshot["coarse"]))
+        counter._newest = snapshot["newest"]
+        counter.total = snapshot["total"]
+        return counter
+
+    def __len__(self) -> int:
+        return len(self._fine) + len(self._coarse)
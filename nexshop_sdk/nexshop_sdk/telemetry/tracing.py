@@ -0,0 +1,142 @@
+from __future__ import annotations
+import logging
+import random
+import threading
+from collections import deque
+from time import perf_counter_ns
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Estágios medidos em calculate_score
+STAGES = ("hard_rules", "extract", "weighted_sum", "calibrate", "explain", "cache")
+
+Exporter = Callable[[Dict[str, Any]], None]
+
+
+class Trace:
+    """
+    Durações (ns) dos estágios de uma chamada. mark(stage) atribui ao estágio
+    o tempo desde a marca anterior; marcar o mesmo estágio de novo acumula.
+    """
+    __slots__ = ("tracer", "started_ns", "last_ns", "stages")
+
+    def __init__(self, tracer: "StageTracer"):
+        self.tracer = tracer
+        self.started_ns = self.last_ns = perf_counter_ns()
+        self.stages: Dict[str, int] = {}
+
+    def mark(self, stage: str) -> None:
+        now = perf_counter_ns()
+        self.stages[stage] = self.stages.get(stage, 0) + now - self.last_ns
+        self.last_ns = now
+
+    def finish(self, outcome: str) -> None:
+        self.tracer.record(self, outcome)
+
+
+class StageTracer:
+    """
+    Coleta amostras de Trace: guarda as últimas `max_traces` (para
+    percentis por estágio) e repassa cada registro aos exporters.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, max_traces: int = 1024):
+        self.sample_rate = sample_rate
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=max_traces)
+        self.exporters: List[Exporter] = []
+        self.sampled = 0
+        self._lock = threading.Lock()
+
+    def start(self) -> Optional[Trace]:
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return None
+        return Trace(self)
+
+    def add_exporter(self, exporter: Exporter) -> None:
+        self.exporters.append(exporter)
+
+    def record(self, trace: Trace, outcome: str) -> None:
+        record = {
+            "started_ns": trace.started_ns,
+            "total_ns": trace.last_ns - trace.started_ns,
+            "outcome": outcome,
+            "stages": trace.stages,
+        }
+        with self._lock:
+            self.recent.append(record)
+            self.sampled += 1
+        for exporter in self.exporters:
+            try:
+                exporter(record)
+            except Exception as e:
+                logger.warning("Falha no exporter de tracing %r: %s", exporter, e)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Contagem, média e p50/p90/p99/máx (µs) por estágio nas amostras recentes."""
+        with self._lock:
+            records = list(self.recent)
+        out: Dict[str, Any] = {"sampled": self.sampled, "window": len(records), "stages": {}}
+        for stage in STAGES + ("total",):
+            if stage == "total":
+                durations = [r["total_ns"] for r in records]
+            else:
+                durations = [r["stages"][stage] for r in records if stage in r["stages"]]
+            if durations:
+                out["stages"][stage] = _summarize(np.array(durations, dtype=np.float64) / 1000.0)
+        return out
+
+
+def _summarize(us: np.ndarray) -> Dict[str, float]:
+    p50, p90, p99 = np.percentile(us, [50, 90, 99]).tolist()
+    return {
+        "count": int(us.size),
+        "mean_us": round(float(us.mean()), 2),
+        "p50_us": round(p50, 2),
+        "p90_us": round(p90, 2),
+        "p99_us": round(p99, 2),
+        "max_us": round(float(us.max()), 2),
+    }
+
+
+def log_exporter(target: logging.Logger = logger, level: int = logging.INFO) -> Exporter:
+    """Exporter que escreve cada trace como uma linha de log estruturada."""
+    def export(record: Dict[str, Any]) -> None:
+        if target.isEnabledFor(level):
+            stages = " ".join(f"{k}={v / 1000.0:.1f}us" for k, v in record["stages"].items())
+            target.log(level, "trace outcome=%s total=%.1fus %s", record["outcome"], record["total_ns"] / 1000.0, stages)
+    return export
+
+
+# --------------------------
+# Tracer global
+# --------------------------
+# Desligado por padrão: start_trace() devolve None e o código instrumentado
+# só faz checagens `if trace is not None`.
+_tracer: Optional[StageTracer] = None
+
+
+def enable_tracing(sample_rate: float = 1.0, max_traces: int = 1024,
+                   exporters: Optional[List[Exporter]] = None) -> StageTracer:
+    global _tracer
+    tracer = StageTracer(sample_rate, max_traces)
+    for exporter in exporters or ():
+        tracer.add_exporter(exporter)
+    _tracer = tracer
+    return tracer
+
+
+def disable_tracing() -> None:
+    global _tracer
+    _tracer = None
+
+
+def get_tracer() -> Optional[StageTracer]:
+    return _tracer
+
+
+def start_trace() -> Optional[Trace]:
+    tracer = _tracer
+    return tracer.start() if tracer is not None else None
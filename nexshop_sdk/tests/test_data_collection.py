@@ -0,0 +1,589 @@
+import json
+import random
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from nexshop_sdk.data_collection.aggregation import (
+    SnapshotAggregator, SnapshotPublisher, get_endpoint_performance_report,
+)
+from nexshop_sdk.data_collection.expiry import ExpiryWheel
+from nexshop_sdk.data_collection.heatmap import ClickHeatmap, HeatmapGrid
+from nexshop_sdk.data_collection.rate_limiter import RateLimitAlgorithm, RateLimiter
+from nexshop_sdk.data_collection.session_behavior import (
+    AlertStore, EndpointMetrics, EndpointMonitor, EventIngestionQueue, EventType, HTTPMethod, MergedEndpointMetrics, RequestEvent,
+    SessionBehaviorSDK, SessionEventBuffer, UserBehaviorAnalyzer, UserEvent, endpoint_performance_report,
+)
+from nexshop_sdk.risk_engine.streaming import SessionRiskTracker
+from nexshop_sdk.telemetry.metrics import LatencySketch, SlidingWindowCounter
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+T0 = datetime(2024, 5, 1, 12, 0, 0)
+
+
+def _click(seconds, session_id="s", **kwargs):
+    return UserEvent(session_id=session_id, event_type=EventType.CLICK,
+                     timestamp=T0 + timedelta(seconds=seconds), **kwargs)
+
+
+def _requests(seed, n=500):
+    # Latências inteiras: a soma não depende da ordem em que os workers juntam
+    rng = random.Random(seed)
+    return [RequestEvent(session_id=f"s{rng.randrange(20)}", endpoint=f"/api/{rng.randrange(12)}",
+                         status_code=rng.choice([200, 200, 404, 500]),
+                         response_time_ms=float(rng.randrange(1, 300)), timestamp=T0 + timedelta(seconds=i))
+            for i in range(n)]
+
+
+# ---------------- buffer de eventos ----------------
+
+def test_session_buffer_keeps_out_of_order_events_sorted():
+    rng = random.Random(3)
+    offsets = [rng.uniform(0, 600) for _ in range(500)] + [10.0, 10.0, 10.0]
+    buffer = SessionEventBuffer(session_id="s")
+    events = [_click(offset, value=str(i)) for i, offset in enumerate(offsets)]
+    for event in events:
+        buffer.add(event)
+    # Mesma ordem de um sort estável por timestamp (iguais na ordem de chegada)
+    assert list(buffer) == sorted(events, key=lambda e: e.timestamp)
+    assert buffer.recent(3) == list(buffer)[-3:] and buffer.dropped == 0
+
+
+def test_session_buffer_drops_oldest_when_full():
+    buffer = SessionEventBuffer(max_events=4)
+    for offset in (10, 20, 30, 40, 50):
+        buffer.add(_click(offset))
+    buffer.add(_click(5))    # mais antigo que tudo o que cabe: descartado
+    buffer.add(_click(35))   # atrasado, mas dentro da janela: entra e expulsa o mais antigo
+    assert [(e.timestamp - T0).seconds for e in buffer] == [30, 35, 40, 50]
+    assert buffer.dropped == 3
+
+
+def test_session_buffer_round_trips_events_through_columns():
+    events = [
+        _click(0, element_id="btn", element_class="primary", element_tag="button", page_url="/checkout",
+               coordinates={"x": 10, "y": 20}, value="ok", metadata={"step": 1, "flag": True}),
+        _click(1, page_url="/checkout", coordinates={"x": 10, "y": 20}, metadata={"step": 1, "flag": True}),
+        _click(2, metadata={"step": 1.0}),
+        UserEvent(session_id="s", event_type=EventType.SCROLL, timestamp=T0 + timedelta(seconds=3),
+                  page_url=None, metadata={"depth": 0.75}),
+    ]
+    buffer = SessionEventBuffer(session_id="s")
+    for event in events:
+        assert buffer.add(event) == event.event_id
+    assert [e.to_dict() for e in buffer] == [e.to_dict() for e in events]
+    # Tipos preservados mesmo com valores "iguais" (1 == 1.0 == True)
+    assert type(list(buffer)[2].metadata["step"]) is float
+
+
+def test_session_buffer_keeps_values_that_do_not_fit_columns_in_extras():
+    tz = timezone(timedelta(hours=-3))
+    events = [
+        _click(0, coordinates={"x": 10.5, "y": 20}),
+        _click(1, coordinates={"x": 1, "y": 2, "z": 3}),
+        _click(2, coordinates={"y": 7}),
+        _click(3, metadata={"items": ["a", "b"]}),
+        UserEvent(event_id="pedido-42", session_id="s", event_type=EventType.CLICK,
+                  timestamp=T0 + timedelta(seconds=4)),
+        UserEvent(session_id="s", event_type=EventType.CLICK,
+                  timestamp=datetime(2024, 5, 1, 9, 0, 5, tzinfo=tz)),
+        _click(6, value=123),
+    ]
+    buffer = SessionEventBuffer(session_id="s")
+    for event in events:
+        buffer.add(event)
+    rebuilt = list(buffer)
+    assert [e.to_dict() for e in rebuilt] == [e.to_dict() for e in events]
+    assert rebuilt[5].timestamp.tzinfo == tz and rebuilt[5].timestamp.utcoffset() == timedelta(hours=-3)
+    assert buffer.has_extras
+
+
+def test_session_buffer_orders_aware_and_naive_timestamps_together():
+    buffer = SessionEventBuffer(session_id="s")
+    late = UserEvent(session_id="s", event_type=EventType.CLICK,
+                     timestamp=datetime(2024, 5, 1, 12, 0, 5, tzinfo=timezone.utc))
+    events = [_click(10), late, _click(0)]
+    for event in events:
+        buffer.add(event)
+    # Com fuso, o instante vale em UTC; sem fuso, o horário é tomado como está
+    assert [e.event_id for e in buffer] == [events[2].event_id, late.event_id, events[0].event_id]
+    assert list(buffer)[1].timestamp == late.timestamp
+
+
+def test_analyzer_sequence_and_idle_time_use_sorted_buffer():
+    analyzer = UserBehaviorAnalyzer(max_events_per_session=100)
+    for offset in (0, 100, 5, 40):
+        analyzer.add_event(_click(offset))
+    assert [(e.timestamp - T0).seconds for e in analyzer.get_user_sequence("s")] == [0, 5, 40, 100]
+    assert [(e.timestamp - T0).seconds for e in analyzer.get_user_sequence("s", limit=2)] == [40, 100]
+    assert analyzer.get_user_sequence("outra") == []
+    idle = analyzer.calculate_idle_time("s")
+    assert idle["total_idle_time_seconds"] == 95 and idle["longest_idle_seconds"] == 60
+
+
+def test_session_analysis_reports_duration_and_last_events():
+    sdk = SessionBehaviorSDK()
+    for offset in range(30, 0, -1):
+        sdk.behavior_analyzer.add_event(_click(offset))
+    analysis = sdk.get_session_behavior_analysis("s")
+    assert analysis["session_duration_seconds"] == 29
+    assert [e["timestamp"] for e in analysis["user_sequence"]] == [
+        (T0 + timedelta(seconds=s)).isoformat() for s in range(11, 31)
+    ]
+
+
+# ---------------- mapa de calor ----------------
+
+def _naive_top(xs, ys, cell, k):
+    counts = Counter()
+    first = {}
+    for i, (x, y) in enumerate(zip(xs, ys)):
+        key = (int(x // cell), int(y // cell))
+        counts[key] += 1
+        first.setdefault(key, i)
+    ordered = sorted(counts, key=lambda key: (-counts[key], first[key]))[:k]
+    return [(cx, cy, counts[(cx, cy)]) for cx, cy in ordered]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_heatmap_incremental_matches_naive(seed):
+    rng = random.Random(seed)
+    xs = [rng.randint(-50, 1920) for _ in range(3000)]
+    ys = [rng.randint(0, 1080) for _ in range(3000)]
+    heatmap = ClickHeatmap({"hotspots": HeatmapGrid(cell=(50, 50)),
+                            "screen": HeatmapGrid(extent=(1920, 1080), shape=(16, 9))})
+    start = 0
+    while start < len(xs):
+        end = start + rng.randint(1, 400)
+        heatmap.add(xs[start:end], ys[start:end])
+        start = end
+
+    assert len(heatmap) == len(xs) and heatmap.integral
+    assert heatmap.top("hotspots", 10) == _naive_top(xs, ys, 50, 10)
+    dense = np.zeros((9, 16), dtype=np.int64)
+    for x, y in zip(xs, ys):
+        dense[min(max(y * 9 // 1080, 0), 8), min(max(x * 16 // 1920, 0), 15)] += 1
+    assert (heatmap.dense("screen") == dense).all()
+    with pytest.raises(ValueError):
+        heatmap.dense("hotspots")
+
+
+def test_session_buffer_hotspots_survive_drops_and_reordering():
+    rng = random.Random(5)
+    buffer = SessionEventBuffer("s", max_events=500)
+    for i in range(1500):
+        delay = rng.randint(0, 3) if rng.random() < 0.1 else 0
+        buffer.append(EventType.CLICK, T0 + timedelta(seconds=i - delay),
+                      coordinates={"x": rng.randint(0, 400), "y": rng.randint(0, 300)})
+        if i % 97 == 0:
+            buffer.click_heatmap()
+
+    kept = list(buffer)
+    xs = [event.coordinates["x"] for event in kept]
+    ys = [event.coordinates["y"] for event in kept]
+    assert buffer.dropped == 1000 and buffer.reordered > 0
+    assert buffer.click_heatmap().top("hotspots", 10) == _naive_top(xs, ys, 50, 10)
+
+
+def test_click_hotspots_merge_columnar_and_extra_coordinates():
+    analyzer = UserBehaviorAnalyzer()
+    coordinates = [{"x": 10, "y": 10}, {"x": 60.5, "y": 10}, {"x": 20, "y": 30}, {"x": 70, "y": 5},
+                   {"x": 80.0, "y": 40.0}, {"x": 300, "y": 300}]
+    for i, coords in enumerate(coordinates):
+        analyzer.add_event(_click(i, coordinates=coords))
+    hotspots = analyzer.analyze_click_patterns("s")["hotspots"]
+    # 50.0 vem dos floats, na ordem do primeiro clique de cada região
+    assert hotspots == [{"region": "0,0", "clicks": 2}, {"region": "50.0,0", "clicks": 1},
+                        {"region": "50,0", "clicks": 1}, {"region": "50.0,0.0", "clicks": 1},
+                        {"region": "300,300", "clicks": 1}]
+
+
+# ---------------- latência ----------------
+
+def _latencies(n, seed):
+    rng = np.random.default_rng(seed)
+    return np.concatenate([rng.lognormal(3.0, 1.2, n), [0.0, 0.0005]])
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_latency_sketch_quantiles_within_relative_accuracy(seed):
+    values = _latencies(20_000, seed)
+    sketch = LatencySketch(relative_accuracy=0.01)
+    for v in values.tolist():
+        sketch.add(v)
+    ordered = np.sort(values)
+    qs = np.array([0.0, 0.01, 0.25, 0.5, 0.9, 0.95, 0.99, 0.999, 1.0])
+    exact = ordered[np.floor(qs * (len(values) - 1)).astype(int)]
+    approx = sketch.quantiles(qs)
+    assert np.all(np.abs(approx - exact) <= 0.01 * exact + 1e-12)
+    assert sketch.count == len(values) and sketch.mean == pytest.approx(values.mean())
+    assert (sketch.min, sketch.max) == (ordered[0], ordered[-1])
+
+
+def test_latency_sketch_merge_equals_single_sketch():
+    values = _latencies(5_000, 9)
+    whole, parts = LatencySketch(), [LatencySketch() for _ in range(3)]
+    for i, v in enumerate(values.tolist()):
+        whole.add(v)
+        parts[i % 3].add(v)
+    merged = LatencySketch()
+    for part in parts:
+        merged.merge(part)
+    assert merged.summary() == whole.summary()
+    assert np.array_equal(merged.counts, whole.counts) and merged.count == whole.count
+    with pytest.raises(ValueError):
+        merged.merge(LatencySketch(relative_accuracy=0.02))
+
+
+def test_endpoint_metrics_report_single_median_key():
+    metrics = EndpointMetrics(endpoint="/api", method=HTTPMethod.GET)
+    for v in (10.0, 20.0, 30.0, 40.0, 1000.0):
+        metrics.latency.add(v)
+    report = metrics.to_dict()
+    assert "p50_response_time_ms" not in report
+    assert report["median_response_time_ms"] == pytest.approx(30.0, rel=0.01)
+    assert report["p99_response_time_ms"] == pytest.approx(40.0, rel=0.01)
+    assert report["max_response_time_ms"] == 1000.0
+    assert EndpointMetrics(endpoint="/x", method=HTTPMethod.GET).to_dict()["median_response_time_ms"] == 0.0
+
+
+# ---------------- janela deslizante ----------------
+
+def test_sliding_window_counter_uses_one_second_buckets_up_to_five_minutes():
+    counter = SlidingWindowCounter()
+    now = 1_000_000.0
+    for age in range(0, 400):
+        counter.add(now - age - 0.5)
+    assert counter.count(60, now) == 60
+    assert counter.count(300, now) == 300  # janela padrão das análises, em buckets de 1 s
+
+
+def test_sliding_window_counter_coarse_windows():
+    counter = SlidingWindowCounter()
+    now = 600_000.0  # início de minuto
+    for minute in range(30):
+        counter.add(now - minute * 60 - 1, n=2)
+    assert counter.count(20 * 60, now) == pytest.approx(40)
+    assert counter.count(2 * 3600, now) == pytest.approx(60)  # limitada a max_window_s
+    assert not counter.is_idle(now) and counter.is_idle(now + counter.max_window_s + 60)
+
+
+def test_requests_per_minute_matches_event_count():
+    sdk = SessionBehaviorSDK()
+    for _ in range(25):
+        sdk.track_request("s", "/api", HTTPMethod.POST, 200, 5.0)
+    metrics = sdk.endpoint_monitor.calculate_requests_per_minute("s")
+    assert metrics["total_requests"] == 25
+    assert metrics["requests_per_minute"] == 5.0
+    assert sdk.endpoint_monitor.calculate_requests_per_minute()["total_requests"] == 25
+
+
+def test_session_counters_are_bounded_and_drop_idle_sessions():
+    monitor = EndpointMonitor(n_shards=1, max_session_counters=3)
+    counters = monitor._shards[0].session_counters
+
+    def request(session_id, seconds):
+        monitor.record_request(RequestEvent(session_id=session_id, endpoint="/api", status_code=200,
+                                            timestamp=T0 + timedelta(seconds=seconds)))
+
+    for i, session_id in enumerate("abcd"):
+        request(session_id, i)
+    assert list(counters) == ["b", "c", "d"]
+    request("b", 10)  # b volta a ser o mais recente; c sai na próxima
+    request("e", 11)
+    assert list(counters) == ["d", "b", "e"]
+    request("f", 2 * 3600)  # d, b e e já não aparecem em nenhuma janela
+    assert list(counters) == ["f"]
+
+
+def test_sharded_monitor_matches_single_shard():
+    sharded, single = EndpointMonitor(n_shards=16), EndpointMonitor(n_shards=1)
+    for request in _requests(7):
+        sharded.record_request(request)
+        single.record_request(request)
+    assert sharded.endpoint_count() == single.endpoint_count() == 12
+    assert sharded.get_all_endpoints_metrics() == single.get_all_endpoints_metrics()
+    assert sharded.calculate_requests_per_minute() == single.calculate_requests_per_minute()
+    for session_id in ("s0", "s7", "s19"):
+        assert (sharded.calculate_requests_per_minute(session_id)
+                == single.calculate_requests_per_minute(session_id))
+
+
+
+# ---------------- agregação entre workers ----------------
+
+def _worker_monitors():
+    requests = _requests(11)
+    workers, whole = [EndpointMonitor(), EndpointMonitor()], EndpointMonitor()
+    for i, request in enumerate(requests):
+        workers[i % 2].record_request(request)
+        whole.record_request(request)
+    return workers, whole
+
+
+def test_merged_snapshots_equal_single_monitor():
+    workers, whole = _worker_monitors()
+    snapshots = [json.loads(json.dumps(monitor.snapshot())) for monitor in workers]
+    merged = MergedEndpointMetrics.from_snapshots(snapshots)
+    assert merged.get_all_endpoints_metrics() == whole.get_all_endpoints_metrics()
+    assert merged.get_top_endpoints(5, "response_time") == whole.get_top_endpoints(5, "response_time")
+    assert merged.request_counter.total == len(whole.request_history)
+    with pytest.raises(ValueError):
+        merged.merge_snapshot({**snapshots[0], "version": 0})
+
+
+def test_aggregator_socket_round_trip(tmp_path):
+    socket_path = str(tmp_path / "agg.sock")
+    workers, whole = _worker_monitors()
+    aggregator = SnapshotAggregator(socket_path).start()
+    try:
+        for i, monitor in enumerate(workers):
+            assert SnapshotPublisher(monitor, socket_path, worker_id=f"w{i}").publish_now()
+        report = get_endpoint_performance_report(socket_path)
+    finally:
+        aggregator.stop()
+    expected = json.loads(json.dumps(endpoint_performance_report(whole)))
+    assert report["workers"] == ["w0", "w1"]
+    assert report["summary"] == expected["summary"]
+    assert report["all_endpoints"] == expected["all_endpoints"]
+    assert report["slowest_endpoints"] == expected["slowest_endpoints"]
+    # sem agregador: a falha só conta, não propaga
+    publisher = SnapshotPublisher(workers[0], socket_path)
+    assert not publisher.publish_now() and publisher.failed == 1
+
+
+# ---------------- expiração ----------------
+
+def test_expiry_wheel_expires_only_idle_keys():
+    clock = FakeClock(0.0)
+    expired = []
+    wheel = ExpiryWheel(10, expired.append, resolution_s=1, clock=clock)
+    wheel.touch("idle")
+    wheel.touch("busy")
+    wheel.touch("gone")
+    wheel.discard("gone")
+    for t in range(1, 32):
+        clock.now = float(t)
+        if t < 20:
+            wheel.touch("busy")
+        wheel.advance()
+        if t == 12:
+            assert expired == ["idle"]
+    assert expired == ["idle", "busy"]
+    assert len(wheel) == 0 and wheel.expired == 2
+
+
+def test_sdk_expiry_is_on_by_default_and_starts_on_first_use():
+    sdk = SessionBehaviorSDK()
+    try:
+        assert sdk._expiry.ttl_s == 24 * 3600 and sdk._expiry._thread is None
+        sdk.track_click("s", coordinates={"x": 1, "y": 1})
+        assert sdk._expiry._thread is not None and "s" in sdk._expiry
+    finally:
+        sdk.close()
+    assert sdk._expiry._thread is None
+    assert SessionBehaviorSDK(session_ttl_s=None)._expiry is None
+
+
+class _RacingSDK(SessionBehaviorSDK):
+    """Evento que chega entre a decisão da roda e o callback de expiração"""
+    race = True
+
+    def _expire_session(self, session_id):
+        if self.race:
+            self.race = False
+            self.track_click(session_id, coordinates={"x": 2, "y": 2})
+        super()._expire_session(session_id)
+
+
+def test_sdk_expiry_keeps_session_touched_during_eviction():
+    clock = FakeClock(0.0)
+    sdk = _RacingSDK(session_ttl_s=10, background_expiry=False, session_clock=clock)
+    sdk.track_click("s", coordinates={"x": 1, "y": 1})
+    clock.now = 20.0
+    assert sdk.expire_idle_sessions() == 1
+    assert len(sdk.behavior_analyzer.sessions["s"]) == 2
+
+    clock.now = 40.0
+    assert sdk.expire_idle_sessions() == 1
+    assert "s" not in sdk.behavior_analyzer.sessions
+    assert "s" not in sdk._active_sessions
+
+
+def test_forget_session_clears_every_structure():
+    sdk = SessionBehaviorSDK(background_expiry=False)
+    tracker = SessionRiskTracker()
+    tracker.attach(sdk)
+    sdk.track_click("s", coordinates={"x": 10, "y": 20}, page_url="/checkout")
+    sdk.track_request("s", "/api", HTTPMethod.GET, 200, 12.0)
+    sdk.track_request("t", "/api", HTTPMethod.GET, 200, 12.0)
+    assert "s" in tracker.sessions
+
+    sdk.forget_session("s")
+    assert "s" not in sdk.behavior_analyzer.sessions
+    assert "s" not in sdk._active_sessions
+    assert "s" not in tracker.sessions
+    assert "s" not in sdk._expiry
+    assert sdk.endpoint_monitor.calculate_requests_per_minute("s")["total_requests"] == 0
+    assert [r.session_id for r in sdk.endpoint_monitor.request_history] == ["t"]
+
+
+def test_request_history_index_follows_evicted_entries():
+    monitor = EndpointMonitor(history_size=3)
+    for session_id in "aabcd":
+        monitor.record_request(RequestEvent(session_id=session_id, endpoint="/api", status_code=200))
+    assert monitor._history_sessions == {"b": 1, "c": 1, "d": 1}
+    monitor.forget_session("c")
+    assert [r.session_id for r in monitor.request_history] == ["b", "d"]
+
+
+# ---------------- rate limiter ----------------
+
+@pytest.mark.parametrize("algorithm", list(RateLimitAlgorithm))
+def test_rate_limiter_blocks_over_limit(algorithm):
+    clock = FakeClock()
+    limiter = RateLimiter(algorithm, limit=5, window_seconds=10, clock=clock)
+    assert [limiter.allow("a") for _ in range(7)] == [True] * 5 + [False] * 2
+    assert limiter.allow("b")  # chaves independentes
+    decision = limiter.check("a")
+    assert not decision.allowed and decision.retry_after_s > 0
+
+
+def test_token_bucket_refills():
+    clock = FakeClock()
+    limiter = RateLimiter(RateLimitAlgorithm.TOKEN_BUCKET, limit=5, window_seconds=10, clock=clock)
+    for _ in range(5):
+        limiter.allow("a")
+    assert not limiter.allow("a")
+    clock.now += 2  # 1 ficha a cada 2 s
+    assert limiter.allow("a")
+    assert not limiter.allow("a")
+
+
+def test_sliding_window_weights_previous_window():
+    clock = FakeClock(0.0)
+    limiter = RateLimiter(RateLimitAlgorithm.SLIDING_WINDOW, limit=10, window_seconds=10, clock=clock)
+    for _ in range(10):
+        assert limiter.allow("a")
+    clock.now = 15.0  # metade da janela anterior ainda conta: 5
+    assert [limiter.allow("a") for _ in range(6)] == [True] * 5 + [False]
+
+
+def test_rate_limiter_evicts_idle_and_excess_keys():
+    clock = FakeClock()
+    limiter = RateLimiter(limit=5, window_seconds=10, idle_ttl_seconds=60, max_keys=3, clock=clock)
+    for key in "abcd":
+        limiter.allow(key)
+    assert len(limiter) == 3
+    clock.now += 61
+    limiter.allow("e")
+    assert len(limiter) == 1
+
+
+def test_sdk_allow_request_uses_monitor_limiter():
+    sdk = SessionBehaviorSDK()
+    sdk.endpoint_monitor.rate_limiter = RateLimiter(limit=2, window_seconds=60, clock=FakeClock())
+    assert [sdk.allow_request("s") for _ in range(3)] == [True, True, False]
+    assert sdk.allow_request("outra")
+
+
+# ---------------- alertas ----------------
+
+def test_alert_store_keeps_most_recent_and_filters_by_time():
+    base = datetime(2026, 1, 1)
+    store = AlertStore(max_alerts=10)
+    for i in range(37):
+        store.append({"i": i}, base + timedelta(seconds=i))
+    assert len(store) == 10
+    assert [alert["i"] for alert in store] == list(range(27, 37))
+    assert [alert["i"] for alert in store.since(base + timedelta(seconds=30))] == list(range(31, 37))
+    assert [alert["i"] for alert in store.since(base)] == list(range(27, 37))
+
+
+def test_alert_store_keeps_index_sorted_when_clock_goes_back():
+    base = datetime(2026, 1, 1)
+    store = AlertStore(max_alerts=5)
+    for i, seconds in enumerate((0, 10, 5, 20)):
+        store.append({"i": i}, base + timedelta(seconds=seconds))
+    assert [alert["i"] for alert in store.since(base + timedelta(seconds=7))] == [1, 2, 3]
+
+
+def test_click_rate_matches_click_pattern_analysis():
+    analyzer = UserBehaviorAnalyzer()
+    rng = random.Random(8)
+    for _ in range(200):
+        analyzer.add_event(_click(rng.uniform(0, 900), coordinates={"x": 1, "y": 1}))
+        analyzer.add_event(UserEvent(session_id="s", event_type=EventType.SCROLL,
+                                     timestamp=T0 + timedelta(seconds=rng.uniform(0, 900))))
+    expected = analyzer.analyze_click_patterns("s")["click_frequency_per_minute"]
+    assert round(analyzer.click_rate_per_minute("s"), 2) == expected
+    assert analyzer.click_rate_per_minute("outra") == 0.0
+
+
+# ---------------- ingestão assíncrona ----------------
+
+def test_async_ingestion_flush_applies_every_event():
+    sdk = SessionBehaviorSDK(async_ingestion=True, batch_size=16)
+    seen = []
+    sdk.register_event_handler(EventType.SCROLL, seen.append)
+    try:
+        ids = [sdk.track_click(f"s{i % 3}", coordinates={"x": i, "y": i}) for i in range(100)]
+        ids.append(sdk.track_scroll("s0", scroll_position={"x": 0, "y": 10}))
+        sdk.flush_events()
+        assert sum(len(sdk.behavior_analyzer.sessions[f"s{i}"]) for i in range(3)) == 101
+        assert {e.event_id for i in range(3) for e in sdk.behavior_analyzer.sessions[f"s{i}"]} == set(ids)
+        assert [e.event_id for e in seen] == ids[-1:]
+        queue = sdk.get_real_time_metrics()["ingestion_queue"]
+        assert queue == {"pending": 0, "processed": 101, "dropped": 0}
+    finally:
+        sdk.stop_async_ingestion()
+    sdk.track_click("s0", coordinates={"x": 1, "y": 1})  # de volta ao modo síncrono
+    assert len(sdk.behavior_analyzer.sessions["s0"]) == 36
+
+
+def test_ingestion_queue_counts_drops_under_concurrent_puts():
+    applied = []
+    queue = EventIngestionQueue(applied.extend, max_size=1000, batch_size=64)
+    accepted = []
+
+    def producer(n):
+        accepted.append(sum(queue.put((n, i)) for i in range(500)))
+
+    threads = [threading.Thread(target=producer, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Sem a thread de ingestão nada sai da fila: o limite é exato
+    assert sum(accepted) == queue.pending == 1000 and queue.dropped == 3000
+    queue.flush()
+    assert len(applied) == queue.processed == 1000 and queue.pending == 0
+
+
+def test_ingestion_queue_keeps_going_after_failed_batch():
+    batches = []
+
+    def apply(batch):
+        batches.append(list(batch))
+        if len(batches) == 1:
+            raise RuntimeError("falha no lote")
+
+    queue = EventIngestionQueue(apply, batch_size=2)
+    for i in range(5):
+        queue.put((i,))
+    queue.start()
+    queue.flush()
+    queue.close()
+    assert [r for batch in batches for r in batch] == [(i,) for i in range(5)]
+    assert queue.processed == 5
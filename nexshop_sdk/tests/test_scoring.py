@@ -0,0 +1,655 @@
+import asyncio
+import csv
+import json
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from multiprocessing.shared_memory import SharedMemory
+
+from nexshop_sdk.data_collection.session_behavior import EventType, SessionBehaviorSDK, UserEvent
+from nexshop_sdk.persistence.cache import ScoreCache
+from nexshop_sdk.risk_engine import batching, parallel, scoring
+from nexshop_sdk.risk_engine.batching import MicroBatchScorer
+from nexshop_sdk.risk_engine import backtest
+from nexshop_sdk.risk_engine.calibration import CalibrationTable, fit_calibration
+from nexshop_sdk.risk_engine.explainability import (
+    top_reason_codes, top_reason_codes_batch, top_reason_codes_vector,
+)
+from nexshop_sdk.risk_engine.features import (
+    EXTRACTORS, FEATURE_NAMES, FeatureSet, FeatureValue, extract_all_features, register_extractor, unregister_extractor,
+)
+from nexshop_sdk.risk_engine.parallel import ParallelScorer
+from nexshop_sdk.risk_engine.profiles import DEFAULT_PROFILE, ProfileStore, WeightProfile
+from nexshop_sdk.risk_engine.rules import (
+    BLOCKING_RULESET, DEFAULT_WEIGHTS, Condition, HardRule, compile_rules, hard_rules, weight_vector, weighted_sum,
+)
+from nexshop_sdk.risk_engine.streaming import TRACKED_EVENTS, SessionRiskTracker
+from nexshop_sdk.risk_engine.scoring import RecommendedAction, calculate_score, calculate_scores_batch
+from nexshop_sdk.telemetry.tracing import StageTracer, disable_tracing, enable_tracing
+
+
+def _payloads(n, seed=7):
+    rng = random.Random(seed)
+    payloads = []
+    for i in range(n):
+        payload = {"context": {"i": i}}
+        if rng.random() < 0.9:
+            payload["device"] = {"seen_before": rng.random() < 0.5, "emulator": rng.random() < 0.2,
+                                 "switches_24h": rng.randint(0, 10)}
+        if rng.random() < 0.9:
+            payload["behavior"] = {"session_time_s": rng.uniform(0, 60), "avg_scroll_speed": rng.uniform(0, 3000),
+                                   "click_burst": rng.randint(0, 6)}
+        if rng.random() < 0.9:
+            payload["geo"] = {"ip_distance_home_km": rng.uniform(0, 5000), "proxy": rng.random() < 0.3,
+                              "geo_velocity": rng.uniform(0, 1500)}
+        if rng.random() < 0.9:
+            payload["biometrics"] = {"face_match_score": rng.random(), "liveness_score": rng.random()}
+        payloads.append(payload)
+    return payloads
+
+
+def _summary(result):
+    return result.score, result.status, result.recommended_action, result.reason_codes, result.metadata
+
+
+def _without(*names):
+    weights = dict(DEFAULT_WEIGHTS)
+    for name in names:
+        weights[name] = 0.0
+    return weights
+
+
+@pytest.mark.parametrize("kwargs", [
+    {},
+    {"weights": _without("face_match", "liveness")},
+    {"weights": _without("ip_distance", "proxy_flag", "geo_velocity")},
+    {"weights": DEFAULT_WEIGHTS, "shadows": [_without("face_match", "liveness")]},
+    {"rules": BLOCKING_RULESET},
+])
+def test_batch_matches_scalar(kwargs):
+    payloads = _payloads(500)
+    scalar = [_summary(calculate_score(p, **kwargs)) for p in payloads]
+    batch = [_summary(r) for r in calculate_scores_batch(payloads, **kwargs)]
+    assert batch == scalar
+
+
+def test_batch_of_nothing():
+    assert calculate_scores_batch([]) == []
+
+
+# ---------------- FeatureSet ----------------
+
+_PAYLOAD = {
+    "device": {"seen_before": True, "emulator": True, "switches_24h": 0},
+    "behavior": {"session_time_s": 15, "avg_scroll_speed": 1000, "click_burst": 1},
+    "geo": {"ip_distance_home_km": 1000, "proxy": True, "geo_velocity": 400},
+    "biometrics": {"face_match_score": 0.75, "liveness_score": 1.0},
+}
+
+
+def test_feature_set_groups_match_dict_layout():
+    fs = extract_all_features(_PAYLOAD)
+    assert fs.device == {
+        "device_trust": FeatureValue("device_trust", 0.5, detail={"seen_before": True}),
+        "emulator_flag": FeatureValue("emulator_flag", -0.7, detail={"emulator": True}),
+        "velocity_device_switch": FeatureValue("velocity_device_switch", 0.0, detail={"switches_24h": 0}),
+    }
+    assert fs.behavior == {
+        "dwell_time": FeatureValue("dwell_time", 0.4, detail={"seconds": 15.0}),
+        "scroll_natural": FeatureValue("scroll_natural", 0.4, detail={"avg_scroll_speed": 1000.0}),
+        "click_burst": FeatureValue("click_burst", -0.2, detail={"burst": 1}),
+    }
+    assert fs.geo == {
+        "ip_distance": FeatureValue("ip_distance", -0.5, detail={"km": 1000.0}),
+        "proxy_flag": FeatureValue("proxy_flag", -0.6, detail={"proxy": True}),
+        "geo_velocity": FeatureValue("geo_velocity", -0.5, detail={"kmh": 400.0}),
+    }
+    assert fs.biometrics == {
+        "face_match": FeatureValue("face_match", 0.5, confidence=0.9, detail={"match": 0.75}),
+        "liveness": FeatureValue("liveness", 1.0, confidence=0.9, detail={"liveness": 1.0}),
+    }
+    assert fs.get("liveness") == fs.group("biometrics")["liveness"]
+    assert fs.get("inexistente") is None
+
+
+def test_weighted_sum_returns_contribution_dict():
+    fs = extract_all_features(_PAYLOAD)
+    score_raw, contributions = weighted_sum(fs, DEFAULT_WEIGHTS)
+    assert list(contributions) == list(FEATURE_NAMES)
+    for name, contribution in contributions.items():
+        f = fs.get(name)
+        assert contribution == f.value * DEFAULT_WEIGHTS[name] * max(f.confidence, 0.1)
+    assert score_raw == sum(contributions.values())
+
+
+# ---------------- perfis de pesos ----------------
+
+def test_profile_version_fingerprints_weights():
+    a = WeightProfile.compile({"device_trust": 0.3, "liveness": 0.5})
+    b = WeightProfile.compile({"liveness": 0.5, "device_trust": 0.3})
+    c = WeightProfile.compile({"device_trust": 0.3, "liveness": 0.6})
+    assert a.version == b.version and a.version.startswith("custom-")
+    assert c.version != a.version
+    assert WeightProfile.compile({"liveness": 0.5}, version="v9").version == "v9"
+    assert a.max_abs_weight == 1.0
+    assert (a.vector == weight_vector({"device_trust": 0.3, "liveness": 0.5})).all()
+
+
+def test_score_metadata_reports_profile_version():
+    profile = WeightProfile.compile(_without("liveness"), version="v0.2.0")
+    assert calculate_score(_PAYLOAD, weights=profile).metadata["model_version"] == "v0.2.0"
+    assert calculate_score(_PAYLOAD).metadata["model_version"] == DEFAULT_PROFILE.version
+
+
+def _write_profile(path, version, weights, mtime):
+    path.write_text(json.dumps({"version": version, "weights": weights}))
+    os.utime(path, (mtime, mtime))
+
+
+def test_profile_store_reloads_file_only_when_valid(tmp_path):
+    path = tmp_path / "weights.json"
+    _write_profile(path, "v1", DEFAULT_WEIGHTS, 1_000)
+    store = ProfileStore()
+    assert store.load_file(str(path)).version == "v1"
+    assert not store.reload_if_changed()
+
+    _write_profile(path, "v2", _without("liveness"), 2_000)
+    assert store.reload_if_changed()
+    assert store.active.version == "v2" and store.active.weights["liveness"] == 0.0
+
+    path.write_text("{ em escrita")  # arquivo inválido: mantém o perfil atual
+    os.utime(path, (3_000, 3_000))
+    assert not store.reload_if_changed()
+    assert store.active.version == "v2"
+
+    previous = store.swap(DEFAULT_PROFILE)
+    assert previous.version == "v2" and store.active is DEFAULT_PROFILE
+
+
+def test_profile_swap_is_atomic_for_readers():
+    profiles = [WeightProfile.compile(_without(name)) for name in ("liveness", "face_match", "proxy_flag")]
+    store = ProfileStore(profiles[0])
+    stop = threading.Event()
+    torn = []
+
+    def read():
+        while not stop.is_set():
+            profile = store.active
+            if not (profile.vector == weight_vector(profile.weights)).all():
+                torn.append(profile.version)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for t in readers:
+        t.start()
+    for i in range(2000):
+        store.swap(profiles[i % 3])
+    stop.set()
+    for t in readers:
+        t.join()
+    assert not torn
+
+
+def test_shadow_scores_match_standalone_scoring():
+    shadows = [WeightProfile.compile(_without("face_match", "liveness"), version="sem-bio"),
+               WeightProfile.compile(_without("proxy_flag"), version="sem-proxy")]
+    for payload in _payloads(50, seed=5):
+        result = calculate_score(payload, shadows=shadows)
+        assert _summary(calculate_score(payload))[:3] == _summary(result)[:3]
+        for shadow in shadows:
+            alone = calculate_score(payload, weights=shadow)
+            assert result.metadata["shadow_scores"][shadow.version] == {
+                "score": alone.score,
+                "status": alone.status.value,
+                "recommended_action": alone.recommended_action.value,
+            }
+
+
+# ---------------- hard rules ----------------
+
+class _ReadSpy(dict):
+    """Payload que registra as seções lidas."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.read = set()
+
+    def get(self, key, default=None):
+        self.read.add(key)
+        return super().get(key, default)
+
+
+def test_default_rule_only_annotates_like_hard_rules():
+    result = calculate_score(_PAYLOAD)
+    assert hard_rules(extract_all_features(_PAYLOAD)) == (True, "HARD_BLOCK_EMULATOR_PROXY")
+    assert result.reason_codes[0] == {"code": "HARD_BLOCK_EMULATOR_PROXY", "contribution": -999.0}
+    assert result.metadata["hard_rule_fired"] and result.score > 0
+    clean = dict(_PAYLOAD, geo={"proxy": False})
+    assert hard_rules(extract_all_features(clean)) == (False, "")
+
+
+def test_force_block_rule_short_circuits_before_extraction():
+    payload = _ReadSpy(_PAYLOAD)
+    result = calculate_score(payload, rules=BLOCKING_RULESET)
+    assert result.recommended_action is RecommendedAction.BLOCK and result.score == 0
+    assert result.reason_codes == [{"code": "HARD_BLOCK_EMULATOR_PROXY", "contribution": -999.0}]
+    assert result.metadata["hard_rule"] == "HARD_BLOCK_EMULATOR_PROXY"
+    assert not payload.read & {"behavior", "biometrics"}
+
+    payload = _ReadSpy(dict(_PAYLOAD, geo={"proxy": False}))
+    assert calculate_score(payload, rules=BLOCKING_RULESET).score > 0
+    assert {"behavior", "biometrics"} <= payload.read
+
+
+def test_feature_rule_blocks_after_extraction():
+    ruleset = compile_rules([HardRule("LOW_LIVENESS", (Condition("features.liveness", "lt", 0.0),))])
+    payload = dict(_PAYLOAD, biometrics={"face_match_score": 0.9, "liveness_score": 0.1})
+    result = calculate_score(payload, rules=ruleset)
+    assert result.recommended_action is RecommendedAction.BLOCK
+    assert result.reason_codes == [{"code": "LOW_LIVENESS", "contribution": -999.0}]
+    assert hard_rules(extract_all_features(payload), ruleset=ruleset) == (True, "LOW_LIVENESS")
+
+
+# ---------------- extractors (plugins) ----------------
+
+def _register(plugin):
+    register_extractor(plugin.name, plugin.inputs, plugin.outputs, plugin.read_raw, plugin.vectorized)(plugin.extract)
+
+
+@pytest.fixture
+def scalar_only_device():
+    builtin = EXTRACTORS["device"]
+
+    @register_extractor("device", inputs=builtin.inputs, outputs=builtin.outputs, read_raw=builtin.read_raw)
+    def extract(payload, features=None):
+        fs = features if features is not None else FeatureSet()
+        seen_before, emulator, switches = builtin.read_raw(payload)
+        fs.set("device_trust", 0.9 if seen_before else -0.9, seen_before)
+        fs.set("emulator_flag", -1.0 if emulator else 0.0, emulator)
+        fs.set("velocity_device_switch", -min(switches * 0.05, 1.0), switches)
+        return fs
+
+    yield
+    _register(builtin)
+
+
+def test_batch_uses_plugin_extractor(scalar_only_device):
+    payloads = _payloads(200, seed=3)
+    scalar = [_summary(calculate_score(p)) for p in payloads]
+    assert [_summary(r) for r in calculate_scores_batch(payloads)] == scalar
+    with pytest.raises(ValueError, match="device"):
+        ParallelScorer(workers=1)
+
+
+def test_unregistered_extractor_leaves_features_zeroed():
+    biometrics = unregister_extractor("biometrics")
+    try:
+        payloads = _payloads(200, seed=5)
+        scalar = [_summary(calculate_score(p)) for p in payloads]
+        assert [_summary(r) for r in calculate_scores_batch(payloads)] == scalar
+        assert extract_all_features(payloads[0]).value("liveness") == 0.0
+    finally:
+        _register(biometrics)
+    assert list(EXTRACTORS) == ["device", "behavior", "geo", "biometrics"]
+    with pytest.raises(ValueError, match="já produzida"):
+        register_extractor("outro", inputs=("geo.proxy",), outputs=("proxy_flag",), read_raw=lambda p: (0.0,))(
+            lambda payload, features=None: features)
+
+
+def test_zero_weight_extractors_are_not_read():
+    payload = _ReadSpy(dict(_PAYLOAD, geo={"proxy": False}))
+    result = calculate_score(payload, weights=_without("face_match", "liveness"))
+    assert "biometrics" not in payload.read and {"device", "behavior", "geo"} <= payload.read
+    assert result.score == calculate_scores_batch([dict(payload)], weights=_without("face_match", "liveness"))[0].score
+
+
+# ---------------- micro-batching ----------------
+
+def test_micro_batch_scorer_matches_scalar():
+    payloads = _payloads(100, seed=11)
+
+    async def run():
+        async with MicroBatchScorer(max_batch_size=32) as scorer:
+            return await asyncio.gather(*(scorer.score(p) for p in payloads)), scorer.stats
+
+    results, stats = asyncio.run(run())
+    assert [_summary(r) for r in results] == [_summary(calculate_score(p)) for p in payloads]
+    assert stats["items"] == len(payloads) and stats["batches"] >= 4
+
+
+def test_micro_batch_fallback_scores_items_off_the_loop(monkeypatch):
+    payloads = _payloads(5, seed=2)
+    payloads[2] = {"device": {"switches_24h": "muitos"}}  # derruba o lote inteiro
+    loop_threads = set()
+    calls = []
+
+    def spy(payload, *args, **kwargs):
+        calls.append(threading.get_ident())
+        return calculate_score(payload, *args, **kwargs)
+
+    monkeypatch.setattr(batching, "calculate_score", spy)
+
+    async def run():
+        loop_threads.add(threading.get_ident())
+        async with MicroBatchScorer(max_batch_size=8, max_wait_ms=50) as scorer:
+            return await asyncio.gather(*(scorer.score(p) for p in payloads), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert isinstance(results[2], ValueError)
+    assert [_summary(r) for i, r in enumerate(results) if i != 2] == \
+        [_summary(calculate_score(p)) for i, p in enumerate(payloads) if i != 2]
+    assert len(calls) == len(payloads) and not loop_threads & set(calls)
+
+
+def test_micro_batch_queue_applies_backpressure():
+    gate = threading.Event()
+
+    class GatedScorer(MicroBatchScorer):
+        def _kernel(self, payloads):
+            gate.wait(5)
+            return super()._kernel(payloads)
+
+    async def run():
+        scorer = GatedScorer(max_batch_size=1, max_wait_ms=0, max_queue_size=2)
+        await scorer.start()
+        tasks = [asyncio.create_task(scorer.score(p)) for p in _payloads(5, seed=4)]
+        await asyncio.sleep(0.05)
+        queued = scorer.stats["queued"]  # 1 no kernel, 2 na fila, 2 esperando vaga
+        gate.set()
+        results = await asyncio.gather(*tasks)
+        await scorer.stop()
+        return queued, results
+
+    queued, results = asyncio.run(run())
+    assert queued == 2 and len(results) == 5
+
+
+# ---------------- ParallelScorer ----------------
+
+@pytest.fixture
+def shm_names(monkeypatch):
+    names = []
+
+    class TrackedSharedMemory(SharedMemory):
+        def __init__(self, name=None, create=False, size=0):
+            super().__init__(name=name, create=create, size=size)
+            if create:
+                names.append(self.name)
+
+    monkeypatch.setattr(parallel, "SharedMemory", TrackedSharedMemory)
+    return names
+
+
+def _released(name):
+    try:
+        SharedMemory(name=name).close()
+    except FileNotFoundError:
+        return True
+    return False
+
+
+def test_parallel_scorer_matches_batch_and_releases_memory(shm_names):
+    payloads = _payloads(300, seed=13)
+    kwargs = {"shadows": [_without("liveness")], "rules": BLOCKING_RULESET}
+    with ParallelScorer(workers=2, chunk_size=64, **kwargs) as scorer:
+        results = list(scorer.score_iter(payloads))
+    assert [_summary(r) for r in results] == [_summary(r) for r in calculate_scores_batch(payloads, **kwargs)]
+    assert len(shm_names) == 5 and all(_released(name) for name in shm_names)
+
+
+def test_parallel_scorer_releases_memory_when_interrupted(shm_names):
+    with ParallelScorer(workers=2, chunk_size=16, max_in_flight=4) as scorer:
+        results = scorer.score_iter(_payloads(200, seed=1))
+        first = next(results)
+        results.close()
+    assert first.metadata["context"] == {"i": 0}
+    assert len(shm_names) >= 4 and all(_released(name) for name in shm_names)
+
+
+# ---------------- reason codes ----------------
+
+def _sorted_reasons(contributions, top_k):
+    # Implementação original: sort estável completo
+    items = sorted(contributions.items(), key=lambda kv: abs(kv[1]), reverse=True)
+    return [{"code": name.upper(), "contribution": round(val, 4)} for name, val in items[:top_k]]
+
+
+@pytest.mark.parametrize("top_k", [0, 1, 3, 5, 11, 20])
+def test_top_reasons_keep_sorted_tie_order(top_k):
+    rng = np.random.default_rng(top_k)
+    # Poucos valores distintos (inclusive com sinais opostos) para forçar empates
+    matrix = rng.choice([0.0, 0.1, -0.1, 0.2, -0.2, 0.35], size=(400, len(FEATURE_NAMES)))
+    expected = [_sorted_reasons(dict(zip(FEATURE_NAMES, row)), top_k) for row in matrix.tolist()]
+    assert [top_reason_codes(dict(zip(FEATURE_NAMES, row)), top_k) for row in matrix.tolist()] == expected
+    assert [top_reason_codes_vector(row, FEATURE_NAMES, top_k) for row in matrix.tolist()] == expected
+    assert top_reason_codes_batch(matrix, FEATURE_NAMES, top_k) == expected
+
+
+# ---------------- SessionRiskTracker ----------------
+
+def _click(session_id, ts):
+    return UserEvent(session_id=session_id, event_type=EventType.CLICK, timestamp=ts, coordinates={"x": 1, "y": 1})
+
+
+def test_tracker_score_matches_calculate_score_on_accumulated_payload():
+    sdk = SessionBehaviorSDK()
+    tracker = SessionRiskTracker()
+    tracker.attach(sdk)
+    assert all(sdk.event_handlers[t] == [tracker.on_event] for t in TRACKED_EVENTS)
+    assert not sdk.event_handlers[EventType.HOVER] and not sdk.event_handlers[EventType.CUSTOM]
+
+    for y in (0, 300, 900):
+        sdk.track_scroll("s", {"x": 0, "y": y})
+    sdk.track_click("s", coordinates={"x": 5, "y": 5})
+    sdk.track_form_submit("s", "checkout")
+    tracker.update_device("s", seen_before=True, switches_24h=2)
+    tracker.update_biometrics("s", face_match_score=0.8, liveness_score=0.9)
+
+    expected = calculate_score(tracker.sessions["s"].payload)
+    assert _summary(tracker.get_score("s")) == _summary(expected)
+    assert tracker.current_score("s") == expected.score
+    assert tracker.current_score("desconhecida") is None
+
+
+def test_tracker_click_burst_resets_after_gap():
+    tracker = SessionRiskTracker(click_burst_gap_s=0.5)
+    base = datetime(2026, 1, 1)
+    for offset in (0.0, 0.1, 0.2, 0.3):
+        tracker.on_event(_click("s", base + timedelta(seconds=offset)))
+    assert tracker.sessions["s"].payload["behavior"]["click_burst"] == 3
+    tracker.on_event(_click("s", base + timedelta(seconds=5)))
+    assert tracker.sessions["s"].payload["behavior"]["click_burst"] == 0
+
+
+def test_tracker_keeps_most_recent_sessions():
+    tracker = SessionRiskTracker(max_sessions=3)
+    base = datetime(2026, 1, 1)
+    for session_id in "abcd":
+        tracker.on_event(_click(session_id, base))
+    tracker.on_event(_click("b", base))  # b volta a ser recente
+    tracker.on_event(_click("e", base))
+    assert list(tracker.sessions) == ["d", "b", "e"] and tracker.evicted == 2
+
+
+# ---------------- backtest ----------------
+
+def _labeled_records(n):
+    records = []
+    for i, payload in enumerate(_payloads(n, seed=21)):
+        payload.pop("context")
+        if i % 3:
+            payload["label"] = "fraud" if i % 3 == 1 else "legit"
+        records.append(payload)
+    return records
+
+
+def _expected_confusion(records, allow=75, step_up=50):
+    matrix = {label: dict.fromkeys(backtest.ACTIONS, 0) for label in backtest.LABELS}
+    for record in records:
+        score = calculate_score(record).score
+        action = "allow" if score >= allow else "step_up_auth" if score >= step_up else "block"
+        matrix[backtest.LABELS[backtest.label_index(record.get("label"))]][action] += 1
+    return matrix
+
+
+def _write_csv(path, records):
+    columns = sorted({f"{group}.{key}" for r in records for group, section in r.items()
+                      if isinstance(section, dict) for key in section} | {"label"})
+    with open(path, "w", newline="", encoding="utf-8") as fh:
+        writer = csv.DictWriter(fh, fieldnames=columns)
+        writer.writeheader()
+        for r in records:
+            row = {"label": r.get("label", "")}
+            for group, section in r.items():
+                if isinstance(section, dict):
+                    row.update({f"{group}.{k}": json.dumps(v) for k, v in section.items()})
+            writer.writerow(row)
+
+
+@pytest.mark.parametrize("fmt", ["jsonl", "csv"])
+def test_backtest_cli_reports_confusion_matrix(tmp_path, fmt, capsys):
+    records = _labeled_records(300)
+    records.insert(100, {"device": {"switches_24h": "muitos"}, "label": "fraud"})  # linha inválida
+    source = tmp_path / f"historico.{fmt}"
+    if fmt == "jsonl":
+        source.write_text("\n".join(json.dumps(r) for r in records) + "\n\n")
+    else:
+        _write_csv(source, records)
+    output = tmp_path / "relatorio.json"
+
+    assert backtest.main([str(source), "--chunk-size", "64", "--allow-thresholds", "75,80",
+                          "--step-up-thresholds", "40,50", "--output", str(output)]) == 0
+    assert capsys.readouterr().out.startswith("Registros: 301 (inválidos: 1)")
+
+    report = json.loads(output.read_text())
+    records.pop(100)
+    summary = report["variants"][DEFAULT_PROFILE.version]["summary"]
+    assert summary["confusion_matrix"] == _expected_confusion(records)
+    assert sum(report["variants"][DEFAULT_PROFILE.version]["score_histogram"]) == len(records)
+    swept = {(row["allow_threshold"], row["step_up_threshold"]): row for row in report["threshold_sweep"]}
+    assert set(swept) == {(75, 40), (75, 50), (80, 40), (80, 50)}
+    assert swept[(80, 40)]["confusion_matrix"] == _expected_confusion(records, 80, 40)
+
+
+# ---------------- calibração ----------------
+
+def test_isotonic_fit_is_monotone():
+    rng = np.random.default_rng(0)
+    normalized = rng.uniform(-1, 1, 20_000)
+    # P(fraude) cai com o score, com ruído suficiente para gerar violações
+    labels = (rng.random(normalized.size) < (1 - normalized) / 2).astype(np.int64)
+    labels[::7] = 2  # sem rótulo: ignorado
+    table = fit_calibration(normalized, labels, "cal-teste", n_bins=50)
+    assert table.version == "cal-teste"
+    assert np.all(np.diff(table.knots) > 0) and np.all(np.diff(table.values) >= 0)
+    assert table.values[0] < 20 and table.values[-1] > 80
+
+
+def test_calibration_table_interpolates_and_clamps():
+    table = CalibrationTable.build("cal", [-0.5, 0.0, 0.5], [10.0, 40.0, 90.0])
+    points = np.array([-1.0, -0.5, -0.25, 0.0, 0.25, 0.5, 1.0])
+    expected = [10, 10, 25, 40, 65, 90, 90]
+    assert [table.calibrate(x) for x in points.tolist()] == expected
+    assert table.calibrate_array(points).tolist() == expected
+    with pytest.raises(ValueError):
+        CalibrationTable.build("cal", [0.0, 0.5], [60.0, 40.0])
+
+
+def test_batch_matches_scalar_with_calibration_table():
+    table = CalibrationTable.build("cal", [-0.6, -0.1, 0.3], [5.0, 45.0, 97.0])
+    profile = WeightProfile.compile(DEFAULT_WEIGHTS, version="v-cal", calibration=table)
+    payloads = _payloads(300, seed=17)
+    scalar = [_summary(calculate_score(p, weights=profile)) for p in payloads]
+    assert [_summary(r) for r in calculate_scores_batch(payloads, weights=profile)] == scalar
+    assert WeightProfile.from_config(profile.to_config()).calibration.to_config() == table.to_config()
+
+
+# ---------------- cache de score ----------------
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_score_cache_expires_after_ttl():
+    clock = FakeClock()
+    cache = ScoreCache(max_entries=10, ttl_s=5.0, clock=clock)
+    key = cache.key(np.array([0.1, 0.2]), "v1")
+    cache.put(key, "resultado")
+    clock.now += 4.9
+    assert cache.get(key) == "resultado"
+    clock.now += 0.2
+    assert cache.get(key) is None
+    assert cache.stats["expirations"] == 1 and len(cache) == 0
+
+
+def test_score_cache_evicts_least_recently_used():
+    cache = ScoreCache(max_entries=2, clock=FakeClock())
+    a, b, c = (cache.key(np.array([float(i)])) for i in range(3))
+    cache.put(a, "a")
+    cache.put(b, "b")
+    assert cache.get(a) == "a"  # b passa a ser o menos recente
+    cache.put(c, "c")
+    assert cache.get(b) is None and cache.get(a) == "a" and cache.get(c) == "c"
+    assert cache.stats["evictions"] == 1
+
+
+def test_cache_hit_matches_uncached_and_skips_extraction(monkeypatch):
+    cache = ScoreCache(clock=FakeClock())
+    calls = []
+    extract = scoring.extract_features
+    monkeypatch.setattr(scoring, "extract_features", lambda *a: calls.append(1) or extract(*a))
+    payloads = _payloads(50, seed=11)
+    first = [calculate_score(p, cache=cache) for p in payloads]
+    retried = [calculate_score(dict(p, context={"retry": True}), cache=cache) for p in payloads]
+    assert len(calls) == 50 and cache.stats["hits"] == 50
+    assert [_summary(r)[:4] for r in retried] == [_summary(r)[:4] for r in first]
+    for hit, miss in zip(retried, first):
+        assert hit.metadata == dict(miss.metadata, context={"retry": True}, cached=True)
+    assert "cached" not in first[0].metadata
+
+    other = calculate_score(payloads[0], weights=_without("liveness"), cache=cache)
+    assert "cached" not in other.metadata
+    assert _summary(other) == _summary(calculate_score(payloads[0], weights=_without("liveness")))
+
+
+# ---------------- tracing ----------------
+
+def test_tracer_samples_at_configured_rate():
+    random.seed(1234)
+    tracer = StageTracer(sample_rate=0.25)
+    started = sum(tracer.start() is not None for _ in range(20_000))
+    assert 4_600 < started < 5_400
+    assert all(StageTracer(sample_rate=1.0).start() is not None for _ in range(100))
+    assert all(StageTracer(sample_rate=0.0).start() is None for _ in range(100))
+
+
+def test_traced_calls_reach_exporters():
+    records = []
+
+    def broken(record):
+        raise RuntimeError("exporter fora do ar")
+
+    tracer = enable_tracing(exporters=[broken, records.append])
+    try:
+        cache = ScoreCache(clock=FakeClock())
+        calculate_score(_PAYLOAD, cache=cache)
+        calculate_score(_PAYLOAD, cache=cache)
+        calculate_score(_PAYLOAD, rules=BLOCKING_RULESET)
+    finally:
+        disable_tracing()
+    calculate_score(_PAYLOAD)
+
+    assert [r["outcome"] for r in records] == ["scored", "cached", "hard_block"]
+    assert set(records[0]["stages"]) == {"hard_rules", "extract", "weighted_sum", "calibrate", "explain"}
+    assert set(records[1]["stages"]) == {"hard_rules", "cache"}
+    assert all(r["total_ns"] >= sum(r["stages"].values()) for r in records)
+    snapshot = tracer.snapshot()
+    assert snapshot["sampled"] == 3 and snapshot["stages"]["total"]["count"] == 3